@@ -0,0 +1,94 @@
+"""
+    Project scale benchmarks
+    ========================
+    This script measures the time spent by the main operations of a project (up, provision, halt
+    and destroy) when it defines a large number of containers. LXDock talks to the fake LXD server
+    provided by ``lxdock.test.server``, whose latencies can be configured in order to mimic a real
+    LXD daemon, so that the results only depend on the way LXDock orchestrates containers.
+
+    The host's ``/etc/hosts`` file is replaced by a temporary file while the benchmark runs.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import unittest.mock
+
+from lxdock.client import get_client
+from lxdock.container import Container
+from lxdock.network import EtcHosts
+from lxdock.project import Project
+from lxdock.test.server import FakeLXDServer
+
+
+OPERATIONS = ('up', 'provision', 'halt', 'destroy', )
+
+
+def benchmark_project(server, count, parallelism, homedir):
+    """ Returns the timings (in seconds) and the number of LXD requests of each operation. """
+    client = get_client()
+    containers = [
+        Container('bench', homedir, client, name='container{:03d}'.format(index),
+                  image='ubuntu/bionic', mode='pull')
+        for index in range(count)]
+    project = Project(
+        'bench', homedir, client, containers, [{'type': 'shell', 'inline': 'true'}],
+        parallelism=parallelism)
+    results = {}
+    for operation in OPERATIONS:
+        server.requests.clear()
+        start = time.perf_counter()
+        getattr(project, operation)()
+        results[operation] = {
+            'seconds': time.perf_counter() - start, 'requests': dict(server.requests), }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark projects with many containers.')
+    parser.add_argument('-c', '--containers', type=int, nargs='+', default=[100],
+                        help='Numbers of containers of the benchmarked projects (eg. 100 250 500).')
+    parser.add_argument('-p', '--parallelism', type=int, default=8,
+                        help='Maximum number of containers brought up at the same time.')
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='Time (in seconds) spent by the fake server handling each request.')
+    parser.add_argument('--operation-latency', type=float, default=0.05,
+                        help='Time (in seconds) spent by the fake server running each operation.')
+    parser.add_argument('--ip-delay', type=float, default=0.5,
+                        help='Time (in seconds) needed by started containers to get an IP.')
+    parser.add_argument('--output', help='Write the detailed results to this JSON file.')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('lxdock').setLevel(logging.ERROR)
+    results = {}
+    with tempfile.TemporaryDirectory() as homedir:
+        etchosts_path = os.path.join(homedir, 'hosts')
+        with open(etchosts_path, 'w') as fp:
+            fp.write('127.0.0.1 localhost\n')
+        server = FakeLXDServer(
+            latency=args.latency, operation_latency=args.operation_latency,
+            ip_delay=args.ip_delay)
+        with server, \
+                unittest.mock.patch.dict(os.environ, {'LXD_DIR': server.lxd_dir}), \
+                unittest.mock.patch.object(EtcHosts.__init__, '__defaults__', (etchosts_path, )):
+            for count in args.containers:
+                result = benchmark_project(server, count, args.parallelism, homedir)
+                results[count] = result
+                print('{} containers'.format(count))
+                for operation in OPERATIONS:
+                    print('  {:<10} {:>8.2f} s  {:>6} requests'.format(
+                        operation, result[operation]['seconds'],
+                        sum(result[operation]['requests'].values())))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+    LXDock command launcher
+    =======================
+    This script runs the ``lxdock`` command with the arguments it receives. It is used by the
+    benchmarks in order to measure the startup time of the command. If the
+    LXDOCK_BENCHMARK_FAKE_CLIENT environment variable is set, the command uses a fake PyLXD client
+    simulating a LXD daemon without containers instead of connecting to LXD.
+"""
+
+import os
+import sys
+
+
+def install_fake_client():
+    from pylxd.exceptions import NotFound
+
+    import lxdock.client
+
+    class FakeResponse:
+        def json(self):
+            return {'metadata': []}
+
+    class FakeContainers:
+        def get(self, *args, **kwargs):
+            if kwargs:
+                # Listing of the containers (see `lxdock.utils.lxd.get_containers`).
+                return FakeResponse()
+            raise NotFound(None)
+
+    class FakeClient:
+        def __init__(self):
+            self.api = self
+            self.containers = FakeContainers()
+
+    lxdock.client.get_client = FakeClient
+
+
+if __name__ == '__main__':
+    if os.environ.get('LXDOCK_BENCHMARK_FAKE_CLIENT'):
+        install_fake_client()
+    from lxdock.cli.main import main
+    main(sys.argv[1:])
@@ -0,0 +1,211 @@
+"""
+    Startup benchmarks
+    ==================
+    This script measures the time spent by the ``lxdock`` command before it talks to LXD. Each
+    command is run in fresh interpreters against the project located in the ``project`` directory:
+
+    * the wall time of the command is the shortest time of several runs, which is the least
+      sensitive to the noise caused by other processes (the first run, which is performed with an
+      empty cache directory, is reported separately as the "cold" wall time) ;
+    * the import time of each module is obtained using ``python -X importtime`` (Python 3.7+).
+
+    Results are compared against the baselines stored in ``baselines/startup.json``: the script
+    exits with a non-zero status code if a command became significantly slower. Timings are
+    expressed in milliseconds and the time needed to start a bare interpreter is subtracted from
+    wall times so that baselines remain meaningful on other machines. Use ``--update-baselines`` to
+    store new baselines after an intended change.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.join(BENCHMARKS_DIR, 'project')
+BASELINES_PATH = os.path.join(BENCHMARKS_DIR, 'baselines', 'startup.json')
+LAUNCHER_PATH = os.path.join(BENCHMARKS_DIR, 'run_lxdock.py')
+
+# The benchmarked commands. The commands that need to talk to LXD use a fake PyLXD client.
+COMMANDS = (
+    ('--version', ['--version'], False),
+    ('help', ['help'], False),
+    ('config', ['config'], False),
+    ('config --containers', ['config', '--containers'], False),
+    ('status', ['status'], True),
+)
+
+# The modules whose cumulative import times are compared against the baselines.
+TRACKED_MODULES = ('lxdock.cli.main', )
+
+importtime_re = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def get_environ(cache_dir, fake_client=False):
+    """ Returns the environment variables used to run the benchmarked commands. """
+    environ = dict(os.environ)
+    environ.update({
+        'LXDOCK_NO_DAEMON': '1',
+        'PYTHONPATH': os.pathsep.join([os.path.dirname(BENCHMARKS_DIR)] + sys.path),
+        'XDG_CACHE_HOME': cache_dir,
+    })
+    environ.pop('PYTHONPROFILEIMPORTTIME', None)
+    if fake_client:
+        environ['LXDOCK_BENCHMARK_FAKE_CLIENT'] = '1'
+    return environ
+
+
+def run(args, environ, interpreter_options=()):
+    """ Runs the launcher with the considered arguments and returns (wall time, stderr). """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + list(interpreter_options) + [LAUNCHER_PATH] + list(args),
+        cwd=PROJECT_DIR, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError('lxdock {} failed:\n{}'.format(' '.join(args), result.stderr))
+    return elapsed, result.stderr
+
+
+def measure_interpreter(repeat):
+    """ Returns the time (in milliseconds) needed to start a bare interpreter. """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def parse_importtime(output):
+    """ Returns a dictionary associating module names with their import times.
+
+    Each module is associated with a dictionary containing its own import time ("self") and the
+    import time of the module and its dependencies ("cumulative"), in milliseconds.
+    """
+    modules = {}
+    for line in output.splitlines():
+        match = importtime_re.match(line)
+        if match:
+            modules[match.group(4)] = {
+                'self': int(match.group(1)) / 1000, 'cumulative': int(match.group(2)) / 1000, }
+    return modules
+
+
+def benchmark_command(args, fake_client, repeat):
+    """ Returns the timings of a single command. """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        environ = get_environ(cache_dir, fake_client)
+        cold, _ = run(args, environ)
+        wall = min(run(args, environ)[0] for _ in range(repeat))
+        result = {'cold_ms': cold, 'wall_ms': wall, 'imports': {}, }
+        if sys.version_info >= (3, 7):
+            _, stderr = run(args, environ, interpreter_options=['-X', 'importtime'])
+            result['imports'] = parse_importtime(stderr)
+    return result
+
+
+def compare(results, baselines, tolerance, slack):
+    """ Returns a list of messages describing the regressions of the results. """
+    regressions = []
+
+    def check(name, value, baseline):
+        if baseline is not None and value > baseline * tolerance + slack:
+            regressions.append('{}: {:.1f} ms (baseline: {:.1f} ms)'.format(name, value, baseline))
+
+    for command, result in results['commands'].items():
+        baseline = baselines['commands'].get(command)
+        if baseline is None:
+            continue
+        check('{} (wall time)'.format(command), result['overhead_ms'], baseline['overhead_ms'])
+        for module in TRACKED_MODULES:
+            module_timings = result['imports'].get(module)
+            if module_timings is not None:
+                check('{} ({} import time)'.format(command, module),
+                      module_timings['cumulative'], baseline['imports'].get(module))
+    return regressions
+
+
+def get_baselines(results):
+    """ Returns the data that should be stored as baselines for the considered results. """
+    return {
+        'python': '{}.{}'.format(*sys.version_info[:2]),
+        'commands': {
+            command: {
+                'overhead_ms': round(result['overhead_ms'], 1),
+                'imports': {
+                    module: round(result['imports'][module]['cumulative'], 1)
+                    for module in TRACKED_MODULES if module in result['imports']},
+            } for command, result in results['commands'].items()
+        },
+    }
+
+
+def print_report(results, top):
+    print('Python interpreter startup: {:.1f} ms'.format(results['interpreter_ms']))
+    for command, result in results['commands'].items():
+        print('\nlxdock {}'.format(command))
+        print('  wall time: {:.1f} ms (cold: {:.1f} ms, overhead: {:.1f} ms)'.format(
+            result['wall_ms'], result['cold_ms'], result['overhead_ms']))
+        imports = sorted(
+            result['imports'].items(), key=lambda item: item[1]['self'], reverse=True)
+        for module, timings in imports[:top]:
+            print('  {:>8.1f} ms  {:>8.1f} ms  {}'.format(
+                timings['self'], timings['cumulative'], module))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of LXDock commands.')
+    parser.add_argument('-n', '--repeat', type=int, default=10,
+                        help='Number of runs used to measure the wall time of commands.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Maximum ratio between a timing and its baseline.')
+    parser.add_argument('--slack', type=float, default=20,
+                        help='Additional difference (in milliseconds) allowed between a timing and '
+                             'its baseline.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of modules with the highest import times to report.')
+    parser.add_argument('--output', help='Write the detailed results to this JSON file.')
+    parser.add_argument('--update-baselines', action='store_true',
+                        help='Store the results as the new baselines.')
+    args = parser.parse_args(argv)
+
+    interpreter = measure_interpreter(args.repeat)
+    results = {'interpreter_ms': interpreter, 'commands': {}, }
+    for command, command_args, fake_client in COMMANDS:
+        result = benchmark_command(command_args, fake_client, args.repeat)
+        result['overhead_ms'] = max(result['wall_ms'] - interpreter, 0)
+        results['commands'][command] = result
+
+    print_report(results, args.top)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if args.update_baselines:
+        with open(BASELINES_PATH, 'w') as fp:
+            json.dump(get_baselines(results), fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        print('\nBaselines updated.')
+        return 0
+
+    with open(BASELINES_PATH, 'r') as fp:
+        baselines = json.load(fp)
+    regressions = compare(results, baselines, args.tolerance, args.slack)
+    if regressions:
+        print('\nRegressions:')
+        print('\n'.join('  ' + regression for regression in regressions))
+        return 1
+    print('\nNo regressions.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+    Shell completion helpers
+    ========================
+    This module provides a fast way to list the containers of a project, which is used by the shell
+    completion scripts on every TAB. It must not import the configuration machinery (schema,
+    provisioners, ...): container names are read from the LXDock file without validating it and
+    are cached until the LXDock file changes.
+"""
+
+import os
+
+from ..conf.discovery import find_config_file
+from ..utils.cache import read_cache_file, write_cache_file
+
+
+CACHE_FILENAME = 'completion.json'
+
+
+def get_container_names(base_dir='.'):
+    """ Returns the names of the containers of the project of the considered directory.
+
+    `ValueError` is raised if the names cannot be determined without fully loading the
+    configuration of the project (eg. if they contain variables).
+    """
+    path = find_config_file(base_dir)
+    stat = os.stat(path)
+    key = [stat.st_mtime_ns, stat.st_size, ]
+
+    cache = read_cache_file(CACHE_FILENAME)
+    if not isinstance(cache, dict):
+        cache = {}
+    entry = cache.get(path)
+    if isinstance(entry, dict) and entry.get('key') == key:
+        return entry['names']
+
+    names = _read_container_names(path)
+    cache[path] = {'key': key, 'names': names, }
+    write_cache_file(CACHE_FILENAME, cache)
+    return names
+
+
+def _read_container_names(path):
+    """ Reads the names of the containers defined in a LXDock file. """
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(path, 'r') as fp:
+        data = yaml.load(fp, Loader=loader)
+    if not isinstance(data, dict):
+        raise ValueError('{} is not a valid LXDock file'.format(path))
+    # A unique container named "default" is used if the 'containers' section is not defined.
+    containers = data.get('containers') or [{'name': 'default'}]
+    names = [container.get('name') if isinstance(container, dict) else None
+             for container in containers]
+    if not all(isinstance(name, str) and '$' not in name for name in names):
+        raise ValueError('Unable to read the container names of {}'.format(path))
+    return names
@@ -2,10 +2,11 @@ import argparse
 import logging
 import os
 import sys
+from contextlib import contextmanager
 
 from .. import __version__
-from ..conf.exceptions import ConfigError
-from ..constants import ProvisioningMode
+from ..conf.exceptions import ConfigError, ConfigFileNotFoundError
+from ..constants import DAEMON_ACTIONS, ProvisioningMode
 from ..exceptions import LXDockException
 from ..logging import console_stderr_handler, console_stdout_handler
 from .exceptions import CLIError
@@ -26,10 +27,38 @@ class LXDock:
         parser.add_argument(
             '--version', action='version', version='%(prog)s {v}'.format(v=__version__))
         parser.add_argument('-v', '--verbose', action='store_true')
+        parser.add_argument(
+            '--trace', metavar='FILE',
+            help='Write a trace of the operations to FILE (Chrome trace event format).')
+        parser.add_argument(
+            '--profile', metavar='FILE',
+            help='Profile the command using cProfile and write the statistics to FILE (pstats '
+                 'format).')
+        parser.add_argument(
+            '--profile-stacks', metavar='FILE',
+            help='Sample the call stacks of the command and write them to FILE (collapsed stack '
+                 'format, for flame graphs).')
         self._parsers['main'] = parser
 
         subparsers = parser.add_subparsers(dest='action')
 
+        # Creates the 'cache' action.
+        self._parsers['cache'] = subparsers.add_parser(
+            'cache', help='Manage the image cache.',
+            description='List or remove the images holding provisioned containers that were '
+                        'published to the image cache.')
+        cache_subparsers = self._parsers['cache'].add_subparsers(dest='cache_action')
+        cache_subparsers.required = True
+        cache_subparsers.add_parser('ls', help='List the cached images.')
+        cache_prune_parser = cache_subparsers.add_parser(
+            'prune', help='Remove the least recently used cached images.')
+        cache_prune_group = cache_prune_parser.add_mutually_exclusive_group()
+        cache_prune_group.add_argument(
+            '--max-size', type=int, metavar='MB',
+            help='Remove cached images until the cache is smaller than MB megabytes.')
+        cache_prune_group.add_argument(
+            '-a', '--all', action='store_true', help='Remove all the cached images.')
+
         # Creates the 'config' action.
         self._parsers['config'] = subparsers.add_parser(
             'config', help='Validate and show the LXDock file.',
@@ -72,7 +101,22 @@ class LXDock:
         self._parsers['provision'] = subparsers.add_parser(
             'provision', help='Provision containers.',
             description='Provision all the containers of a project or provision specific '
-                        'containers if container names are specified.')
+                        'containers if container names are specified. Only the provisioning '
+                        'steps that changed since they were last run are executed.')
+        self._parsers['provision'].add_argument(
+            '-a', '--all', action='store_true',
+            help='Execute all the provisioning steps, even those that did not change.')
+
+        # Creates the 'pull' action.
+        self._parsers['pull'] = subparsers.add_parser(
+            'pull', help='Download the images of containers.',
+            description='Download the images of all the containers of a project or the images of '
+                        'specific containers if container names are specified. Each distinct '
+                        'image is downloaded once, and different images are downloaded '
+                        'concurrently.')
+        self._parsers['pull'].add_argument(
+            '--auto-update', action='store_true',
+            help='Let LXD keep the downloaded images up-to-date.')
 
         # Creates the 'shell' action.
         self._parsers['shell'] = subparsers.add_parser(
@@ -106,13 +150,27 @@ class LXDock:
             '--no-provision', action='store_const', const=ProvisioningMode.DISABLED,
             dest='provisioning_mode', help='Disable provisioning.')
         up_provision_group.set_defaults(provisioning_mode=None)
+        self._parsers['up'].add_argument(
+            '-p', '--parallel', type=int, metavar='N', dest='parallelism',
+            help='Bring up at most N containers at the same time.')
 
         # Add common arguments to the action parsers that can be used with one or more specific
         # containers.
-        per_container_parsers = ['destroy', 'halt', 'provision', 'status', 'up', ]
+        per_container_parsers = ['destroy', 'halt', 'provision', 'pull', 'status', 'up', ]
         for pkey in per_container_parsers:
             self._parsers[pkey].add_argument('name', nargs='*', help='Container name.')
 
+        # Add arguments allowing to report the time spent in each phase of the actions that
+        # orchestrate containers.
+        timed_parsers = ['destroy', 'halt', 'provision', 'up', ]
+        for pkey in timed_parsers:
+            self._parsers[pkey].add_argument(
+                '--timings', action='store_true',
+                help='Display the time spent in each phase of the operations once done.')
+            self._parsers[pkey].add_argument(
+                '--timings-json', metavar='FILE',
+                help='Write the time spent in each phase of the operations to FILE (JSON).')
+
         # Parses the arguments
         args = parser.parse_args(args=argv)
 
@@ -134,7 +192,9 @@ class LXDock:
 
         try:
             # use dispatch pattern to invoke method with same name
-            getattr(self, args.action)(args)
+            with self.api_requests(args), self.trace(args), self.timings(args), \
+                    self.profile(args):
+                getattr(self, args.action)(args)
         except KeyboardInterrupt:
             logger.warning('\nAborting.')
             sys.exit(1)
@@ -143,6 +203,23 @@ class LXDock:
                 logger.error(e.msg)
                 sys.exit(1)
 
+    def cache(self, args):
+        from ..client import get_client
+        from ..images import ImageCache
+        image_cache = ImageCache(get_client())
+        if args.cache_action == 'ls':
+            for image in image_cache.list():
+                logger.info('{key}  {size:>8.1f} MB  {description}'.format(
+                    key=image['lxdock_cache_key'], size=image.get('size', 0) / 1024 ** 2,
+                    description=(image.get('properties') or {}).get('description', '')))
+        else:
+            max_size = 0 if args.all else args.max_size
+            if max_size is None:
+                max_size = self.image_cache_max_size
+            removed = image_cache.prune(
+                max_size=max_size * 1024 ** 2 if max_size is not None else None)
+            logger.info('{} cached image(s) removed.'.format(len(removed)))
+
     def config(self, args):
         # We have to display the LXDock file here, which can be useful for completion or other
         # automated operations. In order to speed up things, we'll just manually create our config
@@ -161,6 +238,7 @@ class LXDock:
         # the considered project.
         container_names = args.name or [c.name for c in self.project.containers]
         containers = [self.project.get_container_by_name(name) for name in container_names]
+        self.project.refresh_state(containers)
         # At this point we are sure that the containers we are manipulating are defined for the
         # project because we used the `get_container_by_name` method, which raises an error if a
         # container is not defined for the considered project.
@@ -217,7 +295,10 @@ class LXDock:
             fd.write(init_filecontent)
 
     def provision(self, args):
-        self.project.provision(container_names=args.name)
+        self.project.provision(container_names=args.name, force=args.all)
+
+    def pull(self, args):
+        self.project.pull(container_names=args.name, auto_update=args.auto_update)
 
     def shell(self, args):
         self.project.shell(
@@ -227,12 +308,86 @@ class LXDock:
         self.project.status(container_names=args.name)
 
     def up(self, args):
-        self.project.up(container_names=args.name, provisioning_mode=args.provisioning_mode)
+        self.project.up(
+            container_names=args.name, provisioning_mode=args.provisioning_mode,
+            parallelism=args.parallelism)
 
     ##################################
     # UTILITY METHODS AND PROPERTIES #
     ##################################
 
+    @contextmanager
+    def api_requests(self, args):
+        """ Counts the requests sent to LXD by an action and reports them in verbose mode. """
+        if not args.verbose:
+            yield
+            return
+
+        from ..utils.lxd import count_api_requests
+        with count_api_requests() as stats:
+            try:
+                yield
+            finally:
+                if stats.total:
+                    logger.debug('LXD API requests:\n{}'.format(stats.format_table()))
+
+    @contextmanager
+    def profile(self, args):
+        """ Profiles an action and writes the profiling data to files if applicable. """
+        if not args.profile and not args.profile_stacks:
+            yield
+            return
+
+        from ..profiling import record_profile
+        with record_profile(sample_stacks=bool(args.profile_stacks)) as profile:
+            try:
+                yield
+            finally:
+                profile.stop()
+                if args.profile:
+                    profile.save(args.profile)
+                if args.profile_stacks:
+                    profile.save_stacks(args.profile_stacks)
+
+    @contextmanager
+    def trace(self, args):
+        """ Records the spans of an action and writes them to a trace file if applicable. """
+        if not args.trace:
+            yield
+            return
+
+        from ..tracing import record_trace, span
+        with record_trace() as tracer:
+            try:
+                with span('lxdock {}'.format(args.action), 'command'):
+                    yield
+            finally:
+                tracer.save(args.trace)
+
+    @contextmanager
+    def timings(self, args):
+        """ Records and reports the time spent in the phases of an action if applicable. """
+        timings, timings_json = getattr(args, 'timings', False), getattr(args, 'timings_json', None)
+        if not timings and not timings_json:
+            yield
+            return
+
+        import json
+        from ..timings import record_timings
+        with record_timings() as recorder:
+            try:
+                yield
+            finally:
+                # Timings are also reported if the action failed: they could explain why.
+                recorder.stop()
+                if timings:
+                    logger.info('Timings:\n{}'.format(recorder.format_table()))
+                if timings_json:
+                    data = recorder.as_dict()
+                    data['command'] = args.action
+                    with open(timings_json, mode='w', encoding='utf-8') as fd:
+                        json.dump(data, fd, indent=2, sort_keys=True)
+
     @property
     def project(self):
         """ Initializes a LXDock project instance and returns it. """
@@ -249,9 +404,22 @@ class LXDock:
             self._project_config = Config.from_base_dir()
         return self._project_config
 
+    @property
+    def image_cache_max_size(self):
+        """ Returns the size limit (in MB) of the image cache defined by the current project.
 
-def main(argv=None):
-    # Setup logging
+        None is returned if the limit is not defined or if there is no project in the current
+        directory.
+        """
+        try:
+            config = self.project_config
+        except ConfigFileNotFoundError:
+            return
+        return config['image_cache_max_size'] if 'image_cache_max_size' in config else None
+
+
+def setup_logging():
+    """ Configures the loggers used to display the output of LXDock commands. """
     root_logger = logging.getLogger()
     root_logger.addHandler(console_stdout_handler)
     root_logger.addHandler(console_stderr_handler)
@@ -260,5 +428,31 @@ def main(argv=None):
     logging.getLogger('requests').propagate = False
     logging.getLogger('ws4py').propagate = False
 
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Lists the containers of the project without loading its whole configuration if possible.
+    # This is used by the shell completion scripts on every TAB so it must be fast.
+    if argv == ['config', '--containers', ]:
+        from .completion import get_container_names
+        try:
+            print('\n'.join(get_container_names()))
+            return
+        except Exception:
+            # The regular command will report the error (if any).
+            pass
+
+    # Forwards the command to the LXDock daemon if it is running. The daemon module is only imported
+    # for the commands it supports so that the other commands don't pay for it.
+    if next((arg for arg in argv if not arg.startswith('-')), None) in DAEMON_ACTIONS:
+        from ..daemon import forward_command
+        exit_code = forward_command(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    # Setup logging
+    setup_logging()
+
     # Run the LXDock orchestration tool!
     LXDock(argv=argv)
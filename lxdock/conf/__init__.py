@@ -1,3 +1,21 @@
 # -*- coding: utf-8 -*-
 
-from .config import Config  # noqa
+import sys
+import types
+
+
+class _ConfModule(types.ModuleType):
+    """ Imports the `Config` class (and its dependencies) only when it is accessed.
+
+    This allows lightweight modules of this package (such as `lxdock.conf.exceptions`) to be
+    imported without loading the configuration machinery (YAML, schema, provisioners, ...).
+    """
+
+    def __getattr__(self, name):
+        if name == 'Config':
+            from .config import Config
+            return Config
+        raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+
+
+sys.modules[__name__].__class__ = _ConfModule
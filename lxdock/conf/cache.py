@@ -0,0 +1,107 @@
+"""
+    Configuration cache
+    ===================
+    This module allows to store the validated configuration of a LXDock project in the cache
+    directory of the user. A cached configuration is reused as long as the inputs that were used to
+    build it did not change: the LXDock file, the .env file, the environment variables referenced
+    in the LXDock file, the home directory of the user and the files or directories whose existence
+    is checked by the validators of the provisioning steps.
+"""
+
+import hashlib
+import json
+import os
+
+from .. import __version__
+from ..utils.cache import read_cache_file, write_cache_file
+from .interpolation import ConfigTemplate
+
+
+def get_cached_config_dict(path):
+    """ Returns the cached configuration dictionary of a LXDock file or None if it is outdated. """
+    entry = read_cache_file(_get_cache_filename(path))
+    try:
+        if entry['version'] != __version__ or entry['path'] != path:
+            return
+        inputs = entry['inputs']
+        if _get_inputs(path, inputs['environ'], inputs['paths']) != inputs:
+            return
+        return entry['dict']
+    except (KeyError, TypeError):
+        return
+
+
+def set_cached_config_dict(path, config_dict, raw_dict):
+    """ Stores the validated configuration dictionary of a LXDock file in the cache.
+
+    `raw_dict` is the content of the LXDock file before variable interpolation; it is used to find
+    the environment variables the configuration depends on.
+    """
+    # Only configurations that can be stored in JSON files without being altered can be cached.
+    if json.loads(json.dumps(config_dict)) != config_dict:
+        return
+    homedir = os.path.dirname(path)
+    entry = {
+        'version': __version__,
+        'path': path,
+        'inputs': _get_inputs(
+            path, get_referenced_variables(raw_dict), _get_validated_paths(homedir, config_dict)),
+        'dict': config_dict,
+    }
+    write_cache_file(_get_cache_filename(path), entry)
+
+
+def get_referenced_variables(value):
+    """ Returns the names of the variables referenced by ${...} placeholders in a config value. """
+    if isinstance(value, str):
+        return {m.group('braced') for m in ConfigTemplate.pattern.finditer(value)
+                if m.group('braced')}
+    elif isinstance(value, dict):
+        return set().union(*map(get_referenced_variables, value.values()))
+    elif isinstance(value, (list, tuple)):
+        return set().union(*map(get_referenced_variables, value))
+    return set()
+
+
+def _get_cache_filename(path):
+    return 'config-{}.json'.format(hashlib.sha1(path.encode('utf-8')).hexdigest())
+
+
+def _get_file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _get_inputs(path, variables, paths):
+    """ Returns a JSON-compatible value describing the inputs of the configuration of a project. """
+    homedir = os.path.dirname(path)
+    return {
+        'files': [_get_file_state(path), _get_file_state(os.path.join(homedir, '.env'))],
+        'environ': {name: os.environ.get(name) for name in variables},
+        'home': os.path.expanduser('~'),
+        'paths': {p: _get_path_kind(p) for p in paths},
+    }
+
+
+def _get_path_kind(path):
+    if os.path.isdir(path):
+        return 'dir'
+    elif os.path.isfile(path):
+        return 'file'
+
+
+def _get_validated_paths(homedir, config_dict):
+    """ Returns the paths whose existence was checked when the configuration was validated. """
+    from ..provisioners import Provisioner
+    steps = list(config_dict.get('provisioning', []))
+    for container_dict in config_dict.get('containers', []):
+        steps.extend(container_dict.get('provisioning', []))
+    paths = set()
+    for options in steps:
+        provisioner_class = Provisioner.provisioners[options['type']]
+        paths.update(os.path.join(homedir, p)
+                     for p in provisioner_class.get_validated_paths(options))
+    return paths
@@ -1,16 +1,13 @@
 import logging
 import os
-from pathlib import Path
 
 import yaml
 from dotenv.main import dotenv_values
-from voluptuous.error import Invalid
 
-from . import constants
-from .exceptions import (ConfigFileInterpolationError, ConfigFileNotFoundError,
-                         ConfigFileValidationError)
+from .cache import get_cached_config_dict, set_cached_config_dict
+from .discovery import find_config_file
+from .exceptions import ConfigFileInterpolationError, ConfigFileValidationError
 from .interpolation import interpolate_variables
-from .schema import schema
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +21,7 @@ class Config:
         self.filename = filename
         self.containers = []
         self.provisioning_steps = []
+        self.parallelism = 1
         self._dict = {}
 
     def __contains__(self, key):
@@ -35,47 +33,42 @@ class Config:
     @classmethod
     def from_base_dir(cls, base_dir='.'):
         """ Returns a Config instance using a base directory. """
-        base_dir_path = Path(os.path.abspath(base_dir))
-        candidate_paths = [base_dir_path, ] + list(base_dir_path.parents)
-        existing_config_paths = []
-        for candidate_path in candidate_paths:
-            existing_config_paths = [
-                os.path.join(str(candidate_path), filename)
-                for filename in constants.ALLOWED_FILENAMES
-                if os.path.exists(os.path.join(str(candidate_path), filename))]
-            if existing_config_paths:
-                break
-
-        if not existing_config_paths:
-            raise ConfigFileNotFoundError(
-                'Unable to find a suitable configuration file in this directory. '
-                'Are you in the right directory?\n'
-                'The supported filenames are: {}'.format(', '.join(constants.ALLOWED_FILENAMES))
-            )
-
-        config_dirname, config_filename = os.path.split(existing_config_paths[0])
-        if len(existing_config_paths) > 1:
-            logger.warning('Multiple config files were found: {0}'.format(
-                ', '.join([os.path.split(p)[1] for p in existing_config_paths])))
-            logger.warning('Using: {0}'.format(config_filename))
+        config_dirname, config_filename = os.path.split(find_config_file(base_dir))
 
         # Initializes the config instance.
         config = cls(config_dirname, config_filename)
 
-        # Loads the YML.
-        config.load()
+        # The validated configuration is reused if none of its inputs changed since it was cached.
+        path = os.path.join(config.homedir, config.filename)
+        cached_dict = get_cached_config_dict(path)
+        if cached_dict is not None:
+            config._dict = cached_dict
+        else:
+            # Loads the YML.
+            config.load()
+            raw_dict = config._dict
+            config.validate()
+            set_cached_config_dict(path, config._dict, raw_dict)
 
-        # Validates the content of the configuration. We chdir into the home directory of the
-        # project in order to ensure that IsFile/IsDir validators keep working properly if the
-        # config is initialized from a subfolder of the project.
-        cwd = os.getcwd()
-        os.chdir(config.homedir)
+        config.extract_config_from_dict()
+
+        return config
+
+    def validate(self):
+        """ Interpolates and validates the content of the configuration. """
+        from voluptuous.error import Invalid
+        from .schema import get_schema
 
-        # Performs variable substitution / interpolation in the configuration values.
-        config.interpolate()
+        # We chdir into the home directory of the project in order to ensure that IsFile/IsDir
+        # validators keep working properly if the config is initialized from a subfolder of the
+        # project.
+        cwd = os.getcwd()
+        os.chdir(self.homedir)
 
         try:
-            config._dict = schema(config._dict)
+            # Performs variable substitution / interpolation in the configuration values.
+            self.interpolate()
+            self._dict = get_schema()(self._dict)
         except Invalid as e:
             # Formats the voluptuous error
             path = ' @ %s' % '.'.join(map(str, e.path)) if e.path else ''
@@ -84,10 +77,6 @@ class Config:
         finally:
             os.chdir(cwd)
 
-        config.extract_config_from_dict()
-
-        return config
-
     def interpolate(self):
         """ Interpolates the considered config.
 
@@ -145,6 +134,7 @@ class Config:
         self.containers.extend(containers)
 
         self.provisioning_steps = self._dict.get('provisioning', [])
+        self.parallelism = self._dict.get('parallelism', 1)
 
     def serialize(self):
         """ Returns the configuration as a string. """
@@ -0,0 +1,47 @@
+"""
+    LXDock files discovery
+    ======================
+    This module provides tools allowing to find the LXDock file of a project. It is kept cheap to
+    import because it is used by commands that must be fast (eg. shell completion).
+"""
+
+import logging
+import os
+from pathlib import Path
+
+from . import constants
+from .exceptions import ConfigFileNotFoundError
+
+
+logger = logging.getLogger(__name__)
+
+
+def find_config_file(base_dir='.'):
+    """ Returns the path of the LXDock file of the project of the considered directory.
+
+    The LXDock file can be located in the considered directory or in one of its parents.
+    """
+    base_dir_path = Path(os.path.abspath(base_dir))
+    candidate_paths = [base_dir_path, ] + list(base_dir_path.parents)
+    existing_config_paths = []
+    for candidate_path in candidate_paths:
+        existing_config_paths = [
+            os.path.join(str(candidate_path), filename)
+            for filename in constants.ALLOWED_FILENAMES
+            if os.path.exists(os.path.join(str(candidate_path), filename))]
+        if existing_config_paths:
+            break
+
+    if not existing_config_paths:
+        raise ConfigFileNotFoundError(
+            'Unable to find a suitable configuration file in this directory. '
+            'Are you in the right directory?\n'
+            'The supported filenames are: {}'.format(', '.join(constants.ALLOWED_FILENAMES))
+        )
+
+    if len(existing_config_paths) > 1:
+        logger.warning('Multiple config files were found: {0}'.format(
+            ', '.join([os.path.split(p)[1] for p in existing_config_paths])))
+        logger.warning('Using: {0}'.format(os.path.split(existing_config_paths[0])[1]))
+
+    return existing_config_paths[0]
@@ -1,14 +1,21 @@
-from voluptuous import ALLOW_EXTRA, All, Any, Coerce, Extra, In, Length, Required, Schema, Url
+from voluptuous import (ALLOW_EXTRA, All, Any, Coerce, Extra, In, Length, Range, Required, Schema,
+                        Url)
 
 from ..provisioners import Provisioner
-from .validators import ExpandUserIfExists, Hostname, LXDIdentifier
+from .validators import ContainerDependencies, ExpandUserIfExists, Hostname, LXDIdentifier
 
 
 def get_schema():
+    """ Returns the schema used to validate LXDock files.
+
+    The schema is built on demand because it includes the schemas of the available provisioners.
+    """
     _top_level_and_containers_common_options = {
+        'copy_identical_containers': bool,
         'environment': {Extra: Coerce(str)},
         'hostnames': [Hostname(), ],
         'image': str,
+        'image_cache': bool,
         'lxc_config': {Extra: str},
         'mode': In(['local', 'pull', ]),
         'privileged': bool,
@@ -34,23 +41,34 @@ def get_schema():
             'shell': str,
         }],
         'extras': {
-            'network_wait_timeout': int
+            'boot_wait_timeout': int,
+            'network_wait_timeout': int,
         }
     }
 
+    # Options that can be used with any provisioner.
+    _provisioner_common_options = {
+        'parallel': bool,
+        'max_parallel': All(int, Range(min=1)),
+    }
+
     def _check_provisioner_config(config):
-        provisioners = Provisioner.provisioners.values()
+        # Check if 'type' is correctly defined. Only the provisioners that are referenced by the
+        # LXDock file are imported.
+        Schema({Required('type'): str}, extra=ALLOW_EXTRA)(config)
+        detected_provisioner = Provisioner.provisioners.get(config['type'])
+        if detected_provisioner is None:
+            Schema({'type': Any(*Provisioner.provisioners)}, extra=ALLOW_EXTRA)(config)
 
-        # Check if 'type' is correctly defined
-        Schema({Required('type'): Any(*[provisioner.name for provisioner in provisioners])},
-               extra=ALLOW_EXTRA)(config)
+        # Check the options that are common to all provisioners.
+        c = config.copy()
+        common_options = Schema(_provisioner_common_options)(
+            {k: c.pop(k) for k in _provisioner_common_options if k in c})
 
         # Check if the detected provisioner's schema is fully satisfied
-        c = config.copy()
         name = c.pop('type')
-        detected_provisioner = next(provisioner for provisioner in provisioners
-                                    if provisioner.name == name)
         validated = Schema(detected_provisioner.schema)(c)
+        validated.update(common_options)
         validated['type'] = name
         return validated
 
@@ -59,17 +77,16 @@ def get_schema():
 
     _container_options = {
         Required('name'): LXDIdentifier(),
+        'depends_on': [LXDIdentifier(), ],
     }
     _container_options.update(_top_level_and_containers_common_options)
 
     _lxdock_options = {
         Required('name'): LXDIdentifier(),
         'containers': [_container_options, ],
+        'image_cache_max_size': All(int, Range(min=0)),
+        'parallelism': All(int, Range(min=1)),
     }
     _lxdock_options.update(_top_level_and_containers_common_options)
 
-    return Schema(_lxdock_options)
-
-
-# The schema will be used to validate LXDock files!
-schema = get_schema()
+    return Schema(All(_lxdock_options, ContainerDependencies))
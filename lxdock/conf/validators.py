@@ -5,6 +5,8 @@ from voluptuous import Invalid
 from voluptuous.schema_builder import message
 from voluptuous.validators import truth
 
+from ..utils.graph import find_cycle
+
 
 hostname_part_re = re.compile(r'(?!-)[A-Z\d-]{1,63}(?<!-)$', re.IGNORECASE)
 lxd_identifier_re = re.compile(
@@ -41,3 +43,26 @@ def ExpandUserIfExists(path):
         raise Invalid("expected a string path")
 
     return os.path.expanduser(path)
+
+
+def ContainerDependencies(config):
+    """ Validates the `depends_on` options of the containers of a LXDock project.
+
+    Containers can only depend on containers that are defined in the same project and the
+    dependencies must not be circular.
+    """
+    containers = config.get('containers', [])
+    names = [c['name'] for c in containers]
+    for i, container in enumerate(containers):
+        for dependency in container.get('depends_on', []):
+            if dependency not in names:
+                raise Invalid(
+                    'unknown container "{}"'.format(dependency),
+                    path=['containers', i, 'depends_on'])
+
+    cycle = find_cycle({c['name']: c.get('depends_on', []) for c in containers})
+    if cycle is not None:
+        raise Invalid(
+            'circular dependency between containers: {}'.format(' -> '.join(cycle)),
+            path=['containers'])
+    return config
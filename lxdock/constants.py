@@ -31,3 +31,11 @@ class ProvisioningMode(Enum):
 
     # In "disabled" mode containers won't be provisioned.
     DISABLED = 3
+
+
+# DAEMON
+# --
+
+# The commands that can be forwarded to the LXDock daemon (see `lxdock.daemon`). They are defined
+# here so that the other commands don't have to import the daemon module.
+DAEMON_ACTIONS = ('config', 'shell', 'status', )
@@ -3,7 +3,8 @@ import logging
 import os
 import subprocess
 import textwrap
-import time
+import threading
+import uuid
 from functools import wraps
 from pathlib import PurePosixPath
 
@@ -13,9 +14,15 @@ from . import constants
 from .exceptions import ContainerOperationFailed
 from .guests import Guest
 from .hosts import Host
-from .network import EtcHosts, get_ip
+from .images import ImageCache
+from .network import EtcHosts, get_ip, wait_for_ip
 from .provisioners import Provisioner
+from .timings import timed
+from .tracing import traced
+from .utils.cache import read_cache_file, write_cache_file
+from .utils.fingerprint import fingerprint_data
 from .utils.identifier import folderid
+from .utils.lxd import change_container_state, get_event_container_names, update_container
 
 
 logger = logging.getLogger(__name__)
@@ -41,9 +48,33 @@ class Container:
     # The default image server that will be used to pull images in "pull" mode.
     _default_image_server = 'https://images.linuxcontainers.org'
 
+    # The number of seconds a container is given to shut down gracefully before being forced to
+    # stop.
+    _stop_timeout = 30
+
     # The default path for storing the command to execute during `lxdock shell`.
     _guest_shell_script_file = '/.lxdock.d/shell_cmd.sh'
 
+    # The fingerprint of the local image to use to create the container (if it was already pulled).
+    _image_fingerprint = None
+
+    # The file of the cache directory storing the UIDs and GIDs that the guest users of shares had
+    # in the containers created so far, for each image and list of users. They allow to set the
+    # idmap of new containers when they are created instead of restarting them.
+    _guest_uidgids_cache_filename = 'guest_uidgids.json'
+    _guest_uidgids_lock = threading.Lock()
+
+    # Indicates if the host allows the UIDs and GIDs of shares to be mapped (None if unknown).
+    _host_subuidgid_set = None
+
+    # Indicates that the status of the PyLXD container is outdated because LXDock changed the state
+    # of the container: the container is fetched again only if its status is needed.
+    _state_outdated = False
+
+    # The config changes that are not applied yet (see `defer_config_updates`), or None if the
+    # changes are applied right away.
+    _deferred_config = None
+
     def __init__(self, project_name, homedir, client, **options):
         self.project_name = project_name
         self.homedir = homedir
@@ -54,10 +85,52 @@ class Container:
     # CONTAINER ACTIONS #
     #####################
 
+    @traced('container', 'name')
+    def create_as_copy(self, container):
+        """ Creates the container as a copy of another container having the same definition.
+
+        The copy is performed using a temporary snapshot of the source container, which can keep
+        running. On storage pools supporting copy-on-write (eg. ZFS or btrfs) this is almost
+        instantaneous. The local provisioning state of the source container is kept so that the
+        provisioning steps that were already executed are not executed again on the copy.
+        """
+        logger.info('Creating new container "{name}" as a copy of "{source}"'.format(
+            name=self.lxd_name, source=container.name))
+        snapshot_name = 'lxdock-copy-{}'.format(uuid.uuid4().hex[:8])
+        snapshot = container._container.snapshots.create(snapshot_name, wait=True)
+        try:
+            container_config = self._get_creation_config()
+            # The fingerprints of the local provisioning steps of the source container may not be
+            # stored yet (see `defer_config_updates`).
+            container_config['config'].update(
+                {k: v for k, v in (container._deferred_config or {}).items()
+                 if k.startswith('user.lxdock.provisioning.local.')})
+            container_config['source'] = {
+                'type': 'copy', 'source': '{}/{}'.format(container.lxd_name, snapshot_name), }
+            lxd_container = self._create_container(container_config)
+        finally:
+            snapshot.delete(wait=True)
+
+        # The environment, the shares and the global provisioning state of the source container
+        # are specific to it.
+        update_container(
+            lxd_container,
+            config={k: None for k in lxd_container.config
+                    if (k.startswith(('environment.', 'user.lxdock.provisioning.global.'))
+                        or k == 'user.lxdock.provisioned')
+                    and k not in container_config['config']},
+            devices={k: None for k in lxd_container.devices
+                     if k.startswith('lxdockshare') and k not in container_config['devices']})
+
+        # The copy must not use the machine ID of the source container.
+        self._reset_machine_id(lxd_container)
+
+        self.set_lxd_container(lxd_container)
+
+    @traced('container', 'name')
     def destroy(self):
         """ Destroys the container. """
-        container = self._get_container(create=False)
-        if container is None:
+        if not self.exists:
             logger.info("Container doesn't exist, nothing to destroy.")
             return
 
@@ -65,9 +138,12 @@ class Container:
         self.halt()
         # ... and destroy it!
         logger.info('Destroying container "{name}"...'.format(name=self.name))
-        container.delete(wait=True)
+        with timed('delete', self.name):
+            self._container.delete(wait=True)
+        self.set_lxd_container(None)
         logger.info('Container "{name}" destroyed!'.format(name=self.name))
 
+    @traced('container', 'name')
     def halt(self):
         """ Stops the container. """
         if not self.exists:
@@ -82,38 +158,80 @@ class Container:
         self._unsetup_hostnames()
 
         logger.info('Stopping...')
-        try:
-            self._container.stop(timeout=30, force=False, wait=True)
-        except LXDAPIException:
-            logger.warning("Can't stop the container. Forcing...")
-            self._container.stop(force=True, wait=True)
-
+        with timed('stop', self.name):
+            try:
+                self._change_state('stop', timeout=self._stop_timeout, force=False)
+            except LXDAPIException:
+                logger.warning(
+                    "Can't stop the container within {} seconds. Forcing...".format(
+                        self._stop_timeout))
+                self._change_state('stop', force=True)
+
+    @traced('container', 'name')
     @must_be_created_and_running
     def provision(self, force=True):
-        """ Provisions the container. """
+        """ Provisions the container.
+
+        If `force` is False, only the provisioning steps whose fingerprint changed since they were
+        last run on the container are executed.
+        """
         # We run this in case our lxdock.yml config was modified since our last `lxdock up`.
-        self._setup_env()
+        with timed('setup_env', self.name):
+            self._setup_env()
 
         try:
             provisioning_steps = self.options['provisioning']
         except KeyError:
             return
 
-        if not force and self.is_provisioned:
-            return
-
-        for provisioning_item in provisioning_steps:
-            provisioning_type = provisioning_item['type'].lower()
-            provisioner_class = Provisioner.provisioners.get(provisioning_type)
-            if provisioner_class is not None:
+        # The fingerprints of the executed steps are saved using a single request, even if a step
+        # fails.
+        fingerprints = {}
+        skipped_steps = 0
+        try:
+            for i, provisioning_item in enumerate(provisioning_steps):
+                provisioning_type = provisioning_item['type'].lower()
+                provisioner_class = Provisioner.provisioners.get(provisioning_type)
+                if provisioner_class is None:
+                    continue
                 provisioner = provisioner_class(
                     self.homedir, self._host, [self._guest], provisioning_item)
+                fingerprint = provisioner.get_fingerprint()
+                if not force and self.get_provisioning_fingerprint('local', i) == fingerprint:
+                    logger.info('Provisioning with {0} is unchanged, skipping'.format(
+                        provisioner.name))
+                    skipped_steps += 1
+                    continue
                 logger.info('Provisioning with {0}'.format(provisioner.name))
-                provisioner.provision()
+                with timed('provision.local[{}]: {}'.format(i, provisioner.name), self.name):
+                    provisioner.provision()
+                fingerprints[self._get_provisioning_fingerprint_key('local', i)] = fingerprint
+        finally:
+            self.update_config(config=fingerprints, deferred=True)
+
+        # The container can be published to the image cache only if all its provisioning steps
+        # were executed.
+        if self.options.get('image_cache') and not skipped_steps:
+            with timed('publish', self.name):
+                self._publish_to_image_cache()
 
     @must_be_created_and_running
     def shell(self, username=None, command=None):
         """ Opens a new interactive shell in the container. """
+        subprocess.call(self.get_shell_command(username=username, command=command), shell=True)
+
+    def get_shell_command(self, username=None, command=None):
+        """ Returns the command that opens a new interactive shell in the container.
+
+        If `command` is specified, the returned command executes it (instead of opening an
+        interactive shell) and exits. `ContainerOperationFailed` is raised if the container is not
+        created or not running.
+        """
+        if not self.exists:
+            raise ContainerOperationFailed('The container is not created.')
+        elif not self.is_running:
+            raise ContainerOperationFailed('The container is not running.')
+
         # We run this in case our lxdock.yml config was modified since our last `lxdock up`.
         self._setup_env()
 
@@ -146,37 +264,47 @@ class Container:
             self._guest.run(['chmod', 'a+rx', self._guest_shell_script_file])
             cmd += ' -s {}'.format(self._guest_shell_script_file)
 
-        subprocess.call(cmd, shell=True)
+        return cmd
 
+    @traced('container', 'name')
     def up(self):
         """ Creates, starts and provisions the container. """
         if self.is_running:
             logger.info('Container "{name}" is already running'.format(name=self.name))
             return
 
+        # The container is created (if applicable) before being started.
+        self._container
         logger.info('Starting container "{name}"...'.format(name=self.name))
-        self._container.start(wait=True)
+        with timed('start', self.name):
+            self._change_state('start')
         if not self.is_running:
             logger.error('Something went wrong trying to start the container.')
             raise ContainerOperationFailed()
 
-        ip = self._setup_ip()
+        with timed('wait_for_ip', self.name):
+            ip = self._setup_ip()
         if not ip:
             return
 
         logger.info('Container "{name}" is up! IP: {ip}'.format(name=self.name, ip=ip))
 
         # Setup hostnames if applicable.
-        self._setup_hostnames(ip)
+        with timed('setup_hostnames', self.name):
+            self._setup_hostnames(ip)
+
+        # The guest must have finished booting before users are created and provisioning starts.
+        with timed('wait_until_ready', self.name):
+            self._wait_until_ready()
 
         # Setup users if applicable.
-        self._setup_users()
+        with timed('setup_users', self.name):
+            self._setup_users()
 
-        # Setup shares if applicable.
-        self._setup_shares()
-
-        # Override environment variables
-        self._setup_env()
+        # Setup shares and override environment variables if applicable. Both are applied to the
+        # container using a single request.
+        with timed('setup_shares', self.name):
+            self._setup_shares(config=self._get_env_config())
 
     ##################################
     # UTILITY METHODS AND PROPERTIES #
@@ -185,12 +313,91 @@ class Container:
     @property
     def exists(self):
         """ Returns True if the considered container has already been created. """
-        try:
-            self.client.containers.get(self.lxd_name)
-        except NotFound:
+        if not hasattr(self, '_pylxd_container'):
+            # The state of the container is fetched once and then reused by the other properties
+            # and methods, unless it is already known (eg. because it was fetched as part of a
+            # project-wide snapshot).
+            self.set_lxd_container(self._get_container(create=False))
+        return self._pylxd_container is not None
+
+    def get_definition_fingerprint(self):
+        """ Returns a fingerprint of the options defining the filesystem of the container.
+
+        Containers having the same definition fingerprint are identical once they are created and
+        locally provisioned; they only differ by their hostnames, environment and shares.
+        """
+        return fingerprint_data(dict(self._get_definition(), source=self.image_source))
+
+    def get_provisioning_fingerprint(self, scope, index):
+        """ Returns the fingerprint of a provisioning step that was last run on the container.
+
+        :param scope: "local" for the steps defined for the container, "global" for the steps
+            defined at the root of the LXDock file
+        :param index: the position of the step in the considered list of provisioning steps
+        """
+        return self._get_config_value(self._get_provisioning_fingerprint_key(scope, index))
+
+    def set_provisioning_fingerprint(self, scope, index, fingerprint):
+        """ Stores the fingerprint of a provisioning step that was run on the container. """
+        self.update_config(
+            config={self._get_provisioning_fingerprint_key(scope, index): fingerprint},
+            deferred=True)
+
+    def defer_config_updates(self):
+        """ Defers the config changes made using `update_config(..., deferred=True)`.
+
+        These changes are applied by `flush_config`. This allows to store the state of LXDock in
+        the config of the container (eg. provisioning fingerprints) using a single request at the
+        end of a command. Returns False if the config changes of the container were already
+        deferred.
+        """
+        if self._deferred_config is not None:
             return False
-        else:
-            return True
+        self._deferred_config = {}
+        return True
+
+    def flush_config(self):
+        """ Applies the deferred config changes of the container and stops deferring them. """
+        config, self._deferred_config = self._deferred_config, None
+        return self.update_config(config=config) if config else False
+
+    def update_config(self, config=None, devices=None, deferred=False):
+        """ Updates the configuration and the devices of the container.
+
+        The changes are applied using a single request, and only if they actually change something.
+        A value of None removes the related configuration key or device. Returns a boolean
+        indicating if the container was updated. If `deferred` is True and the config changes of
+        the container are deferred (see `defer_config_updates`), the config changes are only
+        recorded.
+        """
+        if deferred and self._deferred_config is not None:
+            self._deferred_config.update(config or {})
+            return False
+        return update_container(self._container, config=config, devices=devices)
+
+    @property
+    def image_source(self):
+        """ Returns the source (alias, mode, protocol, server) of the image of the container. """
+        mode = self.options.get('mode', 'pull')
+        return {
+            'alias': self.options['image'],
+            # The 'mode' defines how the container will be retrieved. In "local" mode the image
+            # will be determined using a local alias. In "pull" mode the image will be fetched
+            # from a remote server using a remote alias.
+            'mode': mode,
+            # The 'protocol' to use. LXD supports two protocol: 'lxd' (RESTful API that is used
+            # between the clients and a LXD daemon) and 'simplestreams' (an image server
+            # description format, using JSON to describe a list of images and allowing to get
+            # image information and import images). We use "simplestreams" by default (as the
+            # lxc command do).
+            'protocol': self.options.get('protocol', 'simplestreams'),
+            # The 'server' that should be used to fetch the images. We use the default
+            # linuxcontainers server for LXC and LXD when no value is provided (and if we are
+            # not in "local" mode).
+            'server': (self.options.get('server', self._default_image_server) if mode == 'pull'
+                       else ''),
+            'type': 'image',
+        }
 
     @property
     def is_privileged(self):
@@ -200,17 +407,22 @@ class Container:
     @property
     def is_provisioned(self):
         """ Returns a boolean indicating if the container is provisioned. """
-        return self._container.config.get('user.lxdock.provisioned') == 'true'
+        return self._get_config_value('user.lxdock.provisioned') == 'true'
 
     @property
     def is_running(self):
         """ Returns a boolean indicating if the container is running. """
-        return self._container.status_code == constants.CONTAINER_RUNNING
+        return self.exists and self._status_code == constants.CONTAINER_RUNNING
+
+    @property
+    def is_state_known(self):
+        """ Returns a boolean indicating if the known state of the container is up-to-date. """
+        return hasattr(self, '_pylxd_container') and not self._state_outdated
 
     @property
     def is_stopped(self):
         """ Returns a boolean indicating if the container is stopped. """
-        return self._container.status_code == constants.CONTAINER_STOPPED
+        return self.exists and self._status_code == constants.CONTAINER_STOPPED
 
     @property
     def lxd_name(self):
@@ -239,28 +451,66 @@ class Container:
     def status(self):
         """ Returns a string identifier representing the current status of the container. """
         default_status = 'undefined'  # Note: this status should not be displayed at all...
-        container = self._get_container(create=False)
-        if container is None:
+        if not self.exists:
             status = 'not-created'
         else:
             status = {
                 constants.CONTAINER_RUNNING: 'running',
                 constants.CONTAINER_STOPPED: 'stopped',
-            }.get(container.status_code, default_status)
+            }.get(self._status_code, default_status)
         return status
 
+    def handle_lxd_event(self, event):
+        """ Updates the known state of the container according to an event of the LXD events stream.
+
+        The state of the container is forgotten (and will be fetched again if it is needed) if the
+        event is related to the container, unless the event indicates that it was deleted.
+        """
+        if self.lxd_name not in get_event_container_names(event):
+            return
+        metadata = event.get('metadata') or {}
+        if event.get('type') == 'lifecycle' and metadata.get('action', '').endswith('-deleted') \
+                and metadata.get('source', '').rstrip('/').endswith('/' + self.lxd_name):
+            self.set_lxd_container(None)
+        else:
+            self.unset_lxd_container()
+
+    def set_image_fingerprint(self, fingerprint):
+        """ Sets the fingerprint of the local image to use to create the container.
+
+        This allows to create the container from an image that was already downloaded (eg. using
+        `lxdock pull`) instead of relying on the image source of the container.
+        """
+        self._image_fingerprint = fingerprint
+
+    def set_lxd_container(self, lxd_container):
+        """ Sets the PyLXD container instance holding the current state of the container.
+
+        This allows to reuse the state of containers that was fetched using a single request to
+        LXD (eg. for all the containers of a project). `None` indicates that the container does not
+        exist.
+        """
+        self._pylxd_container = lxd_container
+        self._state_outdated = False
+
+    def unset_lxd_container(self):
+        """ Forgets the known state of the container; it will be fetched again from LXD. """
+        if hasattr(self, '_pylxd_container'):
+            del self._pylxd_container
+        self._state_outdated = False
+
     ##################################
     # PRIVATE METHODS AND PROPERTIES #
     ##################################
 
     def _get_container(self, create=True):
         """ Gets or creates the PyLXD container. """
-        try:
-            container = self.client.containers.get(self.lxd_name)
-        except NotFound:
-            container = None
-        else:
-            return container
+        # There is no need to request LXD if the container is already known not to exist.
+        if getattr(self, '_pylxd_container', True) is not None:
+            try:
+                return self.client.containers.get(self.lxd_name)
+            except NotFound:
+                pass
 
         if not create:
             return
@@ -271,8 +521,64 @@ class Container:
         logger.info(
             'Creating new container "{name}" '
             'from image {image}'.format(name=self.lxd_name, image=self.options['image']))
+        container_config = self._get_creation_config()
+        image_source = source = self._get_image_source()
+        if self.options.get('image_cache'):
+            source = self._get_cached_image_source(image_source, container_config['config'])
+        container_config['source'] = source
+        with timed('create', self.name):
+            lxd_container = self._create_container(container_config)
+        if source is not image_source:
+            # The cached image holds the machine ID of the container it was published from.
+            self._reset_machine_id(lxd_container)
+        return lxd_container
+
+    def _change_state(self, action, **kwargs):
+        """ Changes the state of the container (eg. "start" or "stop").
+
+        The status of the container is not fetched right away: it is marked as outdated and will
+        only be fetched if it is needed.
+        """
+        try:
+            change_container_state(self._container, action, **kwargs)
+        finally:
+            self._state_outdated = True
+
+    def _create_container(self, container_config):
+        """ Creates the PyLXD container using the considered creation config. """
+        try:
+            return self.client.containers.create(container_config, wait=True)
+        except LXDAPIException as e:
+            logger.error("Can't create container: {error}".format(error=e))
+            raise ContainerOperationFailed()
+
+    def _get_cached_image_source(self, source, lxc_config):
+        """ Returns the source of the cached image to use to create the container if applicable.
+
+        `lxc_config` is updated in order to mark the local provisioning steps of the container as
+        executed if a cached image can be used. `source` is returned otherwise.
+        """
+        base_fingerprint = self._image_cache.get_base_fingerprint(source)
+        if base_fingerprint is None:
+            return source
+        key = self._get_image_cache_key(base_fingerprint)
+        cached_fingerprint = self._image_cache.find(key)
+        if cached_fingerprint is None:
+            return source
+
+        logger.info('Using cached image {key}'.format(key=key))
+        lxc_config.update({
+            'user.lxdock.base_image': base_fingerprint,
+            'user.lxdock.image_cache': key,
+        })
+        for i, fingerprint in enumerate(self._get_local_provisioning_fingerprints()):
+            if fingerprint is not None:
+                lxc_config[self._get_provisioning_fingerprint_key('local', i)] = fingerprint
+        return {'type': 'image', 'fingerprint': cached_fingerprint, }
+
+    def _get_creation_config(self):
+        """ Returns the config used to create the container, without its source. """
         privileged = self.options.get('privileged', False)
-        mode = self.options.get('mode', 'pull')
 
         # Get user defined lxc configs
         lxc_config = self.options.get('lxc_config', {}).copy()
@@ -284,47 +590,177 @@ class Container:
             'user.lxdock.homedir': self.homedir,
         })
 
-        container_config = {
-            'name': self.lxd_name,
-            'source': {
-                'alias': self.options['image'],
-                # The 'mode' defines how the container will be retrieved. In "local" mode the image
-                # will be determined using a local alias. In "pull" mode the image will be fetched
-                # from a remote server using a remote alias.
-                'mode': mode,
-                # The 'protocol' to use. LXD supports two protocol: 'lxd' (RESTful API that is used
-                # between the clients and a LXD daemon) and 'simplestreams' (an image server
-                # description format, using JSON to describe a list of images and allowing to get
-                # image information and import images). We use "simplestreams" by default (as the
-                # lxc command do).
-                'protocol': self.options.get('protocol', 'simplestreams'),
-                # The 'server' that should be used to fetch the images. We use the default
-                # linuxcontainers server for LXC and LXD when no value is provided (and if we are
-                # not in "local" mode).
-                'server': (self.options.get('server', self._default_image_server) if mode == 'pull'
-                           else ''),
-                'type': 'image',
-            },
-            'config': lxc_config,
-        }
+        # The environment and the shares are set right away so that they don't have to be set up
+        # once the container is started.
+        lxc_config.update(self._get_env_config())
+        devices = {}
+
+        # The idmap of the shares is set right away if the host allows it and if the UID and GID of
+        # their guest user can be predicted; otherwise the container is restarted once its shares
+        # are set up (or an explanation is given if the host is not set up for shares).
+        if 'shares' in self.options and self._has_host_subuidgid_been_set():
+            devices.update(self._get_share_devices())
+            guest_uidgid = self._get_predicted_guest_uidgid()
+            if guest_uidgid is not None:
+                lxc_config['raw.idmap'] = self._get_raw_idmap(*guest_uidgid)
+
+        container_config = {'name': self.lxd_name, 'config': lxc_config, 'devices': devices, }
 
         profiles = self.options.get('profiles')
         if profiles:
             container_config['profiles'] = profiles.copy()
 
+        return container_config
+
+    def _get_definition(self):
+        """ Returns the options defining the filesystem of the container, except its image. """
+        return {
+            'lxc_config': self.options.get('lxc_config', {}),
+            'privileged': self.options.get('privileged', False),
+            'profiles': self.options.get('profiles'),
+            'users': self.options.get('users', []),
+            'provisioning': self._get_local_provisioning_fingerprints(),
+        }
+
+    def _get_image_cache_key(self, base_fingerprint):
+        """ Returns the key identifying the provisioned image of the container in the image cache.
+        """
+        return self._image_cache.get_key(base_fingerprint, self._get_definition())
+
+    def _get_image_source(self):
+        """ Returns the source of the image used to create the container. """
+        if self._image_fingerprint is not None:
+            # The image was already made available locally.
+            return {'type': 'image', 'fingerprint': self._image_fingerprint, }
+        return self.image_source
+
+    def _get_local_provisioning_fingerprints(self):
+        """ Returns the fingerprints of the provisioning steps defined for the container.
+
+        None is used for the steps whose provisioner is not available.
+        """
+        fingerprints = []
+        for provisioning_item in self.options.get('provisioning', []):
+            provisioner_class = Provisioner.provisioners.get(provisioning_item['type'].lower())
+            fingerprints.append(
+                provisioner_class(self.homedir, None, [], provisioning_item).get_fingerprint()
+                if provisioner_class is not None else None)
+        return fingerprints
+
+    def _get_predicted_guest_uidgid(self):
+        """ Returns the UID and GID the guest user of the shares will have in a new container.
+
+        None is returned if they cannot be determined before the container is created: the UIDs and
+        GIDs of the users created by LXDock depend on the users already defined by the image.
+        """
+        if self._get_shares_username() == 'root':
+            return 0, 0
+        cached = (read_cache_file(self._guest_uidgids_cache_filename) or {}).get(
+            self._get_guest_uidgid_cache_key())
+        if isinstance(cached, list) and len(cached) == 2:
+            return tuple(cached)
+
+    def _get_config_value(self, key):
+        """ Returns the value of a config key of the container, including deferred changes. """
+        if self._deferred_config and key in self._deferred_config:
+            return self._deferred_config[key]
+        return self._container.config.get(key)
+
+    def _get_guest_uidgid_cache_key(self):
+        """ Returns the key of the UID and GID of the guest user of the shares in the cache. """
+        return fingerprint_data({
+            'image': self.image_source,
+            'users': [user['name'] for user in self.options.get('users', [])],
+        })
+
+    def _get_provisioning_fingerprint_key(self, scope, index):
+        """ Returns the config key holding the fingerprint of a specific provisioning step. """
+        return 'user.lxdock.provisioning.{scope}.{index}'.format(scope=scope, index=index)
+
+    def _get_raw_idmap(self, guest_uid, guest_gid):
+        """ Returns the idmap mapping the host user to the guest user of the shares. """
+        host_uid, host_gid = self._host.uidgid()
+        return "uid {} {}\ngid {} {}".format(host_uid, guest_uid, host_gid, guest_gid)
+
+    def _get_share_devices(self):
+        """ Returns the disk devices implementing the shares of the container. """
+        devices = {}
+        for i, share in enumerate(self.options.get('shares', []), start=1):
+            source = os.path.join(self.homedir, share['source'])
+            shareconf = {'type': 'disk', 'source': source, 'path': share['dest'], }
+
+            # The share options can be shared by multiple containers (possibly processed
+            # concurrently) so they must not be altered here.
+            extra_properties = dict(share.get('share_properties', {}))
+            extra_properties.pop("type", None)
+            extra_properties.pop("source", None)
+            extra_properties.pop("path", None)
+            shareconf.update(extra_properties)
+
+            # Upstream issue: https://github.com/lxc/lxd/issues/4538
+            if shareconf.get("optional", "false").lower() in {"true", "1", "on", "yes"}:
+                if not os.path.exists(source):
+                    continue
+
+            devices['lxdockshare%s' % i] = shareconf
+        return devices
+
+    def _get_shares_username(self):
+        """ Returns the name of the guest user owning the files of the shares. """
+        return self.options.get("users", [{"name": "root"}])[0]["name"]
+
+    def _has_host_subuidgid_been_set(self):
+        """ Returns a boolean indicating if the subuid and subgid of the host allow shares.
+
+        The host is only checked once (the related errors are logged by the check).
+        """
+        if self._host_subuidgid_set is None:
+            self._host_subuidgid_set = self._host.has_subuidgid_been_set()
+        return self._host_subuidgid_set
+
+    def _publish_to_image_cache(self):
+        """ Publishes the provisioned container to the image cache if it is not already there. """
+        base_fingerprint = self._get_config_value('user.lxdock.base_image') \
+            or self._get_config_value('volatile.base_image')
+        if not base_fingerprint:
+            return
+        key = self._get_image_cache_key(base_fingerprint)
+        if self._get_config_value('user.lxdock.image_cache') == key:
+            return
+
         try:
-            return self.client.containers.create(container_config, wait=True)
+            self._image_cache.publish(
+                self._container, key, description='LXDock image of {project}/{name}'.format(
+                    project=self.project_name, name=self.name))
+            self.update_config(config={'user.lxdock.base_image': base_fingerprint,
+                                       'user.lxdock.image_cache': key, }, deferred=True)
+            max_size = self.options.get('image_cache_max_size')
+            self._image_cache.prune(max_size * 1024 ** 2 if max_size is not None else None)
         except LXDAPIException as e:
-            logger.error("Can't create container: {error}".format(error=e))
-            raise ContainerOperationFailed()
+            logger.warning("Can't publish the container to the image cache: {error}".format(
+                error=e))
+
+    def _get_env_config(self):
+        """ Returns the config keys overriding the environment of the container. """
+        return {'environment.{}'.format(key): str(value)
+                for key, value in self.options.get('environment', {}).items()}
+
+    def _reset_machine_id(self, lxd_container):
+        """ Empties the machine ID of a container created from the filesystem of another one.
+
+        The machine ID is used to compute DHCP client identifiers for example: containers sharing
+        it would get the same IP addresses. An empty machine ID is regenerated at boot time.
+        """
+        try:
+            lxd_container.files.get('/etc/machine-id')
+        except NotFound:
+            pass
+        else:
+            lxd_container.files.put('/etc/machine-id', b'')
 
     def _setup_env(self):
         """ Add environment overrides from the conf to our container config. """
-        env_override = self.options.get('environment')
-        if env_override:
-            for key, value in env_override.items():
-                self._container.config['environment.{}'.format(key)] = str(value)
-            self._container.save(wait=True)
+        self.update_config(config=self._get_env_config())
 
     def _setup_hostnames(self, ip):
         """ Configure the potential hostnames associated with the container. """
@@ -332,14 +768,15 @@ class Container:
         if not hostnames:
             return
 
-        etchosts = EtcHosts()
-        for hostname in hostnames:
-            logger.info('Setting {hostname} to point to {ip}.'.format(
-                hostname=hostname, ip=ip))
-            etchosts.ensure_binding_present(hostname, ip)
-        if etchosts.changed:
-            logger.info("Saving host bindings to /etc/hosts. sudo may be needed")
-            etchosts.save()
+        with EtcHosts.lock:
+            etchosts = EtcHosts()
+            for hostname in hostnames:
+                logger.info('Setting {hostname} to point to {ip}.'.format(
+                    hostname=hostname, ip=ip))
+                etchosts.ensure_binding_present(hostname, ip)
+            if etchosts.changed:
+                logger.info("Saving host bindings to /etc/hosts. sudo may be needed")
+                etchosts.save()
 
     def _setup_ip(self):
         """ Setup the IP address of the considered container. """
@@ -353,61 +790,53 @@ class Container:
             logger.info('Maybe that restarting it will help? Not trying to provision.')
         return ip
 
-    def _setup_shares(self):
-        """ Setup the shared folders associated with the container. """
+    def _setup_shares(self, config=None):
+        """ Setup the shared folders associated with the container.
+
+        The changes of the devices and of the configuration of the container are applied using a
+        single request, along with the extra config keys of `config`.
+        """
+        config = dict(config or {})
         if 'shares' not in self.options:
+            self.update_config(config=config)
             return
 
         logger.info('Setting up shares...')
 
-        if not self._host.has_subuidgid_been_set():
+        if not self._has_host_subuidgid_been_set():
             raise ContainerOperationFailed()
 
         container = self._container
 
-        # First, let's make an inventory of shared sources that were already there.
-        existing_shares = {
-            k: d for k, d in container.devices.items() if k.startswith('lxdockshare')
-        }
-
-        # Let's get rid of previously set up lxdock shares.
-        for k in existing_shares:
-            del container.devices[k]
-
-        for i, share in enumerate(self.options.get('shares', []), start=1):
-            source = os.path.join(self.homedir, share['source'])
-            shareconf = {'type': 'disk', 'source': source, 'path': share['dest'], }
+        # Previously set up lxdock shares are removed unless they are defined again.
+        devices = {k: None for k in container.devices if k.startswith('lxdockshare')}
+        devices.update(self._get_share_devices())
 
-            extra_properties = share.pop('share_properties', {})
-            extra_properties.pop("type", None)
-            extra_properties.pop("source", None)
-            extra_properties.pop("path", None)
-            shareconf.update(extra_properties)
-
-            # Upstream issue: https://github.com/lxc/lxd/issues/4538
-            if shareconf.get("optional", "false").lower() in {"true", "1", "on", "yes"}:
-                if not os.path.exists(source):
-                    continue
-
-            container.devices['lxdockshare%s' % i] = shareconf
-
-        guest_username = self.options.get("users", [{"name": "root"}])[0]["name"]
-        host_uid, host_gid = self._host.uidgid()
-        guest_uid, guest_gid = self._guest.uidgid(guest_username)
-        raw_idmap = "uid {} {}\ngid {} {}".format(host_uid, guest_uid, host_gid, guest_gid)
+        guest_uid, guest_gid = self._guest.uidgid(self._get_shares_username())
+        if (guest_uid, guest_gid) != self._get_predicted_guest_uidgid():
+            self._set_cached_guest_uidgid(guest_uid, guest_gid)
+        raw_idmap = self._get_raw_idmap(guest_uid, guest_gid)
         raw_idmap_updated = container.config.get("raw.idmap") != raw_idmap
-        if raw_idmap_updated:
-            container.config["raw.idmap"] = raw_idmap
+        config["raw.idmap"] = raw_idmap
 
-        container.save(wait=True)
+        self.update_config(config=config, devices=devices)
 
         if raw_idmap_updated:
             # the container must be restarted for this to take effect
             logger.info(
               "share uid map (raw.idmap) updated, container must be restarted to take effect"
             )
-            container.restart(wait=True)
-            self._setup_ip()
+            with timed('setup_shares.restart', self.name):
+                self._change_state('restart')
+                self._setup_ip()
+                self._wait_until_ready()
+
+    def _set_cached_guest_uidgid(self, guest_uid, guest_gid):
+        """ Stores the UID and GID of the guest user of the shares for the next new containers. """
+        with self._guest_uidgids_lock:
+            uidgids = read_cache_file(self._guest_uidgids_cache_filename) or {}
+            uidgids[self._get_guest_uidgid_cache_key()] = [guest_uid, guest_gid]
+            write_cache_file(self._guest_uidgids_cache_filename, uidgids)
 
     def _setup_users(self):
         """ Creates users defined in the container's options if applicable. """
@@ -440,29 +869,47 @@ class Container:
         if not hostnames:
             return
 
-        etchosts = EtcHosts()
-        for hostname in hostnames:
-            logger.info('Unsetting {hostname}. sudo needed.'.format(hostname=hostname))
-            etchosts.ensure_binding_absent(hostname)
-        if etchosts.changed:
-            etchosts.save()
+        with EtcHosts.lock:
+            etchosts = EtcHosts()
+            for hostname in hostnames:
+                logger.info('Unsetting {hostname}. sudo needed.'.format(hostname=hostname))
+                etchosts.ensure_binding_absent(hostname)
+            if etchosts.changed:
+                etchosts.save()
 
     def _wait_for_ip(self, seconds=10):
-        """ Waits some time before trying to get the IP of the container and returning it. """
-        for i in range(seconds):
-            time.sleep(1)
-            ip = get_ip(self._container)
-            if ip:
-                return ip
-        return ''
+        """ Waits at most `seconds` seconds for the container to get an IP and returns it. """
+        return wait_for_ip(self._container, seconds)
+
+    def _wait_until_ready(self):
+        """ Waits for the guest of the container to finish booting. """
+        timeout = self.options.get('extras', {}).get('boot_wait_timeout', 60)
+        if not self._guest.wait_until_ready(timeout):
+            logger.warning(
+                'The container is still booting after {} seconds. Proceeding anyway...'.format(
+                    timeout))
 
     @property
     def _container(self):
         """ Returns the PyLXD Container instance associated with the considered container. """
-        if not hasattr(self, '_pylxd_container'):
+        if getattr(self, '_pylxd_container', None) is None:
             self._pylxd_container = self._get_container()
         return self._pylxd_container
 
+    @property
+    def _status_code(self):
+        """ Returns the status code of the container, fetching it again if it is outdated. """
+        if self._state_outdated:
+            self.set_lxd_container(self._get_container(create=False))
+            if self._pylxd_container is None:
+                return
+        return self._container.status_code
+
+    @property
+    def _image_cache(self):
+        """ Returns the `ImageCache` instance used to create or publish the container. """
+        return ImageCache(self.client)
+
     @property
     def _guest(self):
         """ Returns the `Guest` instance associated with the considered container. """
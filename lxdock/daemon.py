@@ -0,0 +1,338 @@
+"""
+    LXDock daemon
+    =============
+    This module provides an optional background process (``lxdockd``) that keeps LXDock state warm
+    between invocations of the ``lxdock`` command: the PyLXD client, the parsed configurations and
+    projects (including the guests detected for their containers) and the state of the containers,
+    which is invalidated container by container using the LXD events stream.
+
+    The ``lxdock`` command forwards some commands to this daemon through a unix socket if it is
+    running. Requests and responses are JSON documents (one per line).
+
+    Note that the client part of this module must stay cheap to import.
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import redirect_stderr, redirect_stdout
+
+from .constants import DAEMON_ACTIONS
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_socket_path():
+    """ Returns the path of the unix socket the daemon listens on. """
+    if os.environ.get('LXDOCK_SOCKET'):
+        return os.environ['LXDOCK_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'lxdockd.sock')
+    return os.path.join(tempfile.gettempdir(), 'lxdockd-{}.sock'.format(os.getuid()))
+
+
+def forward_command(argv, socket_path=None, stdout=None, stderr=None):
+    """ Forwards a command to the daemon and returns its exit code.
+
+    None is returned if the command cannot be forwarded (eg. because the daemon is not running);
+    in that case the command should be executed by the current process. The output of the
+    command is written to `stdout` and `stderr` (the standard streams by default).
+    """
+    streams = {'stdout': stdout or sys.stdout, 'stderr': stderr or sys.stderr, }
+    action = next((arg for arg in argv if not arg.startswith('-')), None)
+    if action not in DAEMON_ACTIONS or os.environ.get('LXDOCK_NO_DAEMON'):
+        return
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return
+
+    with sock, sock.makefile('rwb') as fp:
+        request = {'argv': list(argv), 'cwd': os.getcwd(), 'environ': dict(os.environ), }
+        fp.write(json.dumps(request).encode('utf-8') + b'\n')
+        fp.flush()
+        for line in fp:
+            message = json.loads(line.decode('utf-8'))
+            if 'stream' in message:
+                stream = streams[message['stream']]
+                stream.write(message['data'])
+                stream.flush()
+            elif 'exec' in message:
+                # Interactive commands (eg. shells) are executed by the client.
+                subprocess.call(message['exec'], shell=True)
+            elif 'exit' in message:
+                return message['exit']
+
+    streams['stderr'].write('The connection to the LXDock daemon was lost.\n')
+    return 1
+
+
+class LXDockDaemon:
+    """ Executes LXDock commands forwarded by ``lxdock`` processes using warm caches. """
+
+    def __init__(self, socket_path=None, listen_events=True):
+        self.socket_path = socket_path or get_socket_path()
+        self.listen_events = listen_events
+        self._client = None
+        self._configs = {}
+        self._container_events = {}
+        self._events_client = None
+        self._events_lock = threading.Lock()
+        # Commands alter process-wide state (working directory, environment variables, standard
+        # streams) so they are executed one at a time.
+        self._lock = threading.Lock()
+        self._state_changed = True
+
+    @property
+    def client(self):
+        """ Returns the PyLXD client used by the daemon. """
+        if self._client is None:
+            from .client import get_client
+            self._client = get_client()
+            if self.listen_events:
+                self._listen_events()
+        return self._client
+
+    def get_config(self):
+        """ Returns the `Config` instance of the project of the current working directory.
+
+        Configurations are reused as long as the LXDock file, the .env file, the home directory and
+        the environment variables referenced in the LXDock file are the same.
+        """
+        from .conf import Config
+        from .conf.discovery import find_config_file
+        path = find_config_file()
+        entry = self._configs.get(path)
+        if entry is None or entry['key'] != self._get_config_key(path, entry['variables']):
+            config = Config.from_base_dir()
+            variables = self._get_config_variables(path)
+            entry = self._configs[path] = {
+                'key': self._get_config_key(path, variables), 'variables': variables,
+                'config': config, 'project': None, }
+        return entry['config']
+
+    def get_project(self):
+        """ Returns the `Project` instance of the project of the current working directory. """
+        from .project import Project
+        config = self.get_config()
+        entry = self._configs[os.path.join(config.homedir, config.filename)]
+        project_created = entry['project'] is None
+        if project_created:
+            entry['project'] = Project.from_config(config['name'], self.client, config)
+        # The events received since the previous command are only applied to the containers whose
+        # state is affected by them.
+        with self._events_lock:
+            events = [(c, self._container_events.pop(c.lxd_name, None))
+                      for c in entry['project'].containers]
+        if not project_created:
+            for container, event in events:
+                if self._state_changed:
+                    container.unset_lxd_container()
+                elif event is not None:
+                    container.handle_lxd_event(event)
+        return entry['project']
+
+    def handle(self, fp):
+        """ Handles a single request read from a file-like object bound to a client socket. """
+        request = json.loads(fp.readline().decode('utf-8'))
+
+        def send(message):
+            fp.write(json.dumps(message).encode('utf-8') + b'\n')
+            fp.flush()
+
+        with self._lock:
+            exit_code = self._execute(request, send)
+            # The state of the containers will only be invalidated again if LXD notifies changes.
+            self._state_changed = not (self.listen_events and self._events_client is not None)
+        send({'exit': exit_code})
+
+    def serve_forever(self):
+        """ Listens on the unix socket of the daemon and handles the incoming requests. """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen(16)
+        logger.info('Listening on {}'.format(self.socket_path))
+        try:
+            while True:
+                connection, _ = server.accept()
+                threading.Thread(target=self._handle_connection, args=(connection, ),
+                                 daemon=True).start()
+        finally:
+            server.close()
+            os.unlink(self.socket_path)
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _execute(self, request, send):
+        """ Executes the command of a request and returns its exit code. """
+        from .cli.main import LXDock
+        from .logging import console_stderr_handler, console_stdout_handler
+
+        daemon = self
+
+        class ForwardedLXDock(LXDock):
+            @property
+            def project(self):
+                return daemon.get_project()
+
+            @property
+            def project_config(self):
+                return daemon.get_config()
+
+            def shell(self, args):
+                send({'exec': self.project.get_shell_command(
+                    container_name=args.name, username=args.username, command=args.command)})
+
+        stdout, stderr = _StreamForwarder(send, 'stdout'), _StreamForwarder(send, 'stderr')
+        handler_streams = (console_stdout_handler.stream, console_stderr_handler.stream)
+        cwd, environ = os.getcwd(), dict(os.environ)
+        console_stdout_handler.stream, console_stderr_handler.stream = stdout, stderr
+        try:
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['environ'])
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                ForwardedLXDock(request['argv'])
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            logger.exception('Unable to execute: {}'.format(' '.join(request['argv'])))
+            return 1
+        finally:
+            console_stdout_handler.stream, console_stderr_handler.stream = handler_streams
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+        return 0
+
+    def _get_config_key(self, path, variables):
+        """ Returns a value identifying the inputs used to build the configuration of a project.
+
+        Only the environment variables of `variables` are considered: the other ones (eg. PWD or
+        SHLVL) change from a terminal to another but don't affect the configuration.
+        """
+        env_path = os.path.join(os.path.dirname(path), '.env')
+        stats = [(s.st_mtime, s.st_size) if s else None
+                 for s in (_stat(path), _stat(env_path))]
+        environ = {name: os.environ.get(name) for name in variables}
+        return (stats, environ, os.path.expanduser('~'), )
+
+    def _get_config_variables(self, path):
+        """ Returns the names of the environment variables referenced in a LXDock file. """
+        from .conf import Config
+        from .conf.cache import get_referenced_variables
+        config = Config(*os.path.split(path))
+        config.load()
+        return get_referenced_variables(config._dict)
+
+    def _handle_connection(self, connection):
+        with connection, connection.makefile('rwb') as fp:
+            # Only the user running the daemon is allowed to forward commands to it.
+            credentials = connection.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            _, uid, _ = struct.unpack('3i', credentials)
+            if uid != os.getuid():
+                logger.warning('Rejected a request from user {}'.format(uid))
+                return
+            try:
+                self.handle(fp)
+            except (OSError, ValueError):
+                logger.debug('Unable to handle a request', exc_info=True)
+
+    def _handle_event(self, event):
+        """ Records the latest event related to each container affected by an LXD event. """
+        from .utils.lxd import get_event_container_names
+        with self._events_lock:
+            for name in get_event_container_names(event):
+                self._container_events[name] = event
+
+    def _listen_events(self):
+        """ Invalidates the state of the containers when LXD notifies lifecycle events. """
+        from ws4py.client.threadedclient import WebSocketClient
+
+        daemon = self
+
+        class EventsClient(WebSocketClient):
+            def received_message(self, message):
+                daemon._handle_event(json.loads(message.data.decode('utf-8')))
+
+            def closed(self, code, reason=None):
+                daemon._events_client = None
+                daemon._state_changed = True
+
+        try:
+            events_client = self._client.events(websocket_client=EventsClient)
+            events_client.connect()
+        except Exception:
+            logger.warning('Unable to listen to LXD events; container states will not be cached.',
+                           exc_info=True)
+        else:
+            self._events_client = events_client
+
+
+class _StreamForwarder:
+    """ File-like object forwarding what is written to it to a client of the daemon. """
+
+    def __init__(self, send, name):
+        self._send = send
+        self._name = name
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def write(self, data):
+        if data:
+            self._send({'stream': self._name, 'data': data})
+        return len(data)
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the LXDock daemon, which speeds up LXDock commands.', prog='lxdockd')
+    parser.add_argument('--socket', help='Path of the unix socket to listen on.')
+    parser.add_argument(
+        '--no-events', action='store_true',
+        help='Do not listen to LXD events (the state of the containers will not be cached).')
+    args = parser.parse_args(args=argv)
+
+    from .cli.main import setup_logging
+    setup_logging()
+
+    daemon = LXDockDaemon(socket_path=args.socket, listen_events=not args.no_events)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -13,3 +13,7 @@ class ContainerOperationFailed(LXDockException):
 
 class ProvisionFailed(LXDockException):
     """ A provisioning failed. """
+
+
+class DependencyFailed(LXDockException):
+    """ An operation was not performed because an operation it depends on failed. """
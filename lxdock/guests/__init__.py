@@ -3,15 +3,28 @@
     ================
     This package contains guest definitions. Guests are used to perform operations on the "guest"
     side (the containers).
+
+    Guests are imported when they are first used (eg. through `Guest.guests`).
 """
 
-from .alpine import *  # noqa
-from .archlinux import *  # noqa
+import sys
+
+from ..utils.plugins import LazyModule
 from .base import *  # noqa
-from .centos import *  # noqa
-from .debian import *  # noqa
-from .fedora import *  # noqa
-from .gentoo import *  # noqa
-from .opensuse import *  # noqa
-from .oracle import *  # noqa
-from .ubuntu import *  # noqa
+
+
+class _GuestsModule(LazyModule):
+    lazy_attributes = {
+        'AlpineGuest': '.alpine',
+        'ArchLinuxGuest': '.archlinux',
+        'CentosGuest': '.centos',
+        'DebianGuest': '.debian',
+        'FedoraGuest': '.fedora',
+        'GentooGuest': '.gentoo',
+        'OpenSUSEGuest': '.opensuse',
+        'OracleLinuxGuest': '.oracle',
+        'UbuntuGuest': '.ubuntu',
+    }
+
+
+sys.modules[__name__].__class__ = _GuestsModule
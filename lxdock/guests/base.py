@@ -9,12 +9,15 @@ import logging
 import re
 import tarfile
 import tempfile
+import textwrap
 from pathlib import Path, PurePosixPath
 
 from pylxd.exceptions import NotFound
 
 from ..exceptions import ContainerOperationFailed
+from ..tracing import span
 from ..utils.metaclass import with_metaclass
+from ..utils.plugins import PluginRegistry
 
 
 __all__ = ['Guest', ]
@@ -22,6 +25,21 @@ __all__ = ['Guest', ]
 logger = logging.getLogger(__name__)
 
 
+# The guests that are part of LXDock and the modules defining them, in the order in which they are
+# detected. Third-party guests can be provided using entry points of the "lxdock.guests" group.
+BUILTIN_GUESTS = (
+    ('alpine', 'lxdock.guests.alpine'),
+    ('arch', 'lxdock.guests.archlinux'),
+    ('centos', 'lxdock.guests.centos'),
+    ('debian', 'lxdock.guests.debian'),
+    ('fedora', 'lxdock.guests.fedora'),
+    ('gentoo', 'lxdock.guests.gentoo'),
+    ('opensuse', 'lxdock.guests.opensuse'),
+    ('ol', 'lxdock.guests.oracle'),
+    ('ubuntu', 'lxdock.guests.ubuntu'),
+)
+
+
 class InvalidGuest(Exception):
     """ The `Guest` subclass is not valid. """
 
@@ -56,13 +74,14 @@ class _GuestBase(type):
         # We implement the "mount point" paradigm here in order to make all `Guest` subclassses
         # available in a single attribute.
         if not hasattr(cls, 'guests'):
-            # The class has no guests list: this means that we are considering the "plugin mount"
-            # class. So we created the list that will hold all the defined `Guest` subclasses.
-            cls.guests = []
+            # The class has no guests registry: this means that we are considering the "plugin
+            # mount" class. So we created the registry that will hold all the defined `Guest`
+            # subclasses. The modules defining them are imported on demand.
+            cls.guests = PluginRegistry(BUILTIN_GUESTS, 'lxdock.guests')
         else:
             # The `guests` attribute already exists so we are considering a `Guest` subclass, which
             # needs to be registered.
-            cls.guests.append(cls)
+            cls.guests.register(cls.name, cls)
 
 
 class Guest(with_metaclass(_GuestBase)):
@@ -77,9 +96,35 @@ class Guest(with_metaclass(_GuestBase)):
     # The `name` of a guest is a required attribute and should always be set on `Guest` subclasses.
     name = None
 
+    # The shell script waiting for the guest to finish booting (see `wait_until_ready`). It can use
+    # the `wait_while` shell function, which runs a command until it fails or until the readiness
+    # timeout expires. Each init system or tool is only waited for if it is used by the guest.
+    readiness_script = textwrap.dedent("""\
+        systemd_booting() {
+            case "$(systemctl is-system-running 2>/dev/null)" in
+                initializing|starting) return 0 ;;
+            esac
+            return 1
+        }
+        openrc_booting() {
+            [ "$(rc-status --runlevel 2>/dev/null)" != default ] \\
+                || [ -n "$(ls -A /run/openrc/starting 2>/dev/null)" ]
+        }
+        cloud_init_running() {
+            cloud-init status 2>/dev/null | grep -q 'status: running'
+        }
+        if [ -d /run/systemd/system ]; then wait_while systemd_booting; fi
+        if command -v rc-status >/dev/null 2>&1; then wait_while openrc_booting; fi
+        if command -v cloud-init >/dev/null 2>&1; then wait_while cloud_init_running; fi
+        """)
+
     def __init__(self, container):
         self.container = container
-        self.lxd_container = container._container
+
+    @property
+    def lxd_container(self):
+        """ Returns the PyLXD container instance holding the current state of the guest. """
+        return self.container._container
 
     @classmethod
     def detect(cls, lxd_container):
@@ -109,7 +154,9 @@ class Guest(with_metaclass(_GuestBase)):
     @classmethod
     def get(cls, container):
         """ Returns the `Guest` instance associated with the considered container. """
-        class_ = next((k for k in cls.guests if k.detect(container._container)), Guest)
+        # All the guests read the same files to detect their OS: each file is fetched only once.
+        lxd_container = _FileCachingContainer(container._container)
+        class_ = next((k for k in cls.guests.values() if k.detect(lxd_container)), Guest)
         return class_(container)
 
     def add_ssh_pubkey_to_authorized_keys(self, pubkey, homedir, uid=None, gid=None):
@@ -132,6 +179,19 @@ class Guest(with_metaclass(_GuestBase)):
             options += ['-s', shell, ]
         self.run(['useradd', ] + options + [username, ])
 
+    def wait_until_ready(self, timeout=60):
+        """ Waits at most `timeout` seconds for the guest to finish booting.
+
+        Readiness checks are performed by a single command executed in the container, which returns
+        as soon as the guest is ready. Returns False if the guest was still booting after `timeout`
+        seconds.
+        """
+        if not self.readiness_script:
+            return True
+        script = self._readiness_script_header.format(timeout=int(timeout)) + self.readiness_script
+        exit_code, _, _ = self.run(['sh', '-c', script])
+        return exit_code == 0
+
     def uidgid(self, username):
         """Obtain the uid and gid """
         exit_code, uid, _ = self.run(['id', '-u', username])
@@ -164,12 +224,13 @@ class Guest(with_metaclass(_GuestBase)):
     def run(self, cmd_args, stdin_payload=None):
         """ Runs the specified command inside the current container. """
         logger.debug('Running {0}'.format(' '.join(cmd_args)))
-        exit_code, stdout, stderr = self.lxd_container.execute(
-           cmd_args,
-           stdin_payload=stdin_payload,
-           stdout_handler=self._log_stdout,
-           stderr_handler=self._log_stderr
-        )
+        with span('exec', 'guest', self.container.name, args={'command': ' '.join(cmd_args)}):
+            exit_code, stdout, stderr = self.lxd_container.execute(
+               cmd_args,
+               stdin_payload=stdin_payload,
+               stdout_handler=self._log_stdout,
+               stderr_handler=self._log_stderr
+            )
         return exit_code, stdout, stderr
 
     def copy_file(self, host_path, guest_path):
@@ -180,10 +241,23 @@ class Guest(with_metaclass(_GuestBase)):
         self.run(['mkdir', '-p', str(guest_path.parent)])
         with host_path.open('rb') as f:
             logger.debug('Copying host:{} to guest:{}'.format(host_path, guest_path))
-            self.lxd_container.files.put(str(guest_path), f.read())
+            with span('push_file', 'guest', self.container.name,
+                      args={'source': str(host_path), 'destination': str(guest_path)}):
+                self.lxd_container.files.put(str(guest_path), f.read())
 
     _guest_temporary_tar_path = '/.lxdock.d/copied_directory.tar'
 
+    # Defines the `wait_while` shell function used by readiness scripts.
+    _readiness_script_header = textwrap.dedent("""\
+        deadline=$(($(date +%s) + {timeout}))
+        wait_while() {{
+            while "$@"; do
+                [ "$(date +%s)" -lt "$deadline" ] || exit 1
+                sleep 0.2
+            done
+        }}
+        """)
+
     def copy_directory(self, host_path, guest_path):
         """
         Copies a directory from host_path (pathlib.Path) to guest_path (pathlib.PurePath).
@@ -216,3 +290,36 @@ class Guest(with_metaclass(_GuestBase)):
     def _warn_guest_not_supported(self, for_msg):  # pragma: no cover
         """ Warns the user that a specific operation cannot be performed. """
         logger.warning('Guest not supported {}, doing nothing...'.format(for_msg))
+
+
+class _CachedFiles:
+    """ Proxy of the files of a PyLXD container that caches the results of `get`. """
+
+    def __init__(self, files):
+        self._files = files
+        self._results = {}
+
+    def __getattr__(self, name):
+        return getattr(self._files, name)
+
+    def get(self, path):
+        if path not in self._results:
+            try:
+                self._results[path] = (self._files.get(path), None)
+            except NotFound as e:
+                self._results[path] = (None, e)
+        content, error = self._results[path]
+        if error is not None:
+            raise error
+        return content
+
+
+class _FileCachingContainer:
+    """ Proxy of a PyLXD container whose files are only fetched once (see `_CachedFiles`). """
+
+    def __init__(self, lxd_container):
+        self._lxd_container = lxd_container
+        self.files = _CachedFiles(lxd_container.files)
+
+    def __getattr__(self, name):
+        return getattr(self._lxd_container, name)
@@ -1,3 +1,5 @@
+import textwrap
+
 from .base import Guest
 
 
@@ -6,6 +8,20 @@ class DebianGuest(Guest):
 
     name = 'debian'
 
+    # APT's periodic jobs (eg. unattended-upgrades) usually start right after the first boot and
+    # hold the dpkg lock, which would make the installation of packages fail or hang.
+    readiness_script = Guest.readiness_script + textwrap.dedent("""\
+        apt_running() {
+            for comm in /proc/[0-9]*/comm; do
+                case "$(cat "$comm" 2>/dev/null)" in
+                    apt|apt-get|apt.systemd.dai|dpkg|unattended-upgr) return 0 ;;
+                esac
+            done
+            return 1
+        }
+        wait_while apt_running
+        """)
+
     def install_packages(self, packages):
         self.run(['apt-get', 'update'])
         self.run(['apt-get', 'install', '-y'] + packages)
@@ -0,0 +1,193 @@
+import logging
+import threading
+import uuid
+
+from pylxd.exceptions import LXDAPIException, NotFound
+
+from .utils.fingerprint import fingerprint_data
+
+
+logger = logging.getLogger(__name__)
+
+
+def pull_image(client, source, auto_update=False):
+    """ Ensures that the image of a container source is available locally.
+
+    Images of "pull" sources are downloaded from their remote server by LXD (unless the latest
+    version of the image is already available locally). Unlike the images that LXD downloads
+    implicitly when creating containers, these images are not marked as cached: they are not
+    removed after ``images.remote_cache_expiry`` days and they are only kept up-to-date by LXD if
+    `auto_update` is True.
+
+    :param client: the PyLXD client to use
+    :param source: the "source" dictionary used to create containers
+    :param auto_update: whether LXD should keep the downloaded image up-to-date
+    :return: the fingerprint of the local image
+    """
+    if source['mode'] == 'local':
+        response = client.api.images.aliases[source['alias']].get()
+        return response.json()['metadata']['target']
+    response = client.api.images.post(json={
+        'source': {
+            'type': 'image',
+            'mode': 'pull',
+            'server': source['server'],
+            'protocol': source['protocol'],
+            'alias': source['alias'],
+        },
+        'auto_update': auto_update,
+    })
+    operation = _wait_for_operation(client, response)
+    return operation.metadata['fingerprint']
+
+
+class ImageCache:
+    """ Manages the local LXD images holding provisioned containers.
+
+    Containers that are provisioned for the first time can be published as local LXD images. These
+    images are identified by a key computed using the fingerprint of the base image of the
+    containers and their provisioning configuration. Containers whose definitions lead to the same
+    key can then be created from these images instead of being provisioned from scratch.
+    """
+
+    # The prefix of the aliases of the images that are managed by the cache.
+    alias_prefix = 'lxdock-cache-'
+
+    # The maximum size (in bytes) of the images of the cache if no other value is specified. The
+    # least recently used images are removed when this size is exceeded.
+    default_max_size = 10 * 1024 ** 3
+
+    # Images are published by one container at a time.
+    lock = threading.Lock()
+
+    def __init__(self, client):
+        self.client = client
+
+    def find(self, key):
+        """ Returns the fingerprint of the cached image associated with `key` or None. """
+        try:
+            response = self.client.api.images.aliases[self.alias_prefix + key].get()
+        except NotFound:
+            return
+        return response.json()['metadata']['target']
+
+    def get_base_fingerprint(self, source):
+        """ Returns the fingerprint of the local image corresponding to a container image source.
+
+        `source` is the "source" dictionary used to create containers. None is returned if the
+        image is not available locally (eg. if it was never pulled from a remote server).
+        """
+        if source.get('fingerprint'):
+            return source['fingerprint']
+        if source['mode'] == 'local':
+            try:
+                response = self.client.api.images.aliases[source['alias']].get()
+            except NotFound:
+                return
+            return response.json()['metadata']['target']
+        # Images pulled from remote servers are kept in the local image store of LXD along with
+        # the source they were pulled from. We use the most recent one.
+        candidates = [
+            image for image in self.images
+            if (image.get('update_source') or {}).get('alias') == source['alias'] and
+            image['update_source'].get('server') == source['server'] and
+            image['update_source'].get('protocol') == source['protocol']]
+        candidates.sort(key=lambda image: image.get('uploaded_at') or '', reverse=True)
+        return candidates[0]['fingerprint'] if candidates else None
+
+    def get_key(self, base_fingerprint, definition):
+        """ Returns the key identifying a container definition created from a base image. """
+        return fingerprint_data([base_fingerprint, definition])
+
+    @property
+    def images(self):
+        """ Returns the metadata of all the local LXD images using a single request. """
+        response = self.client.api.images.get(params={'recursion': 1})
+        return response.json()['metadata']
+
+    def list(self):
+        """ Returns the metadata of the cached images, the most recently used ones first.
+
+        The key of each image is inserted in the returned dictionaries (`lxdock_cache_key`).
+        """
+        cached_images = []
+        for image in self.images:
+            keys = [alias['name'][len(self.alias_prefix):] for alias in image.get('aliases') or []
+                    if alias['name'].startswith(self.alias_prefix)]
+            if keys:
+                image['lxdock_cache_key'] = keys[0]
+                cached_images.append(image)
+        cached_images.sort(key=self._get_last_use, reverse=True)
+        return cached_images
+
+    def prune(self, max_size=None):
+        """ Removes the least recently used images until the size of the cache is under `max_size`.
+
+        :param max_size: maximum size of the cache in bytes (`ImageCache.default_max_size` is
+            used if None, all the cached images are removed if 0)
+        :return: the metadata of the removed images
+        :rtype: list
+        """
+        max_size = self.default_max_size if max_size is None else max_size
+        cached_images = self.list()
+        total_size = sum(image.get('size', 0) for image in cached_images)
+        removed = []
+        while cached_images and (total_size > max_size or max_size == 0):
+            image = cached_images.pop()
+            logger.info('Removing cached image {key}...'.format(key=image['lxdock_cache_key']))
+            self._wait(self.client.api.images[image['fingerprint']].delete())
+            total_size -= image.get('size', 0)
+            removed.append(image)
+        return removed
+
+    def publish(self, lxd_container, key, description=''):
+        """ Publishes the current state of a PyLXD container as the cached image of `key`.
+
+        The container is not stopped: a temporary snapshot of the container is published instead.
+        """
+        with self.lock:
+            if self.find(key) is not None:
+                return
+            snapshot_name = 'lxdock-cache-{}'.format(uuid.uuid4().hex[:8])
+            logger.info('Publishing the container to the image cache...')
+            snapshot = lxd_container.snapshots.create(snapshot_name, wait=True)
+            try:
+                operation = self._wait(self.client.api.images.post(json={
+                    'public': False,
+                    'source': {
+                        'type': 'snapshot',
+                        'name': '{}/{}'.format(lxd_container.name, snapshot_name),
+                    },
+                    'properties': {'description': description, },
+                }))
+            finally:
+                snapshot.delete(wait=True)
+            fingerprint = operation.metadata['fingerprint']
+            try:
+                self.client.api.images.aliases.post(json={
+                    'name': self.alias_prefix + key, 'target': fingerprint,
+                    'description': description,
+                })
+            except LXDAPIException:
+                # The image was published by another LXDock process in the meantime.
+                self._wait(self.client.api.images[fingerprint].delete())
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _get_last_use(self, image):
+        """ Returns a sortable representation of the last time an image was used. """
+        last_used_at = image.get('last_used_at') or ''
+        # LXD uses the zero time for images that were never used.
+        if last_used_at.startswith('0001-'):
+            last_used_at = ''
+        return last_used_at or image.get('uploaded_at') or ''
+
+    def _wait(self, response):
+        return _wait_for_operation(self.client, response)
+
+
+def _wait_for_operation(client, response):
+    """ Waits for the operation associated with a response of the LXD API and returns it. """
+    return client.operations.wait_for_operation(response.json()['operation'])
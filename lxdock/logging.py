@@ -1,5 +1,7 @@
 import logging
 import sys
+import threading
+from contextlib import contextmanager
 
 from colorlog import ColoredFormatter
 
@@ -34,12 +36,52 @@ def get_per_container_formatter(container_name):
         '%(log_color)s==> {name}: %(message)s'.format(name=container_name), log_colors=LOG_COLORS)
 
 
+class _ContainerAwareFormatter(logging.Formatter):
+    """ Formats log records using the formatter of the container processed by the current thread.
+
+    Containers can be processed concurrently (each one in its own thread). This formatter ensures
+    that each message is prefixed with the name of the container it is related to.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._default_formatter = get_default_formatter()
+        self._per_container_formatters = {}
+
+    def format(self, record):
+        container_name = get_logging_context()
+        if container_name is None:
+            return self._default_formatter.format(record)
+        if container_name not in self._per_container_formatters:
+            self._per_container_formatters[container_name] = \
+                get_per_container_formatter(container_name)
+        return self._per_container_formatters[container_name].format(record)
+
+
+@contextmanager
+def container_logging_context(container_name):
+    """ Prefixes the messages logged by the current thread with the considered container name. """
+    previous_container_name = get_logging_context()
+    _context.container_name = container_name
+    try:
+        yield
+    finally:
+        _context.container_name = previous_container_name
+
+
+def get_logging_context():
+    """ Returns the name of the container whose messages are logged by the current thread. """
+    return getattr(_context, 'container_name', None)
+
+
 logger = logging.getLogger(__name__)
 
+_context = threading.local()
+
 console_stdout_handler = logging.StreamHandler(sys.stdout)
 console_stdout_handler.addFilter(_AtMostWarningFilter())
 console_stderr_handler = logging.StreamHandler(sys.stderr)
 console_stderr_handler.addFilter(_AtleastErrorFilter())
 
-console_stdout_handler.setFormatter(get_default_formatter())
-console_stderr_handler.setFormatter(get_default_formatter())
+console_stdout_handler.setFormatter(_ContainerAwareFormatter())
+console_stderr_handler.setFormatter(_ContainerAwareFormatter())
@@ -1,21 +1,37 @@
+import hashlib
 import io
+import logging
 import re
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
 
 
 def get_ip(container):
     """ Returns the IP address of a specific container. """
     state = container.state()
-    if state.network is None:  # container is not running
-        return ''
-    eth0 = state.network['eth0']
-    # TODO: we only use IPv4 addresses for now. This should be updated in order to better support
-    # IPv6 addresses and LXD bridges configured for IPv6.
-    for addr in eth0['addresses']:
-        if addr['family'] == 'inet':
-            return addr['address']
-    return ''
+    return _get_network_ip(state.network)
+
+
+def wait_for_ip(container, timeout):
+    """ Waits until a running container has an IP address and returns it.
+
+    An empty string is returned if the container still has no IP address once `timeout` seconds
+    elapsed. Containers waiting for their IP address at the same time share the requests sent to
+    LXD (see `IPWaiter`).
+    """
+    return _ip_waiter.wait(container, timeout)
+
+
+def get_bindings_fingerprint(bindings):
+    """ Returns a fingerprint identifying a set of LXDock hostname bindings. """
+    lines = sorted('{} {}'.format(ip, host) for host, ip in bindings.items())
+    return hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()
 
 
 RE_ETCHOST_LINE = re.compile(r'^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+([\w\-_.]+)$')
@@ -52,6 +68,12 @@ class EtcHostsBase:
             del self.lxdock_bindings[hostname]
             self.changed = True
 
+    def ensure_bindings(self, bindings):
+        """ Ensures that the LXDock section contains exactly the considered bindings. """
+        if self.lxdock_bindings != bindings:
+            self.lxdock_bindings = dict(bindings)
+            self.changed = True
+
     def get_mangled_contents(self):
         tosave = self.lines[:]
         if self.lxdock_bindings:
@@ -72,6 +94,10 @@ class EtcHostsBase:
 
 
 class EtcHosts(EtcHostsBase):
+    # The host's /etc/hosts file can be updated by multiple containers being processed concurrently.
+    # This lock must be held while reading, updating and saving the file.
+    lock = threading.RLock()
+
     def __init__(self, path='/etc/hosts'):
         self.path = path
         etchosts_fp = open(self.path, 'rt', encoding='utf-8')
@@ -95,6 +121,10 @@ class EtcHosts(EtcHostsBase):
 
 
 class ContainerEtcHosts(EtcHostsBase):
+    # The config key used to store the fingerprint of the bindings that were last written to the
+    # /etc/hosts file of a container.
+    fingerprint_config_key = 'user.lxdock.etchosts'
+
     def __init__(self, container, path='/etc/hosts'):
         self.path = path
         self.container = container
@@ -106,3 +136,107 @@ class ContainerEtcHosts(EtcHostsBase):
         tosave = self.get_mangled_contents()
         towrite = ''.join(tosave).encode('utf-8')
         self.container.files.put(self.path, towrite)
+
+
+class IPWaiter:
+    """ Waits for the IP addresses of running containers.
+
+    The containers waiting for their IP address at the same time are handled by a single polling
+    thread: only the state of these containers is fetched, using at most `max_workers` concurrent
+    requests to LXD (listing the state of all the containers of a shared host would be much more
+    expensive). The polling interval starts at `initial_interval` seconds and doubles up to
+    `max_interval` seconds; it is reset when a container starts waiting. LXD does not notify
+    network changes through its events stream so polling is the only option.
+    """
+
+    def __init__(self, initial_interval=0.05, max_interval=0.25, max_workers=8):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self._wakeup = threading.Event()
+
+    def wait(self, container, timeout):
+        """ Waits until a container has an IP address and returns it (see `wait_for_ip`). """
+        pending = _PendingIP(container, time.monotonic() + timeout)
+        with self._lock:
+            self._pending.append(pending)
+            self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._poll, name='lxdock-ip-waiter', daemon=True)
+                self._thread.start()
+        pending.done.wait()
+        return pending.ip
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _get_ips(self, containers, executor):
+        """ Returns a dictionary associating the names of containers with their IP addresses. """
+        if len(containers) == 1:
+            return {containers[0].name: get_ip(containers[0])}
+        return dict(zip([c.name for c in containers], executor.map(get_ip, containers)))
+
+    def _poll(self):
+        # The states of the containers are fetched concurrently by the threads of this pool.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            interval = self.initial_interval
+            while True:
+                with self._lock:
+                    self._wakeup.clear()
+                    pending = list(self._pending)
+                    if not pending:
+                        self._thread = None
+                        return
+                try:
+                    ips = self._get_ips([p.container for p in pending], executor)
+                except Exception:
+                    logger.debug(
+                        'Unable to fetch the IP addresses of the containers', exc_info=True)
+                    ips = {}
+
+                now = time.monotonic()
+                with self._lock:
+                    for p in pending:
+                        ip = ips.get(p.container.name)
+                        if ip or now >= p.deadline:
+                            p.ip = ip or ''
+                            self._pending.remove(p)
+                            p.done.set()
+                    next_deadline = min([p.deadline for p in self._pending] or [now])
+
+                # The polling interval is reset if a container starts waiting for its IP address.
+                if self._wakeup.wait(max(0, min(interval, next_deadline - now))):
+                    interval = self.initial_interval
+                else:
+                    interval = min(interval * 2, self.max_interval)
+
+
+class _PendingIP:
+    """ A container waiting for its IP address. """
+
+    def __init__(self, container, deadline):
+        self.container = container
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.ip = ''
+
+
+def _get_network_ip(network):
+    """ Returns the IPv4 address of the eth0 interface of a container given its network state. """
+    if network is None:  # container is not running
+        return ''
+    eth0 = network['eth0']
+    # TODO: we only use IPv4 addresses for now. This should be updated in order to better support
+    # IPv6 addresses and LXD bridges configured for IPv6.
+    for addr in eth0['addresses']:
+        if addr['family'] == 'inet':
+            return addr['address']
+    return ''
+
+
+_ip_waiter = IPWaiter()
@@ -0,0 +1,129 @@
+"""
+    LXDock profiling
+    ================
+    This module provides tools allowing to profile the operations performed by LXDock using
+    cProfile. The threads started while a profile is recorded (eg. the threads processing containers
+    concurrently) are profiled as well. The call stacks of all the threads can also be sampled in
+    order to produce flame graphs:
+
+    .. code-block:: python
+
+        with record_profile(sample_stacks=True) as profile:
+            ...
+        profile.save('lxdock.pstats')
+        profile.save_stacks('lxdock.stacks')
+"""
+
+import collections
+import cProfile
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+
+
+__all__ = ['Profile', 'record_profile', ]
+
+
+class Profile:
+    """ Profiles the current thread and the threads started while it is active.
+
+    If `sample_stacks` is set, the call stacks of all the threads are also sampled every
+    `sampling_interval` seconds; the samples are saved using the collapsed stack format, which can
+    be turned into flame graphs by tools such as ``flamegraph.pl`` or speedscope
+    (https://www.speedscope.app).
+    """
+
+    def __init__(self, sample_stacks=False, sampling_interval=0.001):
+        self.stacks = collections.Counter()
+        self.sample_stacks = sample_stacks
+        self.sampling_interval = sampling_interval
+        self._profilers = []
+        self._sampler = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def save(self, path):
+        """ Writes the profiling data to a file that can be loaded using the `pstats` module. """
+        self.get_stats().dump_stats(path)
+
+    def save_stacks(self, path):
+        """ Writes the sampled call stacks to a file using the collapsed stack format. """
+        with open(path, mode='w', encoding='utf-8') as fd:
+            for stack, count in sorted(self.stacks.items()):
+                fd.write('{} {}\n'.format(stack, count))
+
+    def get_stats(self):
+        """ Returns a `pstats.Stats` instance merging the data of all the profiled threads. """
+        with self._lock:
+            profilers = list(self._profilers)
+        stats = pstats.Stats()
+        for profiler in profilers:
+            stats.add(profiler)
+        return stats
+
+    def start(self):
+        """ Starts profiling the current thread and the threads started from now on. """
+        if self.sample_stacks:
+            # The sampling thread is started first so that it is not profiled.
+            self._sampler = threading.Thread(
+                target=self._sample_stacks, name='lxdock-profile-sampler', daemon=True)
+            self._sampler.start()
+        threading.setprofile(self._profile_thread)
+        self._enable_profiler()
+
+    def stop(self):
+        """ Stops profiling the threads. """
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+        threading.setprofile(None)
+        with self._lock:
+            for profiler in self._profilers:
+                profiler.disable()
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _enable_profiler(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Starting with Python 3.12, a single profiler profiles all the threads: the profiler
+            # enabled by the thread that started the profile is already active.
+            return
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def _profile_thread(self, frame, event, arg):
+        # Called once by the threads started while the profile is active: the hook is replaced by
+        # the profiler enabled for the thread.
+        sys.setprofile(None)
+        self._enable_profiler()
+
+    def _sample_stacks(self):
+        sampler_id = threading.get_ident()
+        while not self._stopped.wait(self.sampling_interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{} ({}:{})'.format(
+                        code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+@contextmanager
+def record_profile(sample_stacks=False):
+    """ Profiles the operations performed in the context and returns the related `Profile`. """
+    profile = Profile(sample_stacks=sample_stacks)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
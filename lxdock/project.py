@@ -1,14 +1,20 @@
+import collections
 import logging
+from contextlib import contextmanager
 
 from . import constants
 from .container import Container
 from .exceptions import ProjectError
-from .guests import Guest
 from .hosts import Host
-from .logging import (console_stderr_handler, console_stdout_handler, get_default_formatter,
-                      get_per_container_formatter)
-from .network import ContainerEtcHosts, EtcHosts
+from .images import pull_image
+from .logging import container_logging_context
+from .network import ContainerEtcHosts, EtcHosts, get_bindings_fingerprint
 from .provisioners import Provisioner
+from .timings import timed
+from .tracing import traced
+from .utils.concurrency import format_error, run_concurrently
+from .utils.graph import find_cycle, get_dependencies, reverse_graph
+from .utils.lxd import get_containers, update_container
 
 
 logger = logging.getLogger(__name__)
@@ -17,12 +23,20 @@ logger = logging.getLogger(__name__)
 class Project:
     """ A project is used to orchestrate a collection of containers. """
 
-    def __init__(self, name, homedir, client, containers, provisioning_steps):
+    # The maximum number of containers whose /etc/hosts file can be updated at the same time.
+    _etchosts_update_workers = 8
+
+    # The maximum number of images that can be downloaded at the same time.
+    _image_pull_workers = 4
+
+    def __init__(self, name, homedir, client, containers, provisioning_steps, parallelism=1):
         self.name = name
         self.homedir = homedir
         self.client = client
         self.containers = containers
         self.provisioning_steps = provisioning_steps
+        # The maximum number of containers that can be brought up at the same time.
+        self.parallelism = parallelism
 
     @classmethod
     def from_config(cls, project_name, client, config):
@@ -30,104 +44,178 @@ class Project:
         containers = []
         for container_config in config.containers:
             containers.append(Container(project_name, config.homedir, client, **container_config))
-        return cls(project_name, config.homedir, client, containers, config.provisioning_steps)
+        return cls(project_name, config.homedir, client, containers, config.provisioning_steps,
+                   parallelism=config.parallelism)
 
     #####################
     # CONTAINER ACTIONS #
     #####################
 
+    @traced('action')
     def destroy(self, container_names=None):
-        """ Destroys the containers of the project. """
+        """ Destroys the containers of the project.
+
+        All the considered containers are stopped and deleted concurrently. A container is
+        destroyed only once the containers depending on it have been destroyed.
+        """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
-        for container in self._containers_generator(containers=containers):
-            container.destroy()
+        self.refresh_state(containers)
+        results = run_concurrently(
+            lambda container: container.destroy(), containers, max_workers=len(containers),
+            dependencies=reverse_graph(self.dependencies))
         self._update_guest_etchosts()
+        self._report_results(results)
 
+    @traced('action')
     def halt(self, container_names=None):
-        """ Stops containers of the project. """
+        """ Stops containers of the project.
+
+        All the considered containers are stopped concurrently. This way, stopping a whole project
+        takes at most the time allowed to a single container to shut down gracefully before being
+        forced to stop. A container is stopped only once the containers depending on it have been
+        stopped.
+        """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
-        for container in self._containers_generator(containers=containers):
-            container.halt()
+        self.refresh_state(containers)
+        results = run_concurrently(
+            lambda container: container.halt(), containers, max_workers=len(containers),
+            dependencies=reverse_graph(self.dependencies))
         self._update_guest_etchosts()
+        self._report_results(results)
 
+    @traced('action')
     def provision(self, container_names=None, force=True):
-        """ Provisions the containers of the project. """
-        # This happens in two phases: local provisioning, then global provisioning.
-        # Local provisioning is the provisioning that is declared directly in the
-        # `containers` config section. Global provisioning is declared at the root
-        # of the config.
+        """ Provisions the containers of the project.
+
+        If `force` is False, only the provisioning steps whose fingerprint changed since they were
+        last run on the containers are executed.
+        """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
-        for container in self._containers_generator(containers=containers):
-            container.provision(force=force)
+        # The provisioning state of each container is stored using a single request once the
+        # provisioning steps were executed (or one of them failed).
+        with self._deferred_config_updates(containers):
+            self._provision(containers, force)
 
-        host = Host.get()
-        if not force:
-            containers = [c for c in containers if not c.is_provisioned]
-        if not containers:
-            return
+    @traced('action')
+    def pull(self, container_names=None, auto_update=False):
+        """ Downloads the images of the containers of the project.
 
-        guests = [Guest.get(c) for c in containers]
-        for provisioning_item in self.provisioning_steps:
-            provisioning_type = provisioning_item['type'].lower()
-            provisioner_class = Provisioner.provisioners.get(provisioning_type)
-            if provisioner_class is not None:
-                provisioner = provisioner_class(
-                    self.homedir, host, guests, provisioning_item)
-                logger.info('Global provisioning with {0}'.format(provisioner.name))
-                provisioner.provision()
-
-        for guest in guests:
-            guest.lxd_container.config['user.lxdock.provisioned'] = 'true'
-            guest.lxd_container.save(wait=True)
+        Each distinct image is downloaded only once and different images are downloaded
+        concurrently. The containers that are created afterwards use the downloaded images. The
+        downloaded images are kept up-to-date by LXD if `auto_update` is True.
+        """
+        containers = [self.get_container_by_name(name) for name in container_names] \
+            if container_names else self.containers
+        errors = self._pull_images(containers, auto_update=auto_update)
+        if errors:
+            raise ProjectError('The following images could not be pulled: {}'.format(', '.join(
+                '{} ({})'.format(_format_image(*image), format_error(error))
+                for image, error in errors.items())))
 
     def shell(self, container_name=None, **kwargs):
         """ Opens a new shell in our first container. """
-        containers = [self.get_container_by_name(container_name)] if container_name \
-            else self.containers
-        if len(containers) > 1:
-            raise ProjectError(
-                'This action requires a container name to be specified because {count} '
-                'containers are defined in this project.'.format(count=len(self.containers)))
+        containers = [self._get_shell_container(container_name)]
         for container in self._containers_generator(containers=containers):
             container.shell(**kwargs)
 
+    def get_shell_command(self, container_name=None, **kwargs):
+        """ Returns the command that opens a new shell in our first container. """
+        containers = [self._get_shell_container(container_name)]
+        for container in self._containers_generator(containers=containers):
+            return container.get_shell_command(**kwargs)
+
     def status(self, container_names=None):
         """ Shows the statuses of the containers of the project. """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
+        self.refresh_state(containers)
         max_name_length = max(len(c.name) for c in containers)
         logger.info('Current container states:')
         for container in containers:
             logger.info('{container_name} ({status})'.format(
                 container_name=container.name.ljust(max_name_length + 10), status=container.status))
 
-    def up(self, container_names=None, provisioning_mode=None):
-        """ Creates, starts and provisions the containers of the project. """
-        containers = [self.get_container_by_name(name) for name in container_names] \
-            if container_names else self.containers
+    @traced('action')
+    def up(self, container_names=None, provisioning_mode=None, parallelism=None):
+        """ Creates, starts and provisions the containers of the project.
+
+        Containers are brought up using at most `parallelism` threads (the `parallelism` value of
+        the project is used if not specified). A container is brought up as soon as all the
+        containers it depends on are up. A failure on one container does not prevent the
+        other containers from being brought up: a summary is displayed at the end and a
+        `ProjectError` is raised if some containers could not be brought up. The containers that
+        the specified containers depend on (directly or not) are brought up as well.
+        """
+        dependencies = self.dependencies
+        containers = self.containers
+        if container_names:
+            selected = {self.get_container_by_name(name) for name in container_names}
+            selected.update(get_dependencies(dependencies, selected))
+            containers = [c for c in containers if c in selected]
+        self.refresh_state(containers)
         not_running = [c for c in containers if not c.is_running]
         if not not_running:
             logger.warning("Everything is already up and running! Nothing to do.")
             return
         [logger.info('Bringing container "{}" up'.format(c.name)) for c in not_running]
-        for container in self._containers_generator(containers=not_running):
-            container.up()
-        self._update_guest_etchosts()
 
-        # Provisions the container if applicable; that is only if it hasn't been provisioned before
-        # or if the provisioning is manually enabled.
+        # The images of the containers that must be created are downloaded beforehand. If an image
+        # cannot be downloaded the error will be reported when creating the related containers.
+        for image, error in self._pull_images([c for c in not_running if not c.exists]).items():
+            logger.warning('Unable to pull image {image}: {error}'.format(
+                image=_format_image(*image), error=format_error(error)))
+
+        # Containers that must be created and that are identical to other containers that must be
+        # created are copied from these containers once they have been locally provisioned.
         provisioning_mode = provisioning_mode or constants.ProvisioningMode.AUTO
-        if not provisioning_mode == constants.ProvisioningMode.DISABLED:
-            force = provisioning_mode == constants.ProvisioningMode.ENABLED
-            self.provision(container_names=[c.name for c in not_running], force=force)
+        copies = self._get_copies(not_running, dependencies) \
+            if provisioning_mode == constants.ProvisioningMode.AUTO else {}
+        copied = set(copies.values())
+
+        def up(container):
+            if container in copies:
+                with timed('copy', container.name):
+                    container.create_as_copy(copies[container])
+            container.up()
+            if container in copied:
+                container.provision(force=False)
+
+        # The state of LXDock (provisioning fingerprints, ...) is stored in the config of each
+        # container using a single request at the end.
+        with self._deferred_config_updates(not_running):
+            results = run_concurrently(
+                up, not_running, max_workers=parallelism or self.parallelism,
+                dependencies=dependencies)
+            self._update_guest_etchosts()
+
+            # Provisions the container if applicable; that is only if it hasn't been provisioned
+            # before or if the provisioning is manually enabled. Containers that failed to come up
+            # are not provisioned.
+            started = [c for c, error in results.items() if error is None]
+            if not provisioning_mode == constants.ProvisioningMode.DISABLED:
+                force = provisioning_mode == constants.ProvisioningMode.ENABLED
+                to_provision = started if force else [c for c in started if not c.is_provisioned]
+                if to_provision:
+                    self.provision(container_names=[c.name for c in to_provision], force=force)
+
+        self._report_results(results)
 
     ##################################
     # UTILITY METHODS AND PROPERTIES #
     ##################################
 
+    @property
+    def dependencies(self):
+        """ Returns a dictionary associating each container with the containers it depends on. """
+        return {
+            container: [self.get_container_by_name(name)
+                        for name in container.options.get('depends_on', [])]
+            for container in self.containers
+        }
+
     def get_container_by_name(self, name):
         """ Returns the `Container` instance associated with the given name. """
         containers_dict = {c.name: c for c in self.containers}
@@ -139,6 +227,23 @@ class Project:
             'The container with the name "{name}" was not '
             'found for this project.'.format(name=name))
 
+    def refresh_state(self, containers=None):
+        """ Fetches the state of the containers of the project using a filtered listing of LXD.
+
+        The fetched state is then used by the considered containers instead of requesting LXD for
+        each of them (see `get_containers`). Only the containers whose state is unknown or outdated
+        are fetched: the state of the other ones is kept up-to-date by LXDock itself (or by the
+        LXDock daemon using the LXD events stream).
+        """
+        containers = self.containers if containers is None else containers
+        containers = [c for c in containers if not c.is_state_known]
+        if not containers:
+            return
+        with timed('refresh_state'):
+            lxd_containers = get_containers(self.client, names=[c.lxd_name for c in containers])
+        for container in containers:
+            container.set_lxd_container(lxd_containers.get(container.lxd_name))
+
     ##################################
     # PRIVATE METHODS AND PROPERTIES #
     ##################################
@@ -146,25 +251,209 @@ class Project:
     def _containers_generator(self, containers=None):
         containers = containers or self.containers
         for container in containers:
-            console_stdout_handler.setFormatter(get_per_container_formatter(container.name))
-            console_stderr_handler.setFormatter(get_per_container_formatter(container.name))
-            yield container
-        console_stdout_handler.setFormatter(get_default_formatter())
-        console_stderr_handler.setFormatter(get_default_formatter())
+            with container_logging_context(container.name):
+                yield container
+
+    @contextmanager
+    def _deferred_config_updates(self, containers):
+        """ Defers the config changes of the containers until the end of the block.
+
+        The deferred changes of each container are then applied using a single request, even if an
+        error occurred (see `Container.defer_config_updates`). The changes of the containers that
+        are already deferred by an enclosing block are left to this block.
+        """
+        containers = [c for c in containers if c.defer_config_updates()]
+        try:
+            yield
+        finally:
+            if containers:
+                results = run_concurrently(
+                    lambda container: container.flush_config(), containers,
+                    max_workers=len(containers))
+                for container, error in results.items():
+                    if error is not None:
+                        logger.warning('Unable to update the config of container {name}: '
+                                       '{error}'.format(name=container.name,
+                                                        error=format_error(error)))
+
+    def _get_copies(self, containers, dependencies):
+        """ Returns a dictionary associating containers with the containers they can be copied from.
+
+        Only containers that don't exist yet and that define local provisioning steps are
+        considered: the first container of each set of identical containers is created and
+        provisioned normally while the other ones are copied from it. `dependencies` is updated
+        in order to ensure that copies are created after the containers they are copied from.
+        """
+        identical_containers = collections.OrderedDict()
+        for container in containers:
+            if container.exists or not container.options.get('provisioning') \
+                    or not container.options.get('copy_identical_containers', True):
+                continue
+            identical_containers.setdefault(
+                container.get_definition_fingerprint(), []).append(container)
+
+        copies = {}
+        for source, *others in identical_containers.values():
+            for container in others:
+                graph = dict(dependencies)
+                graph[container] = dependencies.get(container, []) + [source, ]
+                if find_cycle(graph):
+                    # The source container depends on this container.
+                    continue
+                dependencies[container] = graph[container]
+                copies[container] = source
+        return copies
+
+    def _get_shell_container(self, container_name=None):
+        """ Returns the container in which a shell should be opened. """
+        containers = [self.get_container_by_name(container_name)] if container_name \
+            else self.containers
+        if len(containers) > 1:
+            raise ProjectError(
+                'This action requires a container name to be specified because {count} '
+                'containers are defined in this project.'.format(count=len(self.containers)))
+        return containers[0]
+
+    def _provision(self, containers, force):
+        """ Provisions the considered containers (see `provision`). """
+        # This happens in two phases: local provisioning, then global provisioning.
+        # Local provisioning is the provisioning that is declared directly in the
+        # `containers` config section. Global provisioning is declared at the root
+        # of the config.
+        for container in self._containers_generator(containers=containers):
+            container.provision(force=force)
+
+        host = Host.get()
+        if not containers:
+            return
+
+        # The guests that were already detected for the containers are reused.
+        guests = [c._guest for c in containers]
+        for i, provisioning_item in enumerate(self.provisioning_steps):
+            provisioning_type = provisioning_item['type'].lower()
+            provisioner_class = Provisioner.provisioners.get(provisioning_type)
+            if provisioner_class is None:
+                continue
+            fingerprint = provisioner_class(
+                self.homedir, host, guests, provisioning_item).get_fingerprint()
+            step_containers = [
+                c for c in containers
+                if force or c.get_provisioning_fingerprint('global', i) != fingerprint]
+            if not step_containers:
+                logger.info('Global provisioning with {0} is unchanged, skipping'.format(
+                    provisioning_type))
+                continue
+            provisioner = provisioner_class(
+                self.homedir, host, [c._guest for c in step_containers], provisioning_item)
+            logger.info('Global provisioning with {0}'.format(provisioner.name))
+            with timed('provision.global[{}]: {}'.format(i, provisioner.name)):
+                provisioner.provision()
+            for container in step_containers:
+                container.set_provisioning_fingerprint('global', i, fingerprint)
+        for container in containers:
+            container.update_config(config={'user.lxdock.provisioned': 'true'}, deferred=True)
+
+    def _pull_images(self, containers, auto_update=False):
+        """ Downloads the distinct images of the considered containers concurrently.
+
+        The fingerprints of the downloaded images are associated with the containers. A dictionary
+        associating the images that could not be downloaded (as `(remote, alias)` tuples, the
+        remote being empty for local images) with the related exceptions is returned.
+        """
+        containers_by_source = collections.OrderedDict()
+        for container in containers:
+            source = container.image_source
+            key = (source['alias'], source['mode'], source['protocol'], source['server'], )
+            containers_by_source.setdefault(key, []).append(container)
+
+        def pull(key):
+            logger.info('Pulling image {alias}...'.format(alias=key[0]))
+            source = containers_by_source[key][0].image_source
+            with timed('pull_image: {}'.format(key[0])):
+                fingerprint = pull_image(self.client, source, auto_update=auto_update)
+            for container in containers_by_source[key]:
+                container.set_image_fingerprint(fingerprint)
+
+        results = run_concurrently(
+            pull, list(containers_by_source), max_workers=self._image_pull_workers,
+            get_name=lambda key: key[0])
+        return collections.OrderedDict(
+            ((key[3], key[0]), error) for key, error in results.items() if error is not None)
+
+    def _report_results(self, results):
+        """ Displays a per-container summary of an action and raises an error if it failed. """
+        # The state of the containers for which the action failed is unknown at this point.
+        for container, error in results.items():
+            if error is not None:
+                container.unset_lxd_container()
+
+        if len(results) > 1:
+            logger.info('Summary:')
+            max_name_length = max(len(c.name) for c in results)
+            for container, error in results.items():
+                line = '{container_name} {result}'.format(
+                    container_name=container.name.ljust(max_name_length + 10),
+                    result='failed: {}'.format(format_error(error)) if error else 'ok')
+                (logger.error if error else logger.info)(line)
+
+        failed = ['{name} ({error})'.format(name=c.name, error=format_error(error))
+                  for c, error in results.items() if error is not None]
+        if failed:
+            raise ProjectError('The following containers failed: {}'.format(', '.join(failed)))
 
     def _update_guest_etchosts(self):
         """ Updates /etc/hosts on **all** running lxdock-managed containers.
 
         ... even those outside the current project. This way, containers can contact themselves
         using the same domain names the host uses.
+
+        The fingerprint of the bindings written to each container is stored in its config so that
+        containers whose LXDock section is already up-to-date are skipped without reading their
+        /etc/hosts file. The remaining containers are updated concurrently.
         """
-        def should_update(c):
-            return c.config.get('user.lxdock.made') and c.status_code == constants.CONTAINER_RUNNING
         # At this point, our host's /etc/hosts is fully updated. No need to go fetch IP's and stuff
         # we can just re-use what we've already computed in every container up/halt ops before.
-        etchosts = EtcHosts()
-        containers = (c for c in self.client.containers.all() if should_update(c))
-        for container in containers:
-            container_etchosts = ContainerEtcHosts(container)
-            container_etchosts.lxdock_bindings = etchosts.lxdock_bindings
-            container_etchosts.save()
+        with EtcHosts.lock:
+            bindings = EtcHosts().lxdock_bindings
+        fingerprint = get_bindings_fingerprint(bindings)
+        fingerprint_key = ContainerEtcHosts.fingerprint_config_key
+
+        def should_update(c):
+            return c.config.get('user.lxdock.made') \
+                and c.status_code == constants.CONTAINER_RUNNING \
+                and c.config.get(fingerprint_key) != fingerprint
+
+        # PyLXD models are not hashable so containers are processed using their names.
+        with timed('update_guest_etchosts'):
+            lxd_containers = get_containers(self.client)
+            # The fetched PyLXD instances hold the latest state of the containers of the project.
+            containers = {c.lxd_name: c for c in self.containers}
+            for name, container in containers.items():
+                container.set_lxd_container(lxd_containers.get(name))
+
+            def update(name):
+                container_etchosts = ContainerEtcHosts(lxd_containers[name])
+                container_etchosts.ensure_bindings(bindings)
+                if container_etchosts.changed:
+                    logger.debug('Updating /etc/hosts')
+                    container_etchosts.save()
+                # The fingerprint is stored along with the other changes of the containers of the
+                # project if their changes are deferred.
+                if name in containers:
+                    containers[name].update_config(
+                        config={fingerprint_key: fingerprint}, deferred=True)
+                else:
+                    update_container(lxd_containers[name], config={fingerprint_key: fingerprint})
+
+            results = run_concurrently(
+                update, [name for name, c in lxd_containers.items() if should_update(c)],
+                max_workers=self._etchosts_update_workers, get_name=lambda name: name)
+        for name, error in results.items():
+            if error is not None:
+                logger.warning('Unable to update /etc/hosts of container {name}: {error}'.format(
+                    name=name, error=format_error(error)))
+
+
+def _format_image(remote, alias):
+    """ Returns a readable name of an image identified by its remote and its alias. """
+    return '{alias} from {remote}'.format(alias=alias, remote=remote) if remote else alias
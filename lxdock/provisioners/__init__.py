@@ -3,9 +3,22 @@
     ======================
     This package contains provisioner definitions. Provisioners are used to perform to provision the
     containers using provisioning tools (eg. Ansible).
+
+    Provisioners are imported when they are first used (eg. through `Provisioner.provisioners`).
 """
 
-from .ansible import *  # noqa
+import sys
+
+from ..utils.plugins import LazyModule
 from .base import *  # noqa
-from .puppet import *  # noqa
-from .shell import *  # noqa
+
+
+class _ProvisionersModule(LazyModule):
+    lazy_attributes = {
+        'AnsibleProvisioner': '.ansible',
+        'PuppetProvisioner': '.puppet',
+        'ShellProvisioner': '.shell',
+    }
+
+
+sys.modules[__name__].__class__ = _ProvisionersModule
@@ -1,4 +1,5 @@
 import logging
+import os
 import tempfile
 
 from voluptuous import Extra, IsFile, Required
@@ -14,6 +15,11 @@ class AnsibleProvisioner(Provisioner):
     """ Allows to perform provisioning operations using Ansible. """
 
     name = 'ansible'
+    path_options = ('playbook', 'vault_password_file', )
+
+    # The files and directories living next to playbooks that can alter their results.
+    playbook_sibling_paths = (
+        'ansible.cfg', 'files', 'group_vars', 'host_vars', 'roles', 'templates', 'vars', )
 
     guest_required_packages_alpine = ['python', ]
     guest_required_packages_arch = ['python', ]
@@ -51,6 +57,14 @@ class AnsibleProvisioner(Provisioner):
         groups_lines = '\n\n'.join(fmtgroup(key, val) for key, val in groups.items())
         return '\n\n'.join([all_hosts_lines, groups_lines])
 
+    def get_fingerprint_paths(self):
+        # Playbooks usually rely on other files (roles, variables, templates, ...) that live next to
+        # them. Only these files are considered: the directory of the playbook is often the root of
+        # the project.
+        paths = super().get_fingerprint_paths()
+        playbook_dir = os.path.dirname(paths[0])
+        return paths + [os.path.join(playbook_dir, path) for path in self.playbook_sibling_paths]
+
     def provision(self):
         """ Performs the provisioning operations using ansible-playbook. """
         self.setup()
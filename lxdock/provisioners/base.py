@@ -8,7 +8,12 @@
 import logging
 import os
 
+from ..exceptions import ProvisionFailed
+from ..tracing import span
+from ..utils.concurrency import format_error, run_concurrently
+from ..utils.fingerprint import fingerprint_data, fingerprint_paths
 from ..utils.metaclass import with_metaclass
+from ..utils.plugins import PluginRegistry
 
 
 __all__ = ['Provisioner', ]
@@ -16,6 +21,15 @@ __all__ = ['Provisioner', ]
 logger = logging.getLogger(__name__)
 
 
+# The provisioners that are part of LXDock and the modules defining them. Third-party provisioners
+# can be provided using entry points of the "lxdock.provisioners" group.
+BUILTIN_PROVISIONERS = (
+    ('ansible', 'lxdock.provisioners.ansible'),
+    ('puppet', 'lxdock.provisioners.puppet'),
+    ('shell', 'lxdock.provisioners.shell'),
+)
+
+
 class InvalidProvisioner(Exception):
     """ The `Provisioner` subclass is not valid. """
 
@@ -55,14 +69,14 @@ class _ProvisionerBase(type):
         # We implement the "mount point" paradigm here in order to make all `Provisioner`
         # subclassses available in a single attribute.
         if not hasattr(cls, 'provisioners'):
-            # The class has no provisioners dict: this means that we are considering the
-            # "plugin mount" class. So we created the dict that will hold all the defined
-            # `Provisioner` subclasses.
-            cls.provisioners = {}
+            # The class has no provisioners registry: this means that we are considering the
+            # "plugin mount" class. So we created the registry that will hold all the defined
+            # `Provisioner` subclasses. The modules defining them are imported on demand.
+            cls.provisioners = PluginRegistry(BUILTIN_PROVISIONERS, 'lxdock.provisioners')
         else:
             # The `provisioners` attribute already exists so we are considering a `Provisioner`
             # subclass, which needs to be registered.
-            cls.provisioners.update({cls.name.lower(): cls})
+            cls.provisioners.register(cls.name.lower(), cls)
 
 
 class Provisioner(with_metaclass(_ProvisionerBase)):
@@ -90,6 +104,14 @@ class Provisioner(with_metaclass(_ProvisionerBase)):
     #
     # These packages will be installed during the "provision" operation.
 
+    # The names of the options that reference files or directories on the host (eg. scripts,
+    # playbooks, ...). The contents of these files are part of the fingerprint of the provisioner.
+    path_options = ()
+
+    # The names of the options that don't affect the result of the provisioning operations and that
+    # are not part of the fingerprint of the provisioner.
+    fingerprint_excluded_options = ('parallel', 'max_parallel', )
+
     def __init__(self, homedir, host, guests, options):
         self.homedir = homedir
         self.host = host
@@ -101,8 +123,7 @@ class Provisioner(with_metaclass(_ProvisionerBase)):
         # This method should be overriden in `Provisioner` subclasses that implement global
         # provisioning.
         self.setup()
-        for guest in self.guests:
-            self.provision_single(guest)
+        self.run_on_guests(self.provision_single, self.guests)
 
     def provision_single(self, guest):
         """ Performs the provisioning operations on the specified guest. """
@@ -110,9 +131,8 @@ class Provisioner(with_metaclass(_ProvisionerBase)):
         # global provisioning.
 
     def setup(self):
-        for guest in self.guests:
-            if not guest.container.is_provisioned:
-                self.setup_single(guest)
+        self.run_on_guests(
+            self.setup_single, [g for g in self.guests if not g.container.is_provisioned])
 
     def setup_single(self, guest):
         """ Setups the guest to run the provisioner if applicable. """
@@ -135,10 +155,72 @@ class Provisioner(with_metaclass(_ProvisionerBase)):
         if guest_setup_method is not None:
             guest_setup_method(guest)
 
+    @classmethod
+    def get_validated_paths(cls, options):
+        """ Returns the paths whose existence is checked when the options are validated.
+
+        The returned paths are relative to the home directory of the project.
+        """
+        return [options[option] for option in cls.path_options if options.get(option) is not None]
+
     ##################
     # HELPER METHODS #
     ##################
 
+    def get_fingerprint(self):
+        """ Returns a fingerprint identifying the provisioning operations to perform.
+
+        This fingerprint is computed using the options of the provisioner and the contents of the
+        files they reference. It changes if anything that could alter the result of the
+        provisioning operations changes.
+        """
+        options = {k: v for k, v in self.options.items()
+                   if k not in self.fingerprint_excluded_options}
+        # The paths are fingerprinted relative to the home directory so that the fingerprint is the
+        # same for all the copies of a project.
+        paths_fingerprint = fingerprint_paths(self.get_fingerprint_paths(), self.homedir)
+        return fingerprint_data([options, paths_fingerprint])
+
+    def get_fingerprint_paths(self):
+        """ Returns the paths of the host files or directories used by the provisioner. """
+        return [self.homedir_expanded_path(self.options[option])
+                for option in self.path_options if self.options.get(option) is not None]
+
     def homedir_expanded_path(self, path):
         """ Expands the considered path with the path of the home homedir if applicable. """
         return os.path.join(self.homedir, path)
+
+    def run_on_guests(self, func, guests):
+        """ Runs `func` on each of the considered guests.
+
+        Guests are processed one after another unless the `parallel` or `max_parallel` options are
+        set. In that case, guests are processed concurrently and all of them are processed even if
+        some of them fail; a `ProvisionFailed` error naming the failed guests is raised at the end.
+        """
+        max_parallel = self.options.get('max_parallel') or \
+            (len(guests) if self.options.get('parallel') else 1)
+        func = self._traced_guest_operation(func)
+        if max_parallel <= 1:
+            for guest in guests:
+                func(guest)
+            return
+
+        results = run_concurrently(
+            func, guests, max_workers=max_parallel, get_name=lambda guest: guest.container.name)
+        failed = ['{name} ({error})'.format(name=guest.container.name, error=format_error(error))
+                  for guest, error in results.items() if error is not None]
+        if failed:
+            raise ProvisionFailed('Provisioning with {} failed on: {}'.format(
+                self.name, ', '.join(failed)))
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _traced_guest_operation(self, func):
+        """ Returns a function recording the calls of `func` on guests as spans. """
+        def wrapper(guest):
+            with span('{}: {}'.format(self.name, func.__name__), 'provisioner',
+                      guest.container.name):
+                return func(guest)
+        return wrapper
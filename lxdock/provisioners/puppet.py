@@ -54,6 +54,8 @@ class PuppetProvisioner(Provisioner):
     """ Allows to perform provisioning operations using Puppet. """
 
     name = 'puppet'
+    path_options = (
+        'manifests_path', 'module_path', 'hiera_config_path', 'environment_path', )
 
     guest_required_packages_arch = ['puppet']
     guest_required_packages_debian = ['puppet']
@@ -81,6 +83,16 @@ class PuppetProvisioner(Provisioner):
     _guest_environment_path = '/.lxdock.d/puppet/environments'
     _guest_hiera_file = '/.lxdock.d/puppet/hiera.yaml'
 
+    @classmethod
+    def get_validated_paths(cls, options):
+        paths = super().get_validated_paths(options)
+        # The manifest file or the environment directory is checked by `validate_paths`.
+        if options.get('manifests_path') is not None:
+            paths.append(str(Path(options['manifests_path']) / options['manifest_file']))
+        elif options.get('environment_path') is not None:
+            paths.append(str(Path(options['environment_path']) / options['environment']))
+        return paths
+
     def provision_single(self, guest):
         """ Performs the provisioning operations using puppet. """
         # Verify if `puppet` has been installed.
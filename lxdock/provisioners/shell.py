@@ -9,6 +9,7 @@ class ShellProvisioner(Provisioner):
     """ Allows to perform provisioning shell operations on the host/guest sides. """
 
     name = 'shell'
+    path_options = ('script', )
     schema = {
         Exclusive('inline', 'shelltype'): str,
         Exclusive('script', 'shelltype'): IsFile(),
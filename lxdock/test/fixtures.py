@@ -14,7 +14,7 @@ from ..container import Container
 
 
 __all__ = [
-    'persistent_container', 'remove_persistent_container',
+    'fake_lxd_server', 'persistent_container', 'remove_persistent_container',
 ]
 
 
@@ -23,6 +23,20 @@ THIS_DIR = os.path.join(os.path.dirname(__file__))
 _persistent_container = None
 
 
+@pytest.fixture
+def fake_lxd_server(monkeypatch):
+    """ Returns a running `lxdock.test.server.FakeLXDServer` instance.
+
+    The ``LXD_DIR`` environment variable points to the directory of the server during the test so
+    that the clients returned by `lxdock.client.get_client` talk to it.
+    """
+    # The server module is imported lazily so that it can be run using "python -m".
+    from .server import FakeLXDServer
+    with FakeLXDServer() as server:
+        monkeypatch.setenv('LXD_DIR', server.lxd_dir)
+        yield server
+
+
 @pytest.fixture
 def persistent_container():
     """ Returns a persistent `lxdock.container.Container` instance.
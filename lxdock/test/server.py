@@ -0,0 +1,1084 @@
+"""
+    Fake LXD server
+    ===============
+    This module provides a fake LXD daemon that keeps its state in memory and that speaks the subset
+    of the LXD REST API used by LXDock (containers, snapshots, state, files, exec websockets,
+    images, operations and events) over a unix socket. It allows to run LXDock against hundreds of
+    containers without LXD, for example to test or benchmark `Project` operations:
+
+    .. code-block:: python
+
+        with FakeLXDServer(operation_latency=0.05) as server:
+            os.environ['LXD_DIR'] = server.lxd_dir  # get_client() now talks to the fake server
+            ...
+
+    Latencies can be configured for all the requests (`latency`), for the asynchronous operations
+    (`operation_latency`, `operation_latencies`) and for the assignment of IP addresses to started
+    containers (`ip_delay`). Failures can be injected for specific actions, either randomly
+    (`failures`) or deterministically (`fail_next`). Commands executed in containers are handled by
+    `exec_handler`, which returns the exit code and the outputs of the command.
+
+    The server can also be run as a standalone process::
+
+        $ python -m lxdock.test.server --lxd-dir /tmp/fakelxd --operation-latency 0.1
+        $ LXD_DIR=/tmp/fakelxd lxdock up
+"""
+
+import argparse
+import base64
+import collections
+import copy
+import datetime
+import hashlib
+import http.server
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+from .. import constants
+
+
+__all__ = ['FakeLXDServer', 'default_exec_handler', ]
+
+
+# The actions that can be delayed (see `operation_latencies`) or that can fail (see `failures` and
+# `fail_next`).
+ACTIONS = (
+    'container_create', 'container_update', 'container_delete', 'container_start',
+    'container_stop', 'container_restart', 'container_freeze', 'container_unfreeze', 'exec',
+    'file_get', 'file_put', 'file_delete', 'snapshot_create', 'snapshot_delete', 'image_pull',
+    'image_publish', 'image_delete', 'alias_create', 'alias_delete',
+)
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPERATION_RUNNING = 103
+OPERATION_SUCCESS = 200
+OPERATION_FAILURE = 400
+
+
+class _APIError(Exception):
+    """ Error that is reported to the client using a LXD error response. """
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class _InjectedFailure(_APIError):
+    def __init__(self, action):
+        super().__init__('Injected failure ({})'.format(action), code=500)
+
+
+def default_exec_handler(container, command, environment):
+    """ Handles the commands executed in the containers of the fake server.
+
+    :param container: dictionary holding the state of the container (see `FakeLXDServer`)
+    :param command: the executed command (list of strings)
+    :param environment: the environment variables of the command (dictionary)
+    :return: a tuple containing the exit code of the command and its stdout and stderr outputs
+        (bytes)
+    """
+    if command[:2] in (['id', '-u'], ['id', '-g']) and len(command) == 3:
+        return 0, b'0\n' if command[2] == 'root' else b'1000\n', b''
+    return 0, b'', b''
+
+
+class FakeLXDServer:
+    """ In-memory LXD daemon listening on `<lxd_dir>/unix.socket`.
+
+    The state of the server is exposed by the `containers`, `images`, `aliases` and `operations`
+    dictionaries. The number of requests handled for each action is available in `requests`.
+    """
+
+    # The API extensions advertised by the server. "api_filtering" can be removed in order to
+    # emulate LXD versions that don't support filtering listings.
+    default_api_extensions = (
+        'api_filtering', 'container_exec_recording', 'file_delete', 'image_aliases', )
+
+    def __init__(self, lxd_dir=None, latency=0, operation_latency=0, operation_latencies=None,
+                 ip_delay=0, failures=None, seed=None, exec_handler=None, api_extensions=None):
+        self.lxd_dir = lxd_dir
+        self.api_extensions = list(
+            self.default_api_extensions if api_extensions is None else api_extensions)
+        self.latency = latency
+        self.operation_latency = operation_latency
+        self.operation_latencies = dict(operation_latencies or {})
+        self.ip_delay = ip_delay
+        self.failures = dict(failures or {})
+        self.exec_handler = exec_handler or default_exec_handler
+
+        self.containers = collections.OrderedDict()
+        self.images = collections.OrderedDict()
+        self.aliases = collections.OrderedDict()
+        self.operations = collections.OrderedDict()
+        self.requests = collections.Counter()
+
+        self.lock = threading.RLock()
+        self._random = random.Random(seed)
+        self._fail_next = collections.Counter()
+        self._event_queues = []
+        self._ip_counter = 0
+        self._server = None
+        self._thread = None
+        self._tmpdir = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def socket_path(self):
+        return os.path.join(self.lxd_dir, 'unix.socket')
+
+    def start(self):
+        """ Starts listening on the unix socket of the server (in a background thread). """
+        if self.lxd_dir is None:
+            self._tmpdir = self.lxd_dir = tempfile.mkdtemp(prefix='fakelxd-')
+        os.makedirs(self.lxd_dir, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixHTTPServer(self.socket_path, _RequestHandler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the server and removes its unix socket. """
+        if self._server is None:
+            return
+        with self.lock:
+            for event_queue in self._event_queues:
+                event_queue.put(None)
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = self._thread = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = self.lxd_dir = None
+
+    def add_image(self, alias, os_name=None, release=None):
+        """ Adds a local image and returns its fingerprint. """
+        distribution = alias.split('/')
+        with self.lock:
+            image = self._create_image(
+                os_name or distribution[0], release or (distribution[1:] or [''])[0])
+            self._add_alias(alias, image['fingerprint'])
+        return image['fingerprint']
+
+    def fail_next(self, action, count=1):
+        """ Makes the next `count` requests or operations for the considered action fail. """
+        with self.lock:
+            self._fail_next[action] += count
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _check_failure(self, action):
+        with self.lock:
+            self.requests[action] += 1
+            if self._fail_next[action]:
+                self._fail_next[action] -= 1
+                raise _InjectedFailure(action)
+            if self.failures.get(action) and self._random.random() < self.failures[action]:
+                raise _InjectedFailure(action)
+
+    def _emit_event(self, event_type, metadata):
+        event = {'type': event_type, 'timestamp': _now(), 'metadata': metadata, }
+        with self.lock:
+            for event_queue in self._event_queues:
+                event_queue.put(event)
+
+    # Containers
+
+    def _get_container(self, name):
+        try:
+            return self.containers[name]
+        except KeyError:
+            raise _APIError('not found', code=404)
+
+    def _container_metadata(self, container, recursion=1):
+        metadata = {k: copy.deepcopy(v) for k, v in container.items() if not k.startswith('_')}
+        metadata['expanded_config'] = dict(container['config'])
+        metadata['expanded_devices'] = dict(container['devices'])
+        metadata['expanded_devices'].setdefault(
+            'eth0', {'name': 'eth0', 'nictype': 'bridged', 'parent': 'lxdbr0', 'type': 'nic'})
+        metadata['expanded_devices'].setdefault('root', {'path': '/', 'type': 'disk'})
+        if recursion > 1:
+            metadata['state'] = self._container_state(container)
+            metadata['snapshots'] = [self._snapshot_metadata(s)
+                                     for s in container['_snapshots'].values()]
+        return metadata
+
+    def _container_state(self, container):
+        running = container['status_code'] == constants.CONTAINER_RUNNING
+        network = None
+        if running:
+            addresses = [{'family': 'inet6', 'address': 'fe80::1', 'netmask': '64',
+                          'scope': 'link'}]
+            if time.monotonic() >= container['_ip_available_at']:
+                addresses.insert(0, {'family': 'inet', 'address': container['_ip'],
+                                     'netmask': '24', 'scope': 'global'})
+            network = {
+                'eth0': {'addresses': addresses, 'counters': {}, 'host_name': 'veth0',
+                         'hwaddr': '00:16:3e:00:00:00', 'mtu': 1500, 'state': 'up',
+                         'type': 'broadcast'},
+                'lo': {'addresses': [{'family': 'inet', 'address': '127.0.0.1', 'netmask': '8',
+                                      'scope': 'local'}],
+                       'counters': {}, 'host_name': '', 'hwaddr': '', 'mtu': 65536,
+                       'state': 'up', 'type': 'loopback'},
+            }
+        return {
+            'status': container['status'], 'status_code': container['status_code'],
+            'cpu': {'usage': 0}, 'disk': {}, 'memory': {'usage': 0, 'usage_peak': 0},
+            'network': network, 'pid': 1000 if running else 0, 'processes': 1 if running else 0,
+        }
+
+    def _create_container(self, config):
+        name = config.get('name')
+        if not name:
+            raise _APIError('missing container name')
+        if name in self.containers:
+            raise _APIError('container "{}" already exists'.format(name), code=409)
+        source = config.get('source') or {'type': 'none'}
+        files = {}
+        container_config = {}
+        devices = {}
+        if source['type'] == 'image':
+            image = self._find_source_image(source)
+            files = copy.deepcopy(image['_files'])
+            container_config.update({
+                'image.os': image['properties'].get('os', ''),
+                'image.release': image['properties'].get('release', ''),
+                'volatile.base_image': image['fingerprint'],
+            })
+            image['last_used_at'] = _now()
+        elif source['type'] == 'copy':
+            container_name, _, snapshot_name = source['source'].partition('/')
+            origin = self._get_container(container_name)
+            if snapshot_name:
+                origin = self._get_snapshot(origin, snapshot_name)
+            files = copy.deepcopy(origin['_files'])
+            container_config.update(
+                {k: v for k, v in origin['config'].items() if not k.startswith('volatile.')
+                 or k == 'volatile.base_image'})
+            devices.update(copy.deepcopy(origin['devices']))
+        elif source['type'] != 'none':
+            raise _APIError('unsupported source type: {}'.format(source['type']))
+        container_config.update(config.get('config') or {})
+        devices.update(config.get('devices') or {})
+        self.containers[name] = {
+            'architecture': 'x86_64',
+            'config': container_config,
+            'created_at': _now(),
+            'description': config.get('description', ''),
+            'devices': devices,
+            'ephemeral': bool(config.get('ephemeral', False)),
+            'last_used_at': _now(),
+            'location': 'none',
+            'name': name,
+            'profiles': config.get('profiles') or ['default'],
+            'stateful': False,
+            'status': 'Stopped',
+            'status_code': constants.CONTAINER_STOPPED,
+            '_files': files,
+            '_ip': None,
+            '_ip_available_at': 0,
+            '_snapshots': collections.OrderedDict(),
+        }
+        self._emit_event('lifecycle', {'action': 'container-created',
+                                       'source': '/1.0/containers/{}'.format(name)})
+
+    def _set_container_state(self, container, action):
+        if action in ('start', 'restart', 'unfreeze'):
+            if container['_ip'] is None:
+                self._ip_counter += 1
+                container['_ip'] = '10.{}.{}.{}'.format(
+                    (self._ip_counter >> 16) & 255, (self._ip_counter >> 8) & 255,
+                    self._ip_counter & 255 or 1)
+            if container['status_code'] != constants.CONTAINER_RUNNING:
+                container['_ip_available_at'] = time.monotonic() + self.ip_delay
+            container['status'], container['status_code'] = \
+                'Running', constants.CONTAINER_RUNNING
+        elif action == 'stop':
+            container['status'], container['status_code'] = \
+                'Stopped', constants.CONTAINER_STOPPED
+        elif action == 'freeze':
+            container['status'], container['status_code'] = 'Frozen', 110
+        else:
+            raise _APIError('unknown action: {}'.format(action))
+        self._emit_event('lifecycle', {
+            'action': 'container-{}'.format(action),
+            'source': '/1.0/containers/{}'.format(container['name'])})
+
+    # Snapshots
+
+    def _get_snapshot(self, container, name):
+        try:
+            return container['_snapshots'][name]
+        except KeyError:
+            raise _APIError('not found', code=404)
+
+    def _snapshot_metadata(self, snapshot):
+        return {k: copy.deepcopy(v) for k, v in snapshot.items() if not k.startswith('_')}
+
+    # Images
+
+    def _add_alias(self, name, fingerprint, description=''):
+        if name in self.aliases:
+            raise _APIError('alias "{}" already exists'.format(name), code=409)
+        self.aliases[name] = {'name': name, 'target': fingerprint, 'description': description,
+                              'type': 'container', }
+        self.images[fingerprint]['aliases'].append({'name': name, 'description': description})
+
+    def _create_image(self, os_name, release, files=None, properties=None, public=False):
+        fingerprint = hashlib.sha256(uuid.uuid4().bytes).hexdigest()
+        image_properties = {'os': os_name, 'release': release}
+        image_properties.update(properties or {})
+        if files is None:
+            files = {
+                '/etc/hosts': _file('127.0.0.1 localhost\n'),
+                '/etc/os-release': _file('ID={}\nVERSION_ID="{}"\n'.format(
+                    os_name.lower(), release)),
+            }
+        self.images[fingerprint] = {
+            'aliases': [],
+            'architecture': 'x86_64',
+            'auto_update': False,
+            'cached': False,
+            'created_at': _now(),
+            'expires_at': None,
+            'filename': '{}.tar.xz'.format(fingerprint[:12]),
+            'fingerprint': fingerprint,
+            'last_used_at': _now(),
+            'properties': image_properties,
+            'public': public,
+            'size': sum(len(f['content']) for f in files.values()) + 100 * 1024 * 1024,
+            'type': 'container',
+            'uploaded_at': _now(),
+            '_files': files,
+        }
+        return self.images[fingerprint]
+
+    def _find_source_image(self, source):
+        """ Returns the image referenced by the source of a container or a pull request. """
+        if source.get('fingerprint'):
+            fingerprints = [f for f in self.images if f.startswith(source['fingerprint'])]
+            if len(fingerprints) == 1:
+                return self.images[fingerprints[0]]
+            raise _APIError('image not found', code=404)
+        alias = source.get('alias')
+        if source.get('server'):
+            # Images of remote servers are always available: they are downloaded and cached.
+            key = (source['server'], alias)
+            for image in self.images.values():
+                if image.get('_remote') == key:
+                    return image
+            distribution = (alias or 'unknown').split('/')
+            image = self._create_image(distribution[0], (distribution[1:] or [''])[0])
+            image.update({'_remote': key, 'cached': True, })
+            return image
+        if alias in self.aliases:
+            return self.images[self.aliases[alias]['target']]
+        raise _APIError('image "{}" not found'.format(alias), code=404)
+
+    def _get_image(self, fingerprint):
+        try:
+            return self.images[fingerprint]
+        except KeyError:
+            raise _APIError('not found', code=404)
+
+    def _image_metadata(self, image):
+        return {k: copy.deepcopy(v) for k, v in image.items() if not k.startswith('_')}
+
+    # Operations
+
+    def _create_operation(self, action, func, resources=None, operation_class='task',
+                          metadata=None):
+        """ Creates an operation running `func` in the background and returns its metadata.
+
+        `func` is called with the operation dictionary and can return the metadata of the
+        operation. The state of the server is locked while `func` runs, unless it is an exec
+        operation.
+        """
+        operation = {
+            'class': operation_class,
+            'created_at': _now(),
+            'description': action.replace('_', ' ').capitalize(),
+            'err': '',
+            'id': str(uuid.uuid4()),
+            'location': 'none',
+            'may_cancel': False,
+            'metadata': metadata,
+            'resources': resources or {},
+            'status': 'Running',
+            'status_code': OPERATION_RUNNING,
+            'updated_at': _now(),
+            '_done': threading.Event(),
+        }
+        with self.lock:
+            self.operations[operation['id']] = operation
+
+        def run():
+            time.sleep(self.operation_latencies.get(action, self.operation_latency))
+            try:
+                if operation_class == 'websocket':
+                    result = func(operation)
+                else:
+                    with self.lock:
+                        self._check_failure(action)
+                        result = func(operation)
+            except _APIError as e:
+                operation.update({'status': 'Failure', 'status_code': OPERATION_FAILURE,
+                                  'err': e.message, })
+            else:
+                if result is not None:
+                    operation['metadata'] = result
+                operation.update({'status': 'Success', 'status_code': OPERATION_SUCCESS, })
+            operation['updated_at'] = _now()
+            operation['_done'].set()
+            self._emit_event('operation', self._operation_metadata(operation))
+
+        threading.Thread(target=run, daemon=True).start()
+        return operation
+
+    def _get_operation(self, operation_id):
+        try:
+            return self.operations[operation_id]
+        except KeyError:
+            raise _APIError('not found', code=404)
+
+    def _operation_metadata(self, operation):
+        return {k: v for k, v in operation.items() if not k.startswith('_')}
+
+    def _run_exec(self, container, request, operation, channels):
+        """ Runs a command once the websockets of its standard streams are connected. """
+        for fd in ('1', '2'):
+            channels[fd]['connected'].wait(10)
+        try:
+            with self.lock:
+                self._check_failure('exec')
+            code, stdout, stderr = self.exec_handler(
+                container, request.get('command', []), request.get('environment') or {})
+        except _InjectedFailure as e:
+            code, stdout, stderr = 1, b'', e.message.encode('utf-8')
+        for fd, data in (('1', stdout), ('2', stderr)):
+            channels[fd]['output'].put(data)
+        for fd in ('1', '2'):
+            if channels[fd]['connected'].is_set():
+                channels[fd]['finished'].wait(10)
+        return {'fds': operation['metadata']['fds'], 'return': code, }
+
+    # Requests
+
+    def handle(self, handler):
+        """ Handles a HTTP request and returns a tuple (status, headers, body). """
+        time.sleep(self.latency)
+        url = urlparse(handler.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        segments = [s for s in url.path.split('/') if s]
+        if not segments or segments[0] != '1.0':
+            return _error(_APIError('not found', code=404))
+        segments = segments[1:]
+        # Instances are containers for the fake server.
+        if segments and segments[0] == 'instances':
+            segments[0] = 'containers'
+        try:
+            if not segments:
+                return _sync(self._host_info())
+            elif segments[0] == 'containers':
+                return self._handle_containers(handler, segments[1:], params)
+            elif segments[0] == 'images':
+                return self._handle_images(handler, segments[1:], params)
+            elif segments[0] == 'operations':
+                return self._handle_operations(handler, segments[1:], params)
+            elif segments == ['events'] and handler.command == 'GET':
+                return self._handle_events(handler)
+            raise _APIError('not found', code=404)
+        except _APIError as e:
+            return _error(e)
+
+    def _host_info(self):
+        return {
+            'api_extensions': list(self.api_extensions),
+            'api_status': 'stable',
+            'api_version': '1.0',
+            'auth': 'trusted',
+            'auth_methods': ['tls'],
+            'config': {},
+            'environment': {
+                'addresses': [], 'architectures': ['x86_64'], 'driver': 'lxc',
+                'kernel': 'Linux', 'server': 'lxd', 'server_clustered': False,
+                'server_name': 'fakelxd', 'server_version': '3.0.0', 'storage': 'dir',
+            },
+            'public': False,
+        }
+
+    def _handle_containers(self, handler, segments, params):
+        method = handler.command
+        if not segments:
+            if method == 'GET':
+                recursion = _recursion(params)
+                with self.lock:
+                    containers = list(self.containers.values())
+                    if params.get('filter') and 'api_filtering' in self.api_extensions:
+                        names = _get_filtered_names(params['filter'])
+                        containers = [c for c in containers if c['name'] in names]
+                    if recursion:
+                        return _sync([self._container_metadata(c, recursion)
+                                      for c in containers])
+                return _sync(['/1.0/containers/{}'.format(c['name']) for c in containers])
+            elif method == 'POST':
+                config = handler.read_json()
+                name = config.get('name')
+                return _async(self._create_operation(
+                    'container_create', lambda op: self._create_container(config),
+                    resources={'containers': ['/1.0/containers/{}'.format(name)]}))
+            raise _APIError('method not allowed', code=405)
+
+        name = segments[0]
+        resources = {'containers': ['/1.0/containers/{}'.format(name)]}
+        with self.lock:
+            container = self._get_container(name)
+        action = segments[1] if len(segments) > 1 else None
+
+        if action is None:
+            if method == 'GET':
+                with self.lock:
+                    return _sync(self._container_metadata(container))
+            elif method in ('PUT', 'PATCH'):
+                data = handler.read_json()
+
+                def update(operation):
+                    for key in ('config', 'devices', 'ephemeral', 'profiles', 'description'):
+                        if key not in data:
+                            continue
+                        if method == 'PATCH' and isinstance(data[key], dict):
+                            container[key].update(data[key])
+                        else:
+                            container[key] = data[key]
+                    self._emit_event('lifecycle', {'action': 'container-updated',
+                                                   'source': resources['containers'][0]})
+
+                return _async(self._create_operation('container_update', update, resources))
+            elif method == 'DELETE':
+                def delete(operation):
+                    if container['status_code'] == constants.CONTAINER_RUNNING:
+                        raise _APIError('container is running')
+                    del self.containers[name]
+                    self._emit_event('lifecycle', {'action': 'container-deleted',
+                                                   'source': resources['containers'][0]})
+
+                return _async(self._create_operation('container_delete', delete, resources))
+        elif action == 'state':
+            if method == 'GET':
+                with self.lock:
+                    return _sync(self._container_state(container))
+            elif method == 'PUT':
+                state_action = handler.read_json().get('action')
+                return _async(self._create_operation(
+                    'container_{}'.format(state_action),
+                    lambda op: self._set_container_state(container, state_action), resources))
+        elif action == 'files':
+            return self._handle_files(handler, container, params)
+        elif action == 'exec' and method == 'POST':
+            return self._handle_exec(handler, container, resources)
+        elif action == 'snapshots':
+            return self._handle_snapshots(handler, container, segments[2:], params, resources)
+        raise _APIError('not found', code=404)
+
+    def _handle_events(self, handler):
+        event_queue = queue.Queue()
+        with self.lock:
+            self._event_queues.append(event_queue)
+        try:
+            websocket = handler.accept_websocket()
+            while True:
+                try:
+                    event = event_queue.get(timeout=1)
+                except queue.Empty:
+                    if websocket.is_closed():
+                        break
+                    continue
+                if event is None:
+                    break
+                websocket.send(json.dumps(event).encode('utf-8'), opcode=0x1)
+            websocket.close()
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self._event_queues.remove(event_queue)
+
+    def _handle_exec(self, handler, container, resources):
+        request = handler.read_json()
+        fds = {fd: uuid.uuid4().hex for fd in ('0', '1', '2', 'control')}
+        # The channels are created before the operation since it may start running immediately.
+        channels = {
+            fd: {'secret': secret, 'connected': threading.Event(), 'output': queue.Queue(),
+                 'finished': threading.Event()}
+            for fd, secret in fds.items()}
+
+        def run(operation):
+            return self._run_exec(container, request, operation, channels)
+
+        operation = self._create_operation(
+            'exec', run, resources, operation_class='websocket', metadata={'fds': fds})
+        operation['_channels'] = channels
+        return _async(operation)
+
+    def _handle_files(self, handler, container, params):
+        method = handler.command
+        path = params.get('path')
+        if not path:
+            raise _APIError('missing path')
+        files = container['_files']
+        if method == 'GET':
+            with self.lock:
+                self._check_failure('file_get')
+                if path not in files:
+                    raise _APIError('not found', code=404)
+                entry = files[path]
+                headers = {'X-LXD-type': entry['type'],
+                           'X-LXD-mode': '{:04o}'.format(entry['mode']),
+                           'X-LXD-uid': str(entry['uid']), 'X-LXD-gid': str(entry['gid'])}
+                if entry['type'] == 'directory':
+                    prefix = path.rstrip('/') + '/'
+                    children = sorted({p[len(prefix):].split('/')[0] for p in files
+                                       if p.startswith(prefix)})
+                    status, _, body = _sync(children)
+                    return status, headers, body
+                headers['Content-Type'] = 'application/octet-stream'
+                return 200, headers, entry['content']
+        elif method == 'POST':
+            content = handler.read_body()
+            with self.lock:
+                self._check_failure('file_put')
+                file_type = handler.headers.get('X-LXD-type', 'file')
+                files[path] = _file(
+                    content if file_type == 'file' else b'', file_type=file_type,
+                    mode=int(handler.headers.get('X-LXD-mode', '0755' if file_type == 'directory'
+                                                 else '0644'), 8),
+                    uid=int(handler.headers.get('X-LXD-uid', 0)),
+                    gid=int(handler.headers.get('X-LXD-gid', 0)))
+            return _sync({})
+        elif method == 'DELETE':
+            with self.lock:
+                self._check_failure('file_delete')
+                if files.pop(path, None) is None:
+                    raise _APIError('not found', code=404)
+            return _sync({})
+        raise _APIError('method not allowed', code=405)
+
+    def _handle_images(self, handler, segments, params):
+        method = handler.command
+        if not segments:
+            if method == 'GET':
+                with self.lock:
+                    if _recursion(params):
+                        return _sync([self._image_metadata(i) for i in self.images.values()])
+                    return _sync(['/1.0/images/{}'.format(f) for f in self.images])
+            elif method == 'POST':
+                return self._handle_image_creation(handler.read_json())
+            raise _APIError('method not allowed', code=405)
+        elif segments[0] == 'aliases':
+            return self._handle_aliases(handler, segments[1:])
+
+        fingerprint = segments[0]
+        with self.lock:
+            image = self._get_image(fingerprint)
+        if method == 'GET':
+            with self.lock:
+                return _sync(self._image_metadata(image))
+        elif method == 'DELETE':
+            def delete(operation):
+                for alias in image['aliases']:
+                    self.aliases.pop(alias['name'], None)
+                self.images.pop(fingerprint, None)
+
+            return _async(self._create_operation(
+                'image_delete', delete, {'images': ['/1.0/images/{}'.format(fingerprint)]}))
+        raise _APIError('method not allowed', code=405)
+
+    def _handle_aliases(self, handler, segments):
+        method = handler.command
+        with self.lock:
+            if not segments:
+                if method == 'GET':
+                    return _sync(['/1.0/images/aliases/{}'.format(a) for a in self.aliases])
+                elif method == 'POST':
+                    self._check_failure('alias_create')
+                    data = handler.read_json()
+                    self._get_image(data.get('target'))
+                    self._add_alias(data['name'], data['target'], data.get('description', ''))
+                    return _sync({})
+                raise _APIError('method not allowed', code=405)
+            name = '/'.join(segments)
+            if name not in self.aliases:
+                raise _APIError('not found', code=404)
+            if method == 'GET':
+                return _sync(dict(self.aliases[name]))
+            elif method == 'DELETE':
+                self._check_failure('alias_delete')
+                alias = self.aliases.pop(name)
+                image = self.images[alias['target']]
+                image['aliases'] = [a for a in image['aliases'] if a['name'] != name]
+                return _sync({})
+        raise _APIError('method not allowed', code=405)
+
+    def _handle_image_creation(self, data):
+        source = data.get('source') or {}
+        if source.get('type') == 'image':
+            def pull(operation):
+                image = self._find_source_image(source)
+                image['auto_update'] = bool(data.get('auto_update', False))
+                return {'fingerprint': image['fingerprint'], 'size': image['size']}
+
+            return _async(self._create_operation('image_pull', pull))
+        elif source.get('type') in ('container', 'snapshot', 'instance'):
+            def publish(operation):
+                container_name, _, snapshot_name = source.get('name', '').partition('/')
+                origin = self._get_container(container_name)
+                if snapshot_name:
+                    origin = self._get_snapshot(origin, snapshot_name)
+                config = origin['config']
+                image = self._create_image(
+                    config.get('image.os', ''), config.get('image.release', ''),
+                    files=copy.deepcopy(origin['_files']), properties=data.get('properties'),
+                    public=bool(data.get('public', False)))
+                for alias in data.get('aliases') or []:
+                    self._add_alias(alias['name'], image['fingerprint'],
+                                    alias.get('description', ''))
+                return {'fingerprint': image['fingerprint'], 'size': image['size']}
+
+            return _async(self._create_operation('image_publish', publish))
+        raise _APIError('unsupported image source')
+
+    def _handle_operations(self, handler, segments, params):
+        if handler.command not in ('GET', 'DELETE'):
+            raise _APIError('method not allowed', code=405)
+        if not segments:
+            with self.lock:
+                return _sync({'running': ['/1.0/operations/{}'.format(o['id'])
+                                          for o in self.operations.values()
+                                          if not o['_done'].is_set()]})
+        with self.lock:
+            operation = self._get_operation(segments[0])
+        if len(segments) == 1:
+            return _sync(self._operation_metadata(operation))
+        elif segments[1] == 'wait':
+            timeout = float(params.get('timeout', -1))
+            operation['_done'].wait(None if timeout < 0 else timeout)
+            return _sync(self._operation_metadata(operation))
+        elif segments[1] == 'websocket':
+            channel = next((c for c in operation.get('_channels', {}).values()
+                            if c['secret'] == params.get('secret')), None)
+            if channel is None:
+                raise _APIError('forbidden', code=403)
+            return self._handle_exec_websocket(handler, operation, channel)
+        raise _APIError('not found', code=404)
+
+    def _handle_exec_websocket(self, handler, operation, channel):
+        websocket = handler.accept_websocket()
+        channel['connected'].set()
+        try:
+            if channel is operation['_channels']['1'] or channel is operation['_channels']['2']:
+                data = channel['output'].get()
+                if data:
+                    websocket.send(data)
+                websocket.close()
+            else:
+                # Standard input and control channels: what is sent by the client is ignored.
+                while not operation['_done'].wait(0.05):
+                    if websocket.is_closed():
+                        break
+                websocket.close()
+        except OSError:
+            pass
+        finally:
+            channel['finished'].set()
+
+    def _handle_snapshots(self, handler, container, segments, params, resources):
+        method = handler.command
+        if not segments:
+            if method == 'GET':
+                with self.lock:
+                    snapshots = list(container['_snapshots'].values())
+                    if _recursion(params):
+                        return _sync([self._snapshot_metadata(s) for s in snapshots])
+                    return _sync(['/1.0/containers/{}/snapshots/{}'.format(
+                        container['name'], s['name']) for s in snapshots])
+            elif method == 'POST':
+                data = handler.read_json()
+
+                def create(operation):
+                    if data['name'] in container['_snapshots']:
+                        raise _APIError('snapshot already exists', code=409)
+                    container['_snapshots'][data['name']] = {
+                        'config': copy.deepcopy(container['config']),
+                        'created_at': _now(),
+                        'devices': copy.deepcopy(container['devices']),
+                        'ephemeral': False,
+                        'expires_at': None,
+                        'name': data['name'],
+                        'stateful': bool(data.get('stateful', False)),
+                        '_files': copy.deepcopy(container['_files']),
+                    }
+
+                return _async(self._create_operation('snapshot_create', create, resources))
+            raise _APIError('method not allowed', code=405)
+
+        with self.lock:
+            snapshot = self._get_snapshot(container, segments[0])
+        if method == 'GET':
+            with self.lock:
+                return _sync(self._snapshot_metadata(snapshot))
+        elif method == 'DELETE':
+            def delete(operation):
+                del container['_snapshots'][snapshot['name']]
+
+            return _async(self._create_operation('snapshot_delete', delete, resources))
+        raise _APIError('method not allowed', code=405)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Hundreds of containers can be managed concurrently.
+    request_queue_size = 1024
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_request(self):
+        result = self.server.fake.handle(self)
+        if result is None:
+            # The connection was upgraded to a websocket and is now closed.
+            self.close_connection = True
+            return
+        status, headers, body = result
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_DELETE = do_GET = do_PATCH = do_POST = do_PUT = do_request
+
+    def accept_websocket(self):
+        """ Performs the websocket handshake and returns a `_WebSocket` instance. """
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        return _WebSocket(self.connection, self.rfile)
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def read_json(self):
+        body = self.read_body()
+        try:
+            return json.loads(body.decode('utf-8')) if body else {}
+        except ValueError:
+            raise _APIError('invalid JSON body')
+
+
+class _WebSocket:
+    """ Server side of a websocket connection (RFC 6455). """
+
+    def __init__(self, connection, rfile):
+        self.connection = connection
+        self.rfile = rfile
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def close(self, code=1000):
+        """ Sends a close frame and waits (briefly) for the close frame of the client. """
+        with self._lock:
+            if not self._closed:
+                self._send_frame(0x8, struct.pack('!H', code))
+        self.connection.settimeout(2)
+        try:
+            while not self._closed:
+                self._read_frame()
+        except (OSError, ValueError):
+            pass
+        self._closed = True
+
+    def is_closed(self):
+        """ Returns True if the client closed the websocket (reading pending frames). """
+        self.connection.settimeout(0)
+        try:
+            while not self._closed:
+                self._read_frame()
+        except (BlockingIOError, socket.timeout):
+            pass
+        except (OSError, ValueError):
+            self._closed = True
+        finally:
+            self.connection.settimeout(None)
+        return self._closed
+
+    def send(self, data, opcode=0x2):
+        with self._lock:
+            self._send_frame(opcode, data)
+
+    def _read_frame(self):
+        header = self._read_exactly(2)
+        opcode, length = header[0] & 0x0f, header[1] & 0x7f
+        if length == 126:
+            length = struct.unpack('!H', self._read_exactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._read_exactly(8))[0]
+        mask = self._read_exactly(4) if header[1] & 0x80 else b'\x00' * 4
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._read_exactly(length)))
+        if opcode == 0x8:
+            self._closed = True
+        return opcode, payload
+
+    def _read_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if not chunk:
+                raise ValueError('connection closed')
+            data += chunk
+        return data
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        self.connection.sendall(header + payload)
+
+
+def _async(operation):
+    body = {
+        'type': 'async', 'status': 'Operation created', 'status_code': 100,
+        'operation': '/1.0/operations/{}'.format(operation['id']), 'error_code': 0, 'error': '',
+        'metadata': {k: v for k, v in operation.items() if not k.startswith('_')},
+    }
+    return 202, {'Content-Type': 'application/json'}, json.dumps(body).encode('utf-8')
+
+
+def _error(error):
+    body = {'type': 'error', 'error': error.message, 'error_code': error.code, 'metadata': None, }
+    return error.code, {'Content-Type': 'application/json'}, json.dumps(body).encode('utf-8')
+
+
+def _file(content, file_type='file', mode=0o644, uid=0, gid=0):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return {'content': content, 'type': file_type, 'mode': mode, 'uid': uid, 'gid': gid, }
+
+
+def _now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _get_filtered_names(filter_expression):
+    # Only filters on names ("name eq web or name eq db") are supported.
+    names = set()
+    for clause in filter_expression.split(' or '):
+        field, operator, value = clause.strip().split(' ', 2)
+        if field != 'name' or operator != 'eq':
+            raise _APIError('unsupported filter: {}'.format(clause))
+        names.add(value.strip('"'))
+    return names
+
+
+def _recursion(params):
+    match = re.match(r'\d+', params.get('recursion', '0'))
+    return int(match.group(0)) if match else 0
+
+
+def _sync(metadata):
+    body = {
+        'type': 'sync', 'status': 'Success', 'status_code': 200, 'operation': '',
+        'error_code': 0, 'error': '', 'metadata': metadata,
+    }
+    return 200, {'Content-Type': 'application/json'}, json.dumps(body).encode('utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run a fake LXD daemon listening on <lxd-dir>/unix.socket.')
+    parser.add_argument('--lxd-dir', required=True,
+                        help='Directory of the unix socket (use it as the LXD_DIR of clients).')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Time (in seconds) spent handling each request.')
+    parser.add_argument('--operation-latency', type=float, default=0,
+                        help='Time (in seconds) spent running each asynchronous operation.')
+    parser.add_argument('--ip-delay', type=float, default=0,
+                        help='Time (in seconds) needed by started containers to get an IP.')
+    parser.add_argument('--failure', action='append', default=[], metavar='ACTION=RATE',
+                        help='Failure rate of an action (one of: {}).'.format(', '.join(ACTIONS)))
+    parser.add_argument('--seed', type=int, help='Seed used to inject failures.')
+    args = parser.parse_args(argv)
+
+    failures = {}
+    for failure in args.failure:
+        action, _, rate = failure.partition('=')
+        if action not in ACTIONS:
+            parser.error('unknown action: {}'.format(action))
+        failures[action] = float(rate or 1)
+
+    server = FakeLXDServer(
+        lxd_dir=args.lxd_dir, latency=args.latency, operation_latency=args.operation_latency,
+        ip_delay=args.ip_delay, failures=failures, seed=args.seed)
+    server.start()
+    print('Listening on {}'.format(server.socket_path), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
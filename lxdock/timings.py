@@ -0,0 +1,112 @@
+"""
+    LXDock timings
+    ==============
+    This module provides tools allowing to measure the time spent in the phases of the operations
+    performed on containers (eg. creating a container, waiting for its IP address or running a
+    provisioning step). Timings are only recorded while a recorder is active, which allows phases
+    to be instrumented at no cost in the general case:
+
+    .. code-block:: python
+
+        with record_timings() as recorder:
+            with timed('start', container_name='web'):
+                ...
+        print(recorder.format_table())
+"""
+
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+
+from .tracing import span
+
+
+__all__ = ['TimingsRecorder', 'record_timings', 'timed', ]
+
+
+class TimingsRecorder:
+    """ Collects the durations of the phases executed while it is active. """
+
+    def __init__(self):
+        self.records = []
+        self.started_at = datetime.datetime.utcnow()
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+
+    def add(self, container_name, phase, seconds):
+        """ Records the duration of a phase related to a container (or to the whole project). """
+        with self._lock:
+            self.records.append(
+                {'container': container_name, 'phase': phase, 'seconds': seconds, })
+
+    def as_dict(self):
+        """ Returns the recorded timings, sorted by decreasing duration, as a dictionary. """
+        with self._lock:
+            records = sorted(self.records, key=lambda r: r['seconds'], reverse=True)
+        return {
+            'started_at': self.started_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'total_seconds': self.total_seconds,
+            'phases': [dict(r) for r in records],
+        }
+
+    def format_table(self):
+        """ Returns a table of the recorded timings, sorted by decreasing duration. """
+        records = self.as_dict()['phases']
+        names = [r['container'] or '-' for r in records]
+        name_width = max([len(n) for n in names] + [len('Container')])
+        phase_width = max([len(r['phase']) for r in records] + [len('Phase')])
+        line_format = '{:<%d}  {:<%d}  {:>10}' % (name_width, phase_width)
+        lines = [line_format.format('Container', 'Phase', 'Seconds')]
+        for name, record in zip(names, records):
+            lines.append(line_format.format(
+                name, record['phase'], '{:.3f}'.format(record['seconds'])))
+        lines.append(line_format.format(
+            'Total', '', '{:.3f}'.format(self.total_seconds)))
+        return '\n'.join(lines)
+
+    def stop(self):
+        """ Stops the clock used to compute the total duration of the recorded operations. """
+        self._end = time.perf_counter()
+
+    @property
+    def total_seconds(self):
+        """ Returns the time elapsed since the recorder was created (or until it was stopped). """
+        return (self._end or time.perf_counter()) - self._start
+
+
+@contextmanager
+def record_timings():
+    """ Activates a new `TimingsRecorder` instance and returns it. """
+    global _recorder
+    previous_recorder, _recorder = _recorder, TimingsRecorder()
+    recorder = _recorder
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        _recorder = previous_recorder
+
+
+@contextmanager
+def timed(phase, container_name=None):
+    """ Records the time spent in the considered phase if a recorder is active.
+
+    Phases that are not related to a specific container (`container_name` is None) are related to
+    the whole project. Phases are also recorded as spans if a tracer is active (see
+    `lxdock.tracing`).
+    """
+    recorder = _recorder
+    with span(phase, 'phase', container_name):
+        if recorder is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            recorder.add(container_name, phase, time.perf_counter() - start)
+
+
+_recorder = None
@@ -0,0 +1,126 @@
+"""
+    LXDock tracing
+    ==============
+    This module provides tools allowing to record the spans of the operations performed by LXDock
+    (project actions, container phases, provisioning steps, commands executed in guests, LXD API
+    requests, ...) and to export them using the Chrome trace event format, which can be loaded in
+    trace viewers such as ``chrome://tracing`` or Perfetto (https://ui.perfetto.dev). Spans are only
+    recorded while a tracer is active:
+
+    .. code-block:: python
+
+        with record_trace() as tracer:
+            with span('start', 'phase', container_name='web'):
+                ...
+        tracer.save('trace.json')
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from .logging import get_logging_context
+
+
+__all__ = ['Tracer', 'record_trace', 'span', 'traced', ]
+
+
+class Tracer:
+    """ Collects spans and exports them as Chrome trace events. """
+
+    def __init__(self):
+        self.events = []
+        self._start = time.perf_counter()
+        self._thread_names = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, container_name=None, args=None):
+        """ Records a span of the current thread; `start` and `end` are `perf_counter` values. """
+        thread = threading.current_thread()
+        span_args = {'container': container_name} if container_name else {}
+        span_args.update(args or {})
+        event = {
+            'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+            'ts': round((start - self._start) * 1e6, 3), 'dur': round((end - start) * 1e6, 3),
+            'args': span_args,
+        }
+        with self._lock:
+            self.events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+    def as_dict(self):
+        """ Returns the recorded spans using the Chrome trace event format. """
+        with self._lock:
+            metadata = [
+                {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                 'args': {'name': name}}
+                for tid, name in self._thread_names.items()]
+            events = sorted(self.events, key=lambda e: e['ts'])
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms', }
+
+    def save(self, path):
+        """ Writes the recorded spans to a JSON file using the Chrome trace event format. """
+        with open(path, mode='w', encoding='utf-8') as fd:
+            json.dump(self.as_dict(), fd)
+
+
+@contextmanager
+def record_trace():
+    """ Activates a new `Tracer` instance and returns it. """
+    from .utils.lxd import add_api_request_hook, remove_api_request_hook
+    global _tracer
+    previous_tracer, _tracer = _tracer, Tracer()
+    tracer = _tracer
+    add_api_request_hook(_api_request_span)
+    try:
+        yield tracer
+    finally:
+        if previous_tracer is None:
+            remove_api_request_hook(_api_request_span)
+        _tracer = previous_tracer
+
+
+@contextmanager
+def span(name, category, container_name=None, args=None):
+    """ Records a span if a tracer is active.
+
+    The span is associated with the container whose messages are logged by the current thread if
+    `container_name` is not specified.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    container_name = container_name or get_logging_context()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.add(name, category, start, time.perf_counter(), container_name, args)
+
+
+def traced(category, container_name_attribute=None):
+    """ Records the calls of the decorated method as spans if a tracer is active.
+
+    If `container_name_attribute` is specified, the spans are associated with the container whose
+    name is the value of this attribute of the object.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            container_name = getattr(self, container_name_attribute) \
+                if container_name_attribute else None
+            with span(method.__name__, category, container_name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _api_request_span(method, path):
+    return span('{} {}'.format(method, path), 'lxd', args={'method': method, 'path': path})
+
+
+_tracer = None
@@ -0,0 +1,46 @@
+"""
+    Cache utilities
+    ===============
+    This module provides tools allowing to store data that can be reused by subsequent LXDock
+    commands (eg. to speed them up) in the cache directory of the user.
+"""
+
+import json
+import os
+import tempfile
+
+
+def get_cache_dir():
+    """ Returns the path of the directory where LXDock can store cached data. """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'lxdock')
+
+
+def read_cache_file(filename):
+    """ Returns the JSON content of a file of the cache directory or None if it is not usable. """
+    try:
+        with open(os.path.join(get_cache_dir(), filename), 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache_file(filename, data):
+    """ Writes JSON data to a file of the cache directory.
+
+    The file is replaced atomically so that concurrent LXDock commands never read partial data.
+    Errors are ignored: the cache is only used to speed things up.
+    """
+    cache_dir = get_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.' + filename)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(data, fp)
+            os.replace(tmp_path, os.path.join(cache_dir, filename))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
@@ -0,0 +1,106 @@
+"""
+    Concurrency utilities
+    =====================
+    This module provides tools allowing to run the same operation on multiple containers (or on
+    multiple guests) concurrently while keeping the output of each of them properly prefixed.
+"""
+
+import collections
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ..exceptions import DependencyFailed
+from ..logging import container_logging_context
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_concurrently(func, items, max_workers=1, dependencies=None, get_name=None):
+    """ Runs `func` on each of the considered items using at most `max_workers` threads.
+
+    Each item must provide a `name` attribute (or `get_name` must be specified): the messages logged
+    while processing an item are prefixed with this name. An exception raised while processing an
+    item does not interrupt the processing of the other items.
+
+    If `dependencies` are specified, an item is processed only once all the items it depends on
+    have been successfully processed; items whose dependencies failed are not processed at all.
+    Dependencies that are not part of `items` are considered to be satisfied.
+
+    :param func: callable taking a single item as argument
+    :param items: list of items (eg. containers or guests) to process
+    :param max_workers: maximum number of items that can be processed at the same time
+    :param dependencies: dictionary associating items with the list of items they depend on
+    :param get_name: callable returning the name of an item
+    :type items: list
+    :type max_workers: int
+    :type dependencies: dict
+    :return: ordered dictionary associating each item with the exception raised while processing
+        it (or `None` if the item was processed successfully)
+    :rtype: collections.OrderedDict
+    """
+    get_name = get_name or (lambda item: item.name)
+
+    def _run(item):
+        with container_logging_context(get_name(item)):
+            try:
+                func(item)
+            except Exception as e:
+                logger.debug('Unexpected error while processing {}'.format(get_name(item)),
+                             exc_info=True)
+                return e
+
+    dependencies = dependencies or {}
+    results = collections.OrderedDict((item, None) for item in items)
+    pending = list(results)
+    finished = set()
+
+    def _next_item():
+        # Returns the first pending item that can be processed (or that must be skipped because
+        # one of its dependencies failed) along with the list of its failed dependencies.
+        for item in pending:
+            item_dependencies = [d for d in dependencies.get(item, []) if d in results]
+            failed = [d for d in item_dependencies if d in finished and results[d] is not None]
+            if failed or all(d in finished for d in item_dependencies):
+                return item, failed
+        return None, []
+
+    workers = max(1, min(max_workers, len(results)))
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    running = {}
+    try:
+        while pending or running:
+            item, failed_dependencies = _next_item()
+            if item is not None and failed_dependencies:
+                pending.remove(item)
+                results[item] = DependencyFailed('{} depends on {} which failed'.format(
+                    get_name(item), ', '.join(get_name(d) for d in failed_dependencies)))
+                finished.add(item)
+            elif item is not None and executor is None:
+                pending.remove(item)
+                results[item] = _run(item)
+                finished.add(item)
+            elif item is not None and len(running) < workers:
+                pending.remove(item)
+                running[executor.submit(_run, item)] = item
+            elif running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    results[item] = future.result()
+                    finished.add(item)
+            else:
+                # The remaining items depend on each other; this should be prevented by the
+                # validation of the dependencies.
+                raise ValueError('Circular dependency between: {}'.format(
+                    ', '.join(get_name(item) for item in pending)))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    return results
+
+
+def format_error(error):
+    """ Returns a human-readable representation of an exception raised while processing an item. """
+    msg = getattr(error, 'msg', None) or str(error)
+    return msg or error.__class__.__name__
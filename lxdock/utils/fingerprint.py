@@ -0,0 +1,48 @@
+"""
+    Fingerprinting utilities
+    ========================
+    This module provides tools allowing to compute fingerprints of configuration values and of host
+    files. These fingerprints can be used to detect whether something changed since a previous run.
+"""
+
+import hashlib
+import json
+import os
+
+
+def fingerprint_data(data):
+    """ Returns a fingerprint (hex string) of JSON-serializable data such as configuration options.
+    """
+    serialized = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def fingerprint_paths(paths, basedir=None):
+    """ Returns a fingerprint (hex string) of the contents of the considered files or directories.
+
+    Directories are walked recursively: the relative paths and the contents of their files are
+    used to compute the fingerprint. Missing paths are taken into account as such. If `basedir` is
+    specified, the paths are made relative to it so that the fingerprint does not depend on the
+    location of this directory.
+    """
+    sha1 = hashlib.sha1()
+    for path in paths:
+        sha1.update((os.path.relpath(path, basedir) if basedir else path).encode('utf-8'))
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    filepath = os.path.join(dirpath, filename)
+                    sha1.update(os.path.relpath(filepath, path).encode('utf-8'))
+                    _update_with_file(sha1, filepath)
+        elif os.path.isfile(path):
+            _update_with_file(sha1, path)
+        else:
+            sha1.update(b'\0missing')
+    return sha1.hexdigest()
+
+
+def _update_with_file(sha1, filepath):
+    with open(filepath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(65536), b''):
+            sha1.update(chunk)
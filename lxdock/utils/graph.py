@@ -0,0 +1,63 @@
+"""
+    Graph utilities
+    ===============
+    This module provides basic tools allowing to manipulate dependency graphs, such as the graph
+    defined by the `depends_on` options of the containers of a project.
+"""
+
+
+def find_cycle(graph):
+    """ Returns a list of nodes forming a cycle in the considered graph or `None`.
+
+    :param graph: dictionary associating each node with the nodes it depends on
+    :type graph: dict
+    :return: list of nodes forming a cycle (the first node is repeated at the end of the list)
+    :rtype: list
+    """
+    visited = set()
+
+    def visit(node, path):
+        if node in path:
+            return path[path.index(node):] + [node, ]
+        if node in visited:
+            return None
+        visited.add(node)
+        for dependency in graph.get(node, []):
+            cycle = visit(dependency, path + [node, ])
+            if cycle is not None:
+                return cycle
+        return None
+
+    for node in graph:
+        cycle = visit(node, [])
+        if cycle is not None:
+            return cycle
+    return None
+
+
+def get_dependencies(graph, nodes):
+    """ Returns the set of the nodes that the considered nodes depend on, directly or not.
+
+    :param graph: dictionary associating each node with the nodes it depends on
+    :param nodes: the considered nodes (they are not part of the result unless they are
+        dependencies of other considered nodes)
+    :type graph: dict
+    :rtype: set
+    """
+    dependencies = set()
+    pending = [dependency for node in nodes for dependency in graph.get(node, [])]
+    while pending:
+        node = pending.pop()
+        if node not in dependencies:
+            dependencies.add(node)
+            pending.extend(graph.get(node, []))
+    return dependencies
+
+
+def reverse_graph(graph):
+    """ Returns a graph associating each node with the nodes that depend on it. """
+    reversed_graph = {node: [] for node in graph}
+    for node, dependencies in graph.items():
+        for dependency in dependencies:
+            reversed_graph.setdefault(dependency, []).append(node)
+    return reversed_graph
@@ -5,9 +5,277 @@
     interract with LXD...
 """
 
+import bisect
+import collections
 import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from urllib.parse import urlparse
+
+from pylxd.client import _APINode
+from pylxd.exceptions import LXDAPIException
+from pylxd.models import Container as LXDContainer
+
+
+class APIRequestStats:
+    """ Counts the requests sent to the LXD API by endpoint and HTTP method.
+
+    Endpoints are normalized by replacing the names of the resources (containers, operations,
+    images, ...) by ``*``. The latencies of the requests of each endpoint are also recorded using
+    histograms whose buckets are defined by `latency_buckets` (upper bounds in milliseconds).
+    """
+
+    latency_buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, )
+
+    # The collections of the LXD API whose items are identified by names or identifiers.
+    _collections = (
+        'containers', 'instances', 'images', 'aliases', 'operations', 'snapshots', 'profiles',
+        'networks', 'storage-pools', 'volumes', 'certificates', 'projects', )
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.histograms = collections.defaultdict(lambda: [0] * (len(self.latency_buckets) + 1))
+        self.latencies = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, method, path):
+        # Used as a request hook (see `add_api_request_hook`).
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(method, path, (time.perf_counter() - start) * 1000)
+
+    def add(self, method, path, milliseconds):
+        """ Records a request sent to the considered path along with its latency. """
+        key = (method, self.get_endpoint(path))
+        with self._lock:
+            self.counts[key] += 1
+            self.latencies[key] += milliseconds
+            self.histograms[key][bisect.bisect_left(self.latency_buckets, milliseconds)] += 1
+
+    def format_table(self):
+        """ Returns a table of the requests of each endpoint, sorted by decreasing count. """
+        with self._lock:
+            rows = [(count, method, endpoint, self.latencies[(method, endpoint)],
+                     list(self.histograms[(method, endpoint)]))
+                    for (method, endpoint), count in self.counts.most_common()]
+        width = max([len(r[1]) + len(r[2]) + 1 for r in rows] + [len('Request')])
+        line_format = '{:<%d}  {:>6}  {:>10}  {:>10}  {}' % width
+        lines = [line_format.format('Request', 'Count', 'Total (ms)', 'Mean (ms)', 'Latencies')]
+        for count, method, endpoint, total, histogram in rows:
+            lines.append(line_format.format(
+                '{} {}'.format(method, endpoint), count, '{:.1f}'.format(total),
+                '{:.1f}'.format(total / count), self._format_histogram(histogram)))
+        lines.append(line_format.format('Total', self.total, '', '', ''))
+        return '\n'.join(lines)
+
+    @classmethod
+    def get_endpoint(cls, path):
+        """ Returns the normalized endpoint of a path (eg. "/1.0/containers/*/state"). """
+        segments = path.strip('/').split('/')
+        for i in range(1, len(segments)):
+            if segments[i - 1] in cls._collections and segments[i] not in cls._collections:
+                segments[i] = '*'
+        return '/' + '/'.join(segments)
+
+    @property
+    def total(self):
+        """ Returns the total number of recorded requests. """
+        return sum(self.counts.values())
+
+    def _format_histogram(self, histogram):
+        bounds = ['<{}ms'.format(b) for b in self.latency_buckets]
+        bounds.append('>={}ms'.format(self.latency_buckets[-1]))
+        return ' '.join('{}:{}'.format(b, n) for b, n in zip(bounds, histogram) if n)
+
+
+# The containers of the host are listed with their state (instead of being fetched one by one) only
+# if they are at most this many times more numerous than the considered containers. This only
+# applies to LXD versions that cannot filter listings (see `get_containers`).
+_MAX_CONTAINERS_LISTING_RATIO = 4
+
+# The hooks called around each request sent to the LXD API (see `add_api_request_hook`).
+_api_request_hooks = []
+
+
+def add_api_request_hook(hook):
+    """ Registers a hook that is called around each request sent to the LXD API by PyLXD.
+
+    `hook` is called with the HTTP method and the path of the request (eg. "GET" and
+    "/1.0/containers/web") and must return a context manager, which is entered while the request is
+    performed.
+    """
+    _install_api_request_hooks()
+    if hook not in _api_request_hooks:
+        _api_request_hooks.append(hook)
+
+
+@contextmanager
+def count_api_requests():
+    """ Counts the requests sent to the LXD API using a new `APIRequestStats` instance. """
+    stats = APIRequestStats()
+    add_api_request_hook(stats)
+    try:
+        yield stats
+    finally:
+        remove_api_request_hook(stats)
+
+
+def remove_api_request_hook(hook):
+    """ Unregisters a hook registered using `add_api_request_hook`. """
+    if hook in _api_request_hooks:
+        _api_request_hooks.remove(hook)
+
+
+def change_container_state(lxd_container, action, timeout=30, force=True):
+    """ Changes the state of a PyLXD container (eg. "start" or "stop") and waits for the change.
+
+    Unlike the related PyLXD methods, the container is not fetched again once its state changed:
+    the status of the PyLXD instance is outdated until it is synchronized.
+    """
+    response = lxd_container.api.state.put(
+        json={'action': action, 'timeout': timeout, 'force': force, })
+    lxd_container.client.operations.wait_for_operation(response.json()['operation'])
+
+
+def get_event_container_names(event):
+    """ Returns the names of the containers concerned by an event of the LXD events stream.
+
+    Lifecycle events are related to their source while operation events are related to the
+    containers of their resources.
+    """
+    metadata = event.get('metadata') or {}
+    if event.get('type') == 'lifecycle':
+        paths = [metadata.get('source') or '']
+    elif event.get('type') == 'operation':
+        resources = metadata.get('resources') or {}
+        paths = (resources.get('containers') or []) + (resources.get('instances') or [])
+    else:
+        paths = []
+    names = set()
+    for path in paths:
+        segments = urlparse(path).path.strip('/').split('/')
+        if len(segments) > 2 and segments[1] in ('containers', 'instances', ):
+            names.add(segments[2])
+    return names
 
 
 def get_lxd_dir():
     """ Returns the path (as a string) towards the LXD's directory. """
     return os.environ.get('LXD_DIR', None) or '/var/lib/lxd'
+
+
+def get_containers(client, names=None):
+    """ Returns the PyLXD containers managed by LXD using as few requests as possible.
+
+    If `names` is specified, the listing is filtered by LXD so that the containers of the other
+    projects of the host are not transferred. LXD versions that cannot filter listings are asked
+    for the names of their containers first: the considered containers are then fetched one by one
+    if they are only a small part of the containers of the host.
+
+    :param client: the PyLXD client to use
+    :param names: names of the containers to return (all the containers are returned if None)
+    :type names: list
+    :return: dictionary associating container names with PyLXD container instances
+    :rtype: dict
+    """
+    params = {'recursion': 1}
+    if names is not None:
+        names = set(names)
+        if not names:
+            return {}
+        if 'api_filtering' in client.host_info.get('api_extensions', []):
+            params['filter'] = ' or '.join('name eq {}'.format(name) for name in sorted(names))
+        else:
+            response = client.api.containers.get()
+            host_names = {url.rstrip('/').split('/')[-1] for url in response.json()['metadata']}
+            names &= host_names
+            if len(names) * _MAX_CONTAINERS_LISTING_RATIO < len(host_names):
+                lxd_containers = {name: _get_container(client, name) for name in names}
+                return {name: c for name, c in lxd_containers.items() if c is not None}
+    response = client.api.containers.get(params=params)
+    return {
+        metadata['name']: LXDContainer(client, **metadata)
+        for metadata in response.json()['metadata']
+        if names is None or metadata['name'] in names
+    }
+
+
+def update_container(lxd_container, config=None, devices=None):
+    """ Applies configuration and device changes to a PyLXD container using a single request.
+
+    Only the keys and devices whose value differs from the ones of the container are sent to LXD
+    (using a PATCH request); nothing is sent if nothing changed. A value of None removes the
+    related key or device: as LXD does not allow removing them using PATCH requests, the whole
+    container is saved (using a PUT request) in that case.
+
+    :param config: dictionary associating config keys with their new value
+    :param devices: dictionary associating device names with their new configuration
+    :return: a boolean indicating if the container was updated
+    :rtype: bool
+    """
+    changes = {}
+    for name, values in (('config', config), ('devices', devices)):
+        current = getattr(lxd_container, name)
+        diff = {k: v for k, v in (values or {}).items() if current.get(k) != v}
+        if diff:
+            changes[name] = diff
+    if not changes:
+        return False
+
+    removal = any(v is None for diff in changes.values() for v in diff.values())
+    # The dictionaries of the container are updated in place so that PyLXD does not consider its
+    # attributes as modified.
+    for name, diff in changes.items():
+        current = getattr(lxd_container, name)
+        for key, value in diff.items():
+            if value is None:
+                current.pop(key, None)
+            else:
+                current[key] = value
+    if removal:
+        lxd_container.save(wait=True)
+    else:
+        # Depending on the version of LXD, PATCH requests may be processed synchronously.
+        operation = lxd_container.api.patch(json=changes).json().get('operation')
+        if operation:
+            lxd_container.client.operations.wait_for_operation(operation)
+    return True
+
+
+def _get_container(client, name):
+    """ Returns the PyLXD container of the considered name (or None if it does not exist). """
+    try:
+        response = client.api.containers[name].get()
+    except LXDAPIException as e:
+        # The container may have been deleted since the containers of the host were listed.
+        if e.response.status_code == 404:
+            return
+        raise
+    return LXDContainer(client, **response.json()['metadata'])
+
+
+def _install_api_request_hooks():
+    """ Wraps the HTTP methods of PyLXD API nodes so that they call the registered hooks. """
+    for method_name in ('get', 'post', 'put', 'patch', 'delete', ):
+        method = getattr(_APINode, method_name, None)
+        if method is not None and not getattr(method, 'calls_api_request_hooks', False):
+            setattr(_APINode, method_name, _wrap_api_method(method_name.upper(), method))
+
+
+def _wrap_api_method(http_method, method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _api_request_hooks:
+            return method(self, *args, **kwargs)
+        path = urlparse(self._api_endpoint).path
+        with ExitStack() as stack:
+            for hook in list(_api_request_hooks):
+                stack.enter_context(hook(http_method, path))
+            return method(self, *args, **kwargs)
+    wrapper.calls_api_request_hooks = True
+    return wrapper
@@ -0,0 +1,97 @@
+"""
+    Plugin utilities
+    ================
+    This module provides tools allowing to discover and import plugins (such as provisioners or
+    guests) only when they are needed. Plugins can be part of LXDock or be provided by third-party
+    packages through entry points.
+"""
+
+import collections
+import collections.abc
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """ Module whose public attributes are imported from submodules when they are first accessed.
+
+    `lazy_attributes` associates attribute names with the (relative) names of the submodules that
+    define them.
+    """
+
+    lazy_attributes = {}
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self.lazy_attributes))
+
+    def __getattr__(self, name):
+        module_name = self.lazy_attributes.get(name)
+        if module_name is None:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+        value = getattr(importlib.import_module(module_name, self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+
+class PluginRegistry(collections.abc.Mapping):
+    """ Mapping of plugin names to plugin classes whose modules are imported on demand.
+
+    Accessing a plugin imports the module defining it, which is expected to register the plugin
+    using the `register` method. Iterating over the registry gives the names of all the available
+    plugins without importing them: the built-in plugins first, then the plugins registered by other
+    modules and finally the plugins provided by the entry points of the `entry_point_group` group.
+    """
+
+    def __init__(self, builtin_modules, entry_point_group):
+        self.builtin_modules = collections.OrderedDict(builtin_modules)
+        self.entry_point_group = entry_point_group
+        self._plugins = collections.OrderedDict()
+        self._entry_points = None
+
+    def __getitem__(self, name):
+        if name not in self._plugins:
+            self._load(name)
+        return self._plugins[name]
+
+    def __iter__(self):
+        names = list(self.builtin_modules)
+        names.extend(name for name in self._plugins if name not in self.builtin_modules)
+        names.extend(name for name in self._get_entry_points() if name not in names)
+        return iter(names)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def register(self, name, plugin):
+        """ Registers a plugin class. """
+        self._plugins[name] = plugin
+
+    ##################################
+    # PRIVATE METHODS AND PROPERTIES #
+    ##################################
+
+    def _get_entry_points(self):
+        """ Returns a dictionary associating plugin names with their (unloaded) entry points. """
+        if self._entry_points is None:
+            self._entry_points = collections.OrderedDict(
+                (entry_point.name, entry_point)
+                for entry_point in _iter_entry_points(self.entry_point_group))
+        return self._entry_points
+
+    def _load(self, name):
+        if name in self.builtin_modules:
+            importlib.import_module(self.builtin_modules[name])
+        elif name in self._get_entry_points():
+            self._plugins.setdefault(name, self._get_entry_points()[name].load())
+
+
+def _iter_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        from pkg_resources import iter_entry_points
+        return iter_entry_points(group)
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, 'select'):
+        return all_entry_points.select(group=group)
+    return all_entry_points.get(group, [])
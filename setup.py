@@ -45,6 +45,7 @@ setup(
     entry_points={
         'console_scripts': [
             'lxdock = lxdock.cli.main:main',
+            'lxdockd = lxdock.daemon:main',
         ],
     },
     classifiers=[
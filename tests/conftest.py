@@ -1,2 +1,10 @@
 # Ensure all fixtures are discovered by py.test.
+import pytest
+
 from lxdock.test import *  # noqa
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmpdir, monkeypatch):
+    # Data cached by LXDock (eg. validated configurations) must not leak from one test to another.
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
@@ -6,7 +6,6 @@ import unittest.mock
 import pytest
 from pylxd.exceptions import NotFound
 
-from lxdock import constants
 from lxdock.container import Container, must_be_created_and_running
 from lxdock.exceptions import ContainerOperationFailed
 from lxdock.test.testcases import LXDTestCase
@@ -40,19 +39,19 @@ class TestContainer(LXDTestCase):
             'name': self.containername('newcontainer'), 'image': 'alpine/3.10', 'mode': 'pull', }
         container = Container('myproject', THIS_DIR, self.client, **container_options)
         container.up()
-        assert container._container.status_code == constants.CONTAINER_RUNNING
+        assert container.is_running
         assert container._container.config['user.lxdock.made'] == '1'
         assert container._container.config['user.lxdock.homedir'] == THIS_DIR
 
     def test_can_set_up_a_container_that_is_already_up_and_running(self, persistent_container):
         persistent_container.up()
-        assert persistent_container._container.status_code == constants.CONTAINER_RUNNING
+        assert persistent_container.is_running
 
     def test_can_set_up_a_container_that_exists_but_is_not_running(self, persistent_container):
         persistent_container.halt()
-        assert persistent_container._container.status_code == constants.CONTAINER_STOPPED
+        assert persistent_container.is_stopped
         persistent_container.up()
-        assert persistent_container._container.status_code == constants.CONTAINER_RUNNING
+        assert persistent_container.is_running
 
     def test_can_destroy_a_container_and_run_this_action_for_a_container_that_does_not_exist(self):
         container_options = {
@@ -74,12 +73,12 @@ class TestContainer(LXDTestCase):
 
     def test_can_halt_a_container_that_is_running(self, persistent_container):
         persistent_container.halt()
-        assert persistent_container._container.status_code == constants.CONTAINER_STOPPED
+        assert persistent_container.is_stopped
 
     def test_can_try_to_halt_a_container_that_is_already_stopped(self, persistent_container):
         persistent_container.halt()
         persistent_container.halt()
-        assert persistent_container._container.status_code == constants.CONTAINER_STOPPED
+        assert persistent_container.is_stopped
 
     @pytest.mark.skipif(
         sys.version_info < (3, 5),
@@ -307,7 +306,7 @@ class TestContainer(LXDTestCase):
             'profiles': ['default']}
         container = Container('myproject', THIS_DIR, self.client, **container_options)
         container.up()
-        assert container._container.status_code == constants.CONTAINER_RUNNING
+        assert container.is_running
         assert container._container.profiles == ['default']
 
     def test_raises_an_error_if_profile_does_not_exist(self):
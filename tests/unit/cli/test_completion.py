@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import unittest.mock
+
+import pytest
+
+from lxdock.cli import completion
+from lxdock.cli.completion import get_container_names
+
+
+FIXTURE_ROOT = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class TestGetContainerNames:
+    def test_returns_the_default_container_if_no_containers_are_defined(self):
+        assert get_container_names(os.path.join(FIXTURE_ROOT, 'project01')) == ['default']
+
+    def test_caches_the_container_names_until_the_lxdock_file_changes(self, tmpdir):
+        lxdock_file = tmpdir.join('lxdock.yml')
+        lxdock_file.write('name: p\ncontainers:\n  - name: web\n  - name: db\n')
+        assert get_container_names(str(tmpdir)) == ['web', 'db']
+        with unittest.mock.patch.object(completion, '_read_container_names') as mock_read:
+            assert get_container_names(str(tmpdir)) == ['web', 'db']
+            assert mock_read.call_count == 0
+        lxdock_file.write('name: p\ncontainers:\n  - name: web\n')
+        assert get_container_names(str(tmpdir)) == ['web']
+
+    def test_cannot_read_container_names_that_contain_variables(self, tmpdir):
+        tmpdir.join('lxdock.yml').write('name: p\ncontainers:\n  - name: ${NAME}\n')
+        with pytest.raises(ValueError):
+            get_container_names(str(tmpdir))
+
+
+def test_listing_containers_does_not_load_the_configuration_machinery(tmpdir):
+    # This guards the startup time of the command used by the shell completion scripts.
+    code = (
+        'import sys; from lxdock.cli.main import main; main(["config", "--containers"]); '
+        'print(sorted(m for m in ("voluptuous", "lxdock.provisioners", "lxdock.conf.schema", '
+        '"pylxd") if m in sys.modules))')
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmpdir), LXDOCK_NO_DAEMON='1',
+               PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=os.path.join(FIXTURE_ROOT, 'project01'), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    # The startup time itself is measured by benchmarks/startup.py.
+    assert result.stdout.splitlines() == ['default', '[]']
@@ -1,4 +1,8 @@
+import json
 import os
+import pstats
+import threading
+import time
 import unittest.mock
 
 import pytest
@@ -11,7 +15,9 @@ from lxdock.conf.exceptions import ConfigError
 from lxdock.constants import ProvisioningMode
 from lxdock.container import Container
 from lxdock.exceptions import LXDockException
+from lxdock.images import ImageCache
 from lxdock.project import Project
+from lxdock.timings import timed
 
 
 FIXTURE_ROOT = os.path.join(os.path.dirname(__file__), 'fixtures')
@@ -24,6 +30,28 @@ def test_main_function_can_run_a_lxdock_command(mock_help_action):
 
 
 class TestLXDock:
+    @unittest.mock.patch('lxdock.client.get_client')
+    @unittest.mock.patch.object(ImageCache, 'prune', return_value=[])
+    def test_can_prune_the_image_cache(self, mock_prune, mock_get_client):
+        LXDock(['cache', 'prune', '--max-size', '100'])
+        assert mock_prune.call_args == [{'max_size': 100 * 1024 ** 2, }, ]
+        LXDock(['cache', 'prune', '--all'])
+        assert mock_prune.call_args == [{'max_size': 0, }, ]
+
+    @unittest.mock.patch('lxdock.client.get_client')
+    @unittest.mock.patch.object(ImageCache, 'prune', return_value=[])
+    def test_prunes_the_image_cache_using_the_size_limit_of_the_project(
+            self, mock_prune, mock_get_client, tmpdir, monkeypatch):
+        monkeypatch.chdir(str(tmpdir))
+        LXDock(['cache', 'prune'])
+        assert mock_prune.call_args == [{'max_size': None, }, ]
+        tmpdir.join('lxdock.yml').write(
+            'name: project\nimage: ubuntu/bionic\nimage_cache_max_size: 2048\n')
+        LXDock(['cache', 'prune'])
+        assert mock_prune.call_args == [{'max_size': 2048 * 1024 ** 2, }, ]
+        LXDock(['cache', 'prune', '--max-size', '100'])
+        assert mock_prune.call_args == [{'max_size': 100 * 1024 ** 2, }, ]
+
     @unittest.mock.patch.object(LXDock, 'project_config')
     @unittest.mock.patch.object(Config, 'serialize')
     def test_can_display_the_config_file_of_the_project(self, serialize_mock, mock_config):
@@ -123,6 +151,17 @@ class TestLXDock:
         n = LXDock(argv)
         assert n._parsers['main'].parse_args(argv).subcommand == 'up'
 
+    @unittest.mock.patch.object(LXDock, 'project')
+    @unittest.mock.patch.object(Project, 'pull')
+    def test_can_run_the_pull_action_for_specific_containers(
+            self, mock_project_pull, mock_project):
+        mock_project.__get__ = unittest.mock.Mock(
+            return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
+        LXDock(['pull', 'c1', 'c2'])
+        assert mock_project_pull.call_count == 1
+        assert mock_project_pull.call_args == [
+            {'container_names': ['c1', 'c2', ], 'auto_update': False, }, ]
+
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'provision')
     def test_can_run_the_provision_action_for_all_containers_of_a_project(
@@ -131,7 +170,7 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['provision'])
         assert mock_project_provision.call_count == 1
-        assert mock_project_provision.call_args == [{'container_names': [], }, ]
+        assert mock_project_provision.call_args == [{'container_names': [], 'force': False, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'provision')
@@ -141,7 +180,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['provision', 'c1', 'c2'])
         assert mock_project_provision.call_count == 1
-        assert mock_project_provision.call_args == [{'container_names': ['c1', 'c2', ], }, ]
+        assert mock_project_provision.call_args == [
+            {'container_names': ['c1', 'c2', ], 'force': False, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'shell')
@@ -238,7 +278,49 @@ class TestLXDock:
         LXDock(['up'])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': [], 'provisioning_mode': None, }, ]
+            {'container_names': [], 'provisioning_mode': None, 'parallelism': None, }, ]
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    def test_can_write_a_trace_of_the_up_action(self, mock_project, tmpdir):
+        def up(**kwargs):
+            with timed('start', 'c1'):
+                pass
+
+        mock_project.__get__ = unittest.mock.Mock(return_value=unittest.mock.Mock(up=up))
+        trace_file = tmpdir.join('trace.json')
+        LXDock(['--trace', str(trace_file), 'up'])
+        events = json.loads(trace_file.read())['traceEvents']
+        assert [e['name'] for e in events if e['ph'] == 'X'] == ['lxdock up', 'start']
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    def test_can_profile_the_up_action(self, mock_project, tmpdir):
+        def provision_containers():
+            time.sleep(0.05)
+
+        def up(**kwargs):
+            thread = threading.Thread(target=provision_containers)
+            thread.start()
+            thread.join()
+
+        mock_project.__get__ = unittest.mock.Mock(return_value=unittest.mock.Mock(up=up))
+        profile_file, stacks_file = tmpdir.join('lxdock.pstats'), tmpdir.join('lxdock.stacks')
+        LXDock(['--profile', str(profile_file), '--profile-stacks', str(stacks_file), 'up'])
+        functions = {name for _, _, name in pstats.Stats(str(profile_file)).stats}
+        assert {'up', 'provision_containers'} <= functions
+        assert 'provision_containers' in stacks_file.read()
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    def test_can_report_the_timings_of_the_up_action(self, mock_project, tmpdir):
+        def up(**kwargs):
+            with timed('start', 'c1'):
+                pass
+
+        mock_project.__get__ = unittest.mock.Mock(return_value=unittest.mock.Mock(up=up))
+        timings_file = tmpdir.join('timings.json')
+        LXDock(['up', '--timings', '--timings-json', str(timings_file)])
+        data = json.loads(timings_file.read())
+        assert data['command'] == 'up'
+        assert [(p['container'], p['phase']) for p in data['phases']] == [('c1', 'start')]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -249,7 +331,8 @@ class TestLXDock:
         LXDock(['up', 'c1', 'c2'])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': ['c1', 'c2', ], 'provisioning_mode': None, }, ]
+            {'container_names': ['c1', 'c2', ], 'provisioning_mode': None,
+             'parallelism': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -260,7 +343,8 @@ class TestLXDock:
         LXDock(['up', '--provision', ])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': [], 'provisioning_mode': ProvisioningMode.ENABLED, }, ]
+            {'container_names': [], 'provisioning_mode': ProvisioningMode.ENABLED,
+             'parallelism': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -271,7 +355,19 @@ class TestLXDock:
         LXDock(['up', '--no-provision', ])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': [], 'provisioning_mode': ProvisioningMode.DISABLED, }, ]
+            {'container_names': [], 'provisioning_mode': ProvisioningMode.DISABLED,
+             'parallelism': None, }, ]
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    @unittest.mock.patch.object(Project, 'up')
+    def test_can_run_the_up_action_with_a_specific_parallelism(
+            self, mock_project_up, mock_project):
+        mock_project.__get__ = unittest.mock.Mock(
+            return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
+        LXDock(['up', '--parallel', '4', ])
+        assert mock_project_up.call_count == 1
+        assert mock_project_up.call_args == [
+            {'container_names': [], 'provisioning_mode': None, 'parallelism': 4, }, ]
 
     def test_exit_if_no_action_is_provided(self):
         with pytest.raises(SystemExit):
@@ -1,4 +1,5 @@
 import os
+import unittest.mock
 from test.support import EnvironmentVarGuard
 
 import pytest
@@ -102,3 +103,57 @@ class TestConfig:
         project_dir = os.path.join(FIXTURE_ROOT, 'project_with_dynamic_variables')
         with pytest.raises(ConfigFileInterpolationError):
             Config.from_base_dir(project_dir)
+
+
+class TestConfigCache:
+    def _write_project(self, tmpdir, content):
+        tmpdir.join('lxdock.yml').write(content)
+        return str(tmpdir)
+
+    def test_reuses_the_validated_config_if_its_inputs_did_not_change(self, tmpdir):
+        project_dir = self._write_project(tmpdir, 'name: test\nimage: ubuntu/bionic\n')
+        Config.from_base_dir(project_dir)
+        with unittest.mock.patch.object(Config, 'validate') as mock_validate:
+            config = Config.from_base_dir(project_dir)
+        assert not mock_validate.called
+        assert config['name'] == 'test'
+        assert config.containers == [{'image': 'ubuntu/bionic', 'name': 'default'}]
+
+    def test_validates_the_config_again_if_the_lxdock_file_changes(self, tmpdir):
+        project_dir = self._write_project(tmpdir, 'name: test\nimage: ubuntu/bionic\n')
+        Config.from_base_dir(project_dir)
+        self._write_project(tmpdir, 'name: test\nimage: debian/buster\n')
+        config = Config.from_base_dir(project_dir)
+        assert config['image'] == 'debian/buster'
+
+    def test_validates_the_config_again_if_a_referenced_variable_changes(self, tmpdir):
+        project_dir = self._write_project(tmpdir, 'name: test\nimage: ${DUMMY_IMAGE}\n')
+        env = EnvironmentVarGuard()
+        with env:
+            env.set('DUMMY_IMAGE', 'ubuntu/bionic')
+            Config.from_base_dir(project_dir)
+            env.set('DUMMY_OTHER_VAR', 'test')
+            with unittest.mock.patch.object(Config, 'validate') as mock_validate:
+                Config.from_base_dir(project_dir)
+            assert not mock_validate.called
+            env.set('DUMMY_IMAGE', 'debian/buster')
+            config = Config.from_base_dir(project_dir)
+        assert config['image'] == 'debian/buster'
+
+    def test_validates_the_config_again_if_the_env_file_changes(self, tmpdir):
+        project_dir = self._write_project(tmpdir, 'name: test\nimage: ${DUMMY_IMAGE}\n')
+        tmpdir.join('.env').write('DUMMY_IMAGE=ubuntu/bionic\n')
+        Config.from_base_dir(project_dir)
+        tmpdir.join('.env').write('DUMMY_IMAGE=debian/buster\n')
+        config = Config.from_base_dir(project_dir)
+        assert config['image'] == 'debian/buster'
+
+    def test_validates_the_config_again_if_a_referenced_file_is_removed(self, tmpdir):
+        project_dir = self._write_project(
+            tmpdir, 'name: test\nimage: ubuntu/bionic\n'
+                    'provisioning:\n  - type: shell\n    script: provision.sh\n')
+        tmpdir.join('provision.sh').write('#!/bin/sh\n')
+        Config.from_base_dir(project_dir)
+        tmpdir.join('provision.sh').remove()
+        with pytest.raises(ConfigFileValidationError):
+            Config.from_base_dir(project_dir)
@@ -1,3 +1,6 @@
+import os
+import subprocess
+import sys
 import unittest.mock
 
 import pytest
@@ -82,3 +85,34 @@ class TestValidateProvisionerSchemas:
                 }]
             })
             assert "['provisioning'][1]['a']" in str(e)
+
+    @unittest.mock.patch('lxdock.conf.schema.Provisioner')
+    def test_can_validate_options_that_are_common_to_all_provisioners(self, mock_Provisioner):
+        mock_Provisioner.provisioners = {'mp1': MockProvisioner1}
+        schema = get_schema()
+        validated = schema({
+            'name': 'dummy-test',
+            'provisioning': [{'type': 'mp1', 'a': 'dummy', 'parallel': True, 'max_parallel': 4}]
+        })
+        assert validated['provisioning'] == [
+            {'type': 'mp1', 'a': 'dummy', 'parallel': True, 'max_parallel': 4}]
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'provisioning': [{'type': 'mp1', 'max_parallel': 0}]})
+
+    @unittest.mock.patch('lxdock.conf.schema.Provisioner')
+    def test_raise_invalid_if_the_provisioner_type_is_unknown(self, mock_Provisioner):
+        mock_Provisioner.provisioners = {'mp1': MockProvisioner1}
+        schema = get_schema()
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'provisioning': [{'type': 'unknown', 'a': 'dummy'}]})
+
+
+def test_only_imports_the_provisioners_referenced_by_the_lxdock_file():
+    code = (
+        'import sys; from lxdock.conf.schema import get_schema; '
+        'get_schema()({"name": "p", "provisioning": [{"type": "shell", "inline": "true"}]}); '
+        'print(sorted(m for m in sys.modules if m.startswith("lxdock.provisioners.")))')
+    result = subprocess.run(
+        [sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    assert result.stdout.strip() == "['lxdock.provisioners.base', 'lxdock.provisioners.shell']"
@@ -1,9 +1,10 @@
 import os.path
 
 import pytest
-from voluptuous.error import ValueInvalid
+from voluptuous.error import Invalid, ValueInvalid
 
-from lxdock.conf.validators import ExpandUserIfExists, Hostname, LXDIdentifier
+from lxdock.conf.validators import (ContainerDependencies, ExpandUserIfExists, Hostname,
+                                    LXDIdentifier)
 
 
 class TestHostnameValidator:
@@ -51,3 +52,23 @@ class TestExpandUserIfExists:
     def test_converts_dir_if_encountering_tilde(self):
         expanded_path = ExpandUserIfExists("~/.ssh")
         assert expanded_path == os.path.expanduser("~/.ssh")
+
+
+class TestContainerDependencies:
+    def test_can_validate_valid_dependencies(self):
+        config = {'name': 'p', 'containers': [
+            {'name': 'web', 'depends_on': ['db', 'cache']}, {'name': 'db'},
+            {'name': 'cache', 'depends_on': ['db']}]}
+        assert ContainerDependencies(config) == config
+
+    def test_cannot_validate_dependencies_on_unknown_containers(self):
+        with pytest.raises(Invalid) as excinfo:
+            ContainerDependencies({'name': 'p', 'containers': [
+                {'name': 'web', 'depends_on': ['db']}]})
+        assert excinfo.value.path == ['containers', 0, 'depends_on']
+
+    def test_cannot_validate_circular_dependencies(self):
+        with pytest.raises(Invalid) as excinfo:
+            ContainerDependencies({'name': 'p', 'containers': [
+                {'name': 'web', 'depends_on': ['db']}, {'name': 'db', 'depends_on': ['web']}]})
+        assert 'web -> db -> web' in excinfo.value.msg
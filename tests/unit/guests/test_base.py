@@ -1,6 +1,8 @@
 import os
 import pathlib
+import subprocess
 import tempfile
+import time
 import unittest.mock
 
 import pytest
@@ -151,3 +153,30 @@ class TestGuest:
         uid, gid = guest.uidgid("user")
         assert uid == 10000
         assert gid == 10000
+
+    def test_can_wait_until_the_guest_is_ready(self):
+        class DummyGuest(Guest):
+            name = 'dummy'
+            readiness_script = 'wait_while [ ! -e "$0" ]\n'
+        guest = DummyGuest(FakeContainer())
+        guest.lxd_container.execute.side_effect = lambda cmd, **kwargs: (
+            subprocess.call(cmd + [__file__]), '', '')
+        assert guest.wait_until_ready(timeout=5)
+        assert guest.lxd_container.execute.call_args[0][0][:2] == ['sh', '-c']
+
+    def test_stops_waiting_for_the_guest_once_the_timeout_expired(self):
+        class DummyGuest(Guest):
+            name = 'dummy'
+            readiness_script = 'wait_while true\n'
+        guest = DummyGuest(FakeContainer())
+        guest.lxd_container.execute.side_effect = lambda cmd, **kwargs: (
+            subprocess.call(cmd), '', '')
+        start = time.monotonic()
+        assert not guest.wait_until_ready(timeout=1)
+        assert time.monotonic() - start < 3
+
+    def test_the_default_readiness_script_is_a_valid_shell_script(self):
+        guest = Guest(FakeContainer())
+        guest.lxd_container.execute.side_effect = lambda cmd, **kwargs: (
+            subprocess.call(['sh', '-n', '-c', cmd[2]]), '', '')
+        assert guest.wait_until_ready()
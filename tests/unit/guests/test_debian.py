@@ -11,3 +11,9 @@ class TestDebianGuest:
             (['apt-get', 'update', ], )
         assert guest.lxd_container.execute.call_args_list[1][0] == \
             (['apt-get', 'install', '-y', 'python', 'openssh', ], )
+
+    def test_waits_for_apt_jobs_when_waiting_until_the_guest_is_ready(self):
+        guest = DebianGuest(FakeContainer())
+        guest.lxd_container.execute.return_value = (0, '', '')
+        assert guest.wait_until_ready()
+        assert 'unattended-upgr' in guest.lxd_container.execute.call_args[0][0][2]
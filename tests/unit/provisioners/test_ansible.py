@@ -82,3 +82,23 @@ class TestAnsibleProvisioner:
         )
         inv = provisioner.get_inventory()
         assert 'ansible_host={}'.format(c.lxd_name) in inv
+
+    def test_fingerprint_only_depends_on_the_files_used_by_the_playbook(self, tmpdir):
+        tmpdir.join('site.yml').write('- hosts: all\n')
+        tmpdir.mkdir('roles').mkdir('web').join('main.yml').write('- debug: msg=1\n')
+
+        def get_fingerprint():
+            return AnsibleProvisioner(
+                str(tmpdir), None, [], {'playbook': 'site.yml'}).get_fingerprint()
+
+        fingerprint = get_fingerprint()
+        # The other files of the directory of the playbook are not considered...
+        tmpdir.join('README.md').write('Project\n')
+        tmpdir.mkdir('node_modules').join('index.js').write('\n')
+        assert get_fingerprint() == fingerprint
+        # ... unlike the playbook and the files it may use.
+        tmpdir.join('roles', 'web', 'main.yml').write('- debug: msg=2\n')
+        assert get_fingerprint() != fingerprint
+        fingerprint = get_fingerprint()
+        tmpdir.mkdir('group_vars').join('all.yml').write('foo: bar\n')
+        assert get_fingerprint() != fingerprint
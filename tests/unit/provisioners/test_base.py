@@ -1,7 +1,9 @@
+import threading
 import unittest.mock
 
 import pytest
 
+from lxdock.exceptions import ProvisionFailed
 from lxdock.guests import DebianGuest
 from lxdock.provisioners import Provisioner
 from lxdock.provisioners.base import InvalidProvisioner
@@ -58,3 +60,52 @@ class TestProvisioner:
         provisioner = DummyProvisioner('./', host, [guest], {})
         provisioner.setup()
         assert provisioner.called
+
+    def test_can_provision_guests_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        class DummyProvisioner(Provisioner):
+            name = 'myprovisioner'
+            schema = {'test': 'test', }
+
+            def provision_single(self, guest):
+                barrier.wait()
+
+        guests = [DebianGuest(FakeContainer(name='c{}'.format(i))) for i in range(3)]
+        provisioner = DummyProvisioner(
+            './', unittest.mock.Mock(), guests, {'parallel': True, })
+        provisioner.provision()
+
+    def test_reports_the_guests_whose_parallel_provisioning_failed(self):
+        class DummyProvisioner(Provisioner):
+            name = 'myprovisioner'
+            schema = {'test': 'test', }
+            provisioned = []
+
+            def provision_single(self, guest):
+                if guest.container.name == 'c1':
+                    raise ProvisionFailed('boom')
+                self.provisioned.append(guest.container.name)
+
+        guests = [DebianGuest(FakeContainer(name='c{}'.format(i))) for i in range(3)]
+        provisioner = DummyProvisioner(
+            './', unittest.mock.Mock(), guests, {'max_parallel': 2, })
+        with pytest.raises(ProvisionFailed) as excinfo:
+            provisioner.provision()
+        assert sorted(provisioner.provisioned) == ['c0', 'c2']
+        assert excinfo.value.msg == 'Provisioning with myprovisioner failed on: c1 (boom)'
+
+    def test_fingerprint_depends_on_the_contents_of_the_referenced_files(self, tmpdir):
+        class DummyProvisioner(Provisioner):
+            name = 'myprovisioner'
+            schema = {'test': 'test', }
+            path_options = ('script', )
+
+        script = tmpdir.join('script.sh')
+        script.write('echo foo')
+        options = {'script': 'script.sh', }
+        fingerprint = DummyProvisioner(str(tmpdir), None, [], options).get_fingerprint()
+        assert DummyProvisioner(str(tmpdir), None, [], dict(options, parallel=True)) \
+            .get_fingerprint() == fingerprint
+        script.write('echo bar')
+        assert DummyProvisioner(str(tmpdir), None, [], options).get_fingerprint() != fingerprint
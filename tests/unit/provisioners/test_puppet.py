@@ -51,6 +51,17 @@ class TestPuppetProvisionerSchema:
             'manifests_path': 'manifests',
             'manifest_file': 'default.pp'}
 
+    def test_returns_the_manifest_file_among_the_validated_paths(self):
+        options = {'manifests_path': 'manifests', 'manifest_file': 'site.pp',
+                   'module_path': 'modules'}
+        assert PuppetProvisioner.get_validated_paths(options) == [
+            'manifests', 'modules', 'manifests/site.pp']
+
+    def test_returns_the_environment_directory_among_the_validated_paths(self):
+        options = {'environment_path': 'environments', 'environment': 'production'}
+        assert PuppetProvisioner.get_validated_paths(options) == [
+            'environments', 'environments/production']
+
 
 class TestPuppetProvisioner:
     @unittest.mock.patch.object(Guest, 'copy_directory')
@@ -0,0 +1,68 @@
+import unittest.mock
+
+import pytest
+from pylxd.exceptions import LXDAPIException
+
+from lxdock import constants
+from lxdock.client import get_client
+from lxdock.container import Container
+from lxdock.network import EtcHosts
+from lxdock.project import Project
+
+
+def create_container(client, name='test'):
+    return client.containers.create(
+        {'name': name, 'source': {'type': 'image', 'alias': 'debian/buster',
+                                  'server': 'https://images.linuxcontainers.org',
+                                  'protocol': 'simplestreams'}},
+        wait=True)
+
+
+class TestFakeLXDServer:
+    def test_can_create_start_stop_and_delete_containers(self, fake_lxd_server):
+        client = get_client()
+        container = create_container(client)
+        container.start(wait=True)
+        state = container.state()
+        assert state.status_code == constants.CONTAINER_RUNNING
+        assert state.network['eth0']['addresses'][0]['family'] == 'inet'
+        container.stop(wait=True)
+        container.delete(wait=True)
+        assert client.containers.all() == []
+        assert fake_lxd_server.requests['container_create'] == 1
+        assert fake_lxd_server.requests['image_pull'] == 0
+
+    def test_can_run_commands_and_transfer_files(self, fake_lxd_server):
+        fake_lxd_server.exec_handler = lambda container, command, env: (2, b'out', b'err')
+        container = create_container(get_client())
+        container.start(wait=True)
+        assert b'ID=debian' in container.files.get('/etc/os-release')
+        container.files.put('/tmp/test', b'content')
+        assert container.files.get('/tmp/test') == b'content'
+        assert tuple(container.execute(['ls'])) == (2, 'out', 'err')
+
+    def test_can_inject_failures(self, fake_lxd_server):
+        container = create_container(get_client())
+        fake_lxd_server.fail_next('container_start')
+        with pytest.raises(LXDAPIException):
+            container.start(wait=True)
+        container.start(wait=True)
+        assert container.status_code == constants.CONTAINER_RUNNING
+
+    def test_can_be_used_to_bring_up_projects(self, fake_lxd_server, tmpdir):
+        etchosts = tmpdir.join('hosts')
+        etchosts.write('127.0.0.1 localhost\n')
+        client = get_client()
+        containers = [
+            Container('project', str(tmpdir), client, name=name, image='debian/buster',
+                      mode='pull', hostnames=['{}.local'.format(name)])
+            for name in ('web', 'db')]
+        project = Project('project', str(tmpdir), client, containers, [])
+        with unittest.mock.patch.object(EtcHosts.__init__, '__defaults__', (str(etchosts), )):
+            project.up()
+            assert all(c.is_running for c in containers)
+            assert 'web.local' in etchosts.read()
+            assert 'db.local' in fake_lxd_server.containers[containers[0].lxd_name]['_files'][
+                '/etc/hosts']['content'].decode('utf-8')
+            project.destroy()
+        assert fake_lxd_server.containers == {}
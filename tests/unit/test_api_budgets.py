@@ -0,0 +1,76 @@
+import unittest.mock
+
+import pytest
+
+from lxdock.client import get_client
+from lxdock.container import Container
+from lxdock.network import EtcHosts
+from lxdock.project import Project
+from lxdock.utils.lxd import count_api_requests
+
+
+# The maximum number of requests that each command may send to the LXD API for a project defining
+# two containers, each having a hostname and a local provisioning step, and a global provisioning
+# step. The commands are executed in this order. A command exceeding its budget usually means that
+# a change introduced redundant requests (eg. fetching the same container or file twice).
+BUDGETS = [
+    ('up', 60),
+    ('status', 1),
+    ('up', 1),  # The containers are already up and provisioned.
+    ('provision', 20),
+    ('halt', 8),
+    ('destroy', 8),
+]
+
+
+@pytest.fixture
+def project_factory(fake_lxd_server, tmpdir):
+    etchosts = tmpdir.join('hosts')
+    etchosts.write('127.0.0.1 localhost\n')
+
+    def get_project():
+        client = get_client()
+        containers = [
+            Container('project', str(tmpdir), client, name=name, image='debian/buster',
+                      mode='pull', hostnames=['{}.local'.format(name)],
+                      provisioning=[{'type': 'shell', 'inline': 'true'}])
+            for name in ('web', 'db')]
+        return Project(
+            'project', str(tmpdir), client, containers, [{'type': 'shell', 'inline': 'true'}])
+
+    with unittest.mock.patch.object(EtcHosts.__init__, '__defaults__', (str(etchosts), )):
+        yield get_project
+
+
+def test_commands_do_not_exceed_their_lxd_api_request_budgets(project_factory):
+    exceeded = []
+    for command, budget in BUDGETS:
+        # A new project is used for each command, as each invocation of the lxdock command does.
+        project = project_factory()
+        with count_api_requests() as stats:
+            getattr(project, command)()
+        if stats.total > budget:
+            exceeded.append('{}: {} requests (budget: {})\n{}'.format(
+                command, stats.total, budget, stats.format_table()))
+    assert not exceeded, '\n\n'.join(exceeded)
+
+
+def test_guests_are_detected_by_fetching_each_file_once(fake_lxd_server, project_factory):
+    project_factory().up()
+    container = project_factory().containers[0]
+    fake_lxd_server.requests.clear()
+    assert container._guest.name == 'debian'
+    # Each of the files inspected in order to detect the guest is only fetched once.
+    assert fake_lxd_server.requests['file_get'] == 3
+
+
+def test_up_updates_the_config_of_each_container_once(fake_lxd_server, project_factory):
+    project_factory().up()
+    # The shares and the environment are part of the creation requests. The provisioning
+    # fingerprints, the provisioning state and the /etc/hosts fingerprint are stored at the end.
+    assert fake_lxd_server.requests['container_update'] == 2
+    for lxd_container in fake_lxd_server.containers.values():
+        assert lxd_container['config']['user.lxdock.provisioned'] == 'true'
+        assert 'user.lxdock.provisioning.local.0' in lxd_container['config']
+        assert 'user.lxdock.provisioning.global.0' in lxd_container['config']
+        assert 'user.lxdock.etchosts' in lxd_container['config']
@@ -0,0 +1,159 @@
+import unittest.mock
+
+import pytest
+
+from lxdock.client import get_client
+from lxdock.container import Container
+from lxdock.exceptions import ContainerOperationFailed
+from lxdock.guests import Guest
+from lxdock.hosts import Host
+
+
+@pytest.fixture
+def container(fake_lxd_server, tmpdir):
+    container = Container(
+        'project', str(tmpdir), get_client(), name='web', image='debian/buster', mode='pull')
+    container.up()
+    return container
+
+
+class TestContainerState:
+    def test_state_is_only_fetched_again_when_needed_after_state_changes(
+            self, fake_lxd_server, container):
+        container.halt()
+        with fake_lxd_server.lock:
+            fake_lxd_server.containers[container.lxd_name]['status'] = 'Frozen'
+            fake_lxd_server.containers[container.lxd_name]['status_code'] = 110
+        # The status of the container is fetched because it was stopped...
+        assert container.status == 'undefined'
+        # ... but only once.
+        with fake_lxd_server.lock:
+            fake_lxd_server.containers[container.lxd_name]['status'] = 'Stopped'
+            fake_lxd_server.containers[container.lxd_name]['status_code'] = 102
+        assert container.status == 'undefined'
+
+    def test_can_forget_its_state_on_lifecycle_events(self, fake_lxd_server, container):
+        # The container is stopped by another LXD client.
+        with fake_lxd_server.lock:
+            fake_lxd_server.containers[container.lxd_name]['status'] = 'Stopped'
+            fake_lxd_server.containers[container.lxd_name]['status_code'] = 102
+        container.handle_lxd_event({
+            'type': 'lifecycle',
+            'metadata': {'action': 'container-stopped', 'source': '/1.0/containers/other'},
+        })
+        assert container.is_running
+        container.handle_lxd_event({
+            'type': 'lifecycle',
+            'metadata': {'action': 'container-stopped',
+                         'source': '/1.0/containers/{}'.format(container.lxd_name)},
+        })
+        assert container.is_stopped
+
+    def test_knows_that_it_does_not_exist_anymore_on_deletion_events(
+            self, fake_lxd_server, container):
+        container.handle_lxd_event({
+            'type': 'lifecycle',
+            'metadata': {'action': 'container-deleted',
+                         'source': '/1.0/containers/{}'.format(container.lxd_name)},
+        })
+        fake_lxd_server.requests.clear()
+        assert not container.exists
+        assert container.status == 'not-created'
+
+
+class TestContainerShell:
+    def test_cannot_return_the_shell_command_of_a_container_that_does_not_exist(
+            self, fake_lxd_server, tmpdir):
+        container = Container(
+            'project', str(tmpdir), get_client(), name='web', image='debian/buster', mode='pull')
+        with pytest.raises(ContainerOperationFailed):
+            container.get_shell_command()
+        # The container must not be created.
+        assert fake_lxd_server.containers == {}
+
+    def test_cannot_return_the_shell_command_of_a_stopped_container(
+            self, fake_lxd_server, container):
+        container.halt()
+        with pytest.raises(ContainerOperationFailed):
+            container.get_shell_command()
+
+
+class TestContainerConfig:
+    @unittest.mock.patch.object(Guest, 'uidgid', return_value=(0, 0))
+    @unittest.mock.patch.object(Host, 'has_subuidgid_been_set', return_value=True)
+    def test_applies_shares_and_environment_using_a_single_update(
+            self, mock_has_subuidgid_been_set, mock_uidgid, fake_lxd_server, tmpdir):
+        container = Container(
+            'project', str(tmpdir), get_client(), name='web', image='debian/buster', mode='pull',
+            environment={'FOO': 'bar'}, shares=[{'source': '.', 'dest': '/srv'}])
+        container.up()
+        # The shares and the environment of new containers are part of their creation request.
+        assert fake_lxd_server.requests['container_update'] == 0
+        lxd_container = fake_lxd_server.containers[container.lxd_name]
+        assert lxd_container['config']['environment.FOO'] == 'bar'
+        assert lxd_container['devices']['lxdockshare1']['path'] == '/srv'
+        container.halt()
+        container.options.update(
+            environment={'FOO': 'baz'}, shares=[{'source': '.', 'dest': '/opt'}])
+        container.up()
+        assert fake_lxd_server.requests['container_update'] == 1
+        lxd_container = fake_lxd_server.containers[container.lxd_name]
+        assert lxd_container['config']['environment.FOO'] == 'baz'
+        assert lxd_container['devices']['lxdockshare1']['path'] == '/opt'
+
+    def test_does_not_update_the_container_if_its_environment_is_unchanged(
+            self, fake_lxd_server, tmpdir):
+        container = Container(
+            'project', str(tmpdir), get_client(), name='web', image='debian/buster', mode='pull',
+            environment={'FOO': 'bar'})
+        container.up()
+        fake_lxd_server.requests.clear()
+        container.get_shell_command()
+        assert fake_lxd_server.requests['container_update'] == 0
+        container.options['environment']['FOO'] = 'baz'
+        container.get_shell_command()
+        assert fake_lxd_server.requests['container_update'] == 1
+
+
+@unittest.mock.patch.object(Host, 'has_subuidgid_been_set', return_value=True)
+class TestContainerSharesIdmap:
+    def get_container(self, tmpdir, **options):
+        return Container(
+            'project', str(tmpdir), get_client(), name='web', image='debian/buster', mode='pull',
+            shares=[{'source': '.', 'dest': '/srv'}], **options)
+
+    def test_sets_the_idmap_of_root_when_the_container_is_created(
+            self, mock_has_subuidgid_been_set, fake_lxd_server, tmpdir):
+        with unittest.mock.patch.object(Guest, 'uidgid', return_value=(0, 0)):
+            self.get_container(tmpdir).up()
+        assert fake_lxd_server.requests['container_restart'] == 0
+
+    def test_reuses_the_uid_and_gid_of_guest_users_of_previous_containers(
+            self, mock_has_subuidgid_been_set, fake_lxd_server, tmpdir):
+        users = [{'name': 'dev'}]
+        with unittest.mock.patch.object(Guest, 'uidgid', return_value=(1000, 1000)):
+            container = self.get_container(tmpdir, users=users)
+            container.up()
+            # The UID and GID of the user are unknown until it is created.
+            assert fake_lxd_server.requests['container_restart'] == 1
+            container.destroy()
+            self.get_container(tmpdir, users=users).up()
+        assert fake_lxd_server.requests['container_restart'] == 1
+
+    def test_does_not_set_the_idmap_when_the_host_is_not_set_up_for_shares(
+            self, mock_has_subuidgid_been_set, fake_lxd_server, tmpdir):
+        mock_has_subuidgid_been_set.return_value = False
+        container = self.get_container(tmpdir)
+        with pytest.raises(ContainerOperationFailed):
+            container.up()
+        assert 'raw.idmap' not in fake_lxd_server.containers[container.lxd_name]['config']
+        # The errors related to the setup of the host are only reported once.
+        assert mock_has_subuidgid_been_set.call_count == 1
+
+    def test_does_not_set_the_idmap_of_containers_without_shares(
+            self, mock_has_subuidgid_been_set, fake_lxd_server, tmpdir):
+        container = Container(
+            'project', str(tmpdir), get_client(), name='web', image='debian/buster', mode='pull')
+        container.up()
+        assert 'raw.idmap' not in fake_lxd_server.containers[container.lxd_name]['config']
+        assert mock_has_subuidgid_been_set.call_count == 0
@@ -0,0 +1,151 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest.mock
+
+import pytest
+
+from lxdock.cli.main import setup_logging
+from lxdock.client import get_client
+from lxdock.daemon import LXDockDaemon, forward_command
+from lxdock.utils.lxd import count_api_requests
+
+
+FIXTURE_ROOT = os.path.join(os.path.dirname(__file__), 'cli', 'fixtures')
+
+
+@pytest.fixture
+def daemon(tmpdir):
+    daemon = LXDockDaemon(socket_path=str(tmpdir.join('lxdockd.sock')), listen_events=False)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(daemon.socket_path):
+            break
+        time.sleep(0.01)
+    return daemon
+
+
+class TestForwardCommand:
+    def test_does_not_forward_commands_if_the_daemon_is_not_running(self, tmpdir):
+        assert forward_command(['status'], socket_path=str(tmpdir.join('missing.sock'))) is None
+
+    def test_does_not_forward_commands_that_are_not_supported_by_the_daemon(self, daemon):
+        assert forward_command(['up'], socket_path=daemon.socket_path) is None
+        assert forward_command(['--version'], socket_path=daemon.socket_path) is None
+
+    def test_can_forward_a_command_to_the_daemon(self, daemon, monkeypatch):
+        monkeypatch.chdir(os.path.join(FIXTURE_ROOT, 'project01'))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit_code = forward_command(
+            ['config', '--containers'], socket_path=daemon.socket_path, stdout=stdout,
+            stderr=stderr)
+        assert exit_code == 0
+        assert stdout.getvalue() == 'default\n'
+
+    def test_reports_the_exit_code_of_failed_commands(self, daemon, tmpdir, monkeypatch):
+        setup_logging()
+        monkeypatch.chdir(str(tmpdir))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit_code = forward_command(
+            ['config'], socket_path=daemon.socket_path, stdout=stdout, stderr=stderr)
+        assert exit_code == 1
+        assert 'Unable to find a suitable configuration file' in stderr.getvalue()
+
+    def test_does_not_open_shells_in_containers_that_do_not_exist(
+            self, fake_lxd_server, daemon, tmpdir, monkeypatch):
+        setup_logging()
+        tmpdir.join('lxdock.yml').write('name: project\nimage: debian/buster\n')
+        monkeypatch.chdir(str(tmpdir))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with unittest.mock.patch('lxdock.daemon.subprocess.call') as mock_call:
+            exit_code = forward_command(
+                ['shell'], socket_path=daemon.socket_path, stdout=stdout, stderr=stderr)
+        assert exit_code == 1
+        assert 'The container is not created.' in stderr.getvalue()
+        assert mock_call.call_count == 0
+        assert fake_lxd_server.containers == {}
+
+
+def test_commands_that_cannot_be_forwarded_do_not_import_the_daemon_module():
+    # This guards the startup time of the commands that are not supported by the daemon.
+    code = (
+        'import sys; from lxdock.cli.main import main\n'
+        'try:\n    main(["--version"])\nexcept SystemExit:\n    pass\n'
+        'print("lxdock.daemon" in sys.modules)')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run(
+        [sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    assert result.stdout.splitlines()[-1] == 'False'
+
+
+class TestLXDockDaemon:
+    def test_reuses_configurations_while_their_inputs_do_not_change(self, tmpdir, monkeypatch):
+        tmpdir.join('lxdock.yml').write('name: project\nimage: ${IMAGE}\n')
+        monkeypatch.chdir(str(tmpdir))
+        monkeypatch.setenv('IMAGE', 'ubuntu/bionic')
+        daemon = LXDockDaemon(listen_events=False)
+        config = daemon.get_config()
+        assert daemon.get_config() is config
+        monkeypatch.setenv('IMAGE', 'debian/buster')
+        assert daemon.get_config()['image'] == 'debian/buster'
+
+    def test_reuses_configurations_when_unrelated_environment_variables_change(
+            self, tmpdir, monkeypatch):
+        tmpdir.join('lxdock.yml').write('name: project\nimage: ${IMAGE}\n')
+        monkeypatch.chdir(str(tmpdir))
+        monkeypatch.setenv('IMAGE', 'ubuntu/bionic')
+        daemon = LXDockDaemon(listen_events=False)
+        config = daemon.get_config()
+        monkeypatch.setenv('OLDPWD', '/somewhere/else')
+        monkeypatch.setenv('SHLVL', '42')
+        assert daemon.get_config() is config
+
+    def test_only_forgets_the_state_of_the_containers_concerned_by_lxd_events(
+            self, tmpdir, monkeypatch):
+        tmpdir.join('lxdock.yml').write(
+            'name: project\nimage: ubuntu/bionic\ncontainers:\n  - name: web\n  - name: db\n')
+        monkeypatch.chdir(str(tmpdir))
+        daemon = LXDockDaemon(listen_events=False)
+        daemon._client = unittest.mock.Mock()
+        web, db = daemon.get_project().containers
+        web.set_lxd_container(None)
+        db.set_lxd_container(None)
+        daemon._state_changed = False
+        daemon._handle_event({
+            'type': 'lifecycle',
+            'metadata': {'action': 'container-created',
+                         'source': '/1.0/containers/{}'.format(web.lxd_name)},
+        })
+        assert daemon.get_project().containers == [web, db]
+        assert not hasattr(web, '_pylxd_container')
+        assert db._pylxd_container is None
+
+    def test_status_only_fetches_the_containers_concerned_by_lxd_events(
+            self, fake_lxd_server, tmpdir, monkeypatch):
+        tmpdir.join('lxdock.yml').write(
+            'name: project\nimage: ubuntu/bionic\ncontainers:\n  - name: web\n  - name: db\n')
+        monkeypatch.chdir(str(tmpdir))
+        daemon = LXDockDaemon(listen_events=False)
+        daemon._client = get_client()
+        with count_api_requests() as stats:
+            daemon.get_project().status()
+        assert stats.total == 1
+        # The daemon keeps the state of the containers as long as LXD does not notify changes.
+        daemon._state_changed = False
+        with count_api_requests() as stats:
+            daemon.get_project().status()
+        assert stats.total == 0
+        web = daemon.get_project().containers[0]
+        daemon._handle_event({
+            'type': 'lifecycle',
+            'metadata': {'action': 'container-created',
+                         'source': '/1.0/containers/{}'.format(web.lxd_name)},
+        })
+        with count_api_requests() as stats:
+            daemon.get_project().status()
+        assert stats.total == 1
+        assert web.status == 'not-created'
@@ -0,0 +1,135 @@
+import unittest.mock
+
+from pylxd.exceptions import NotFound
+
+from lxdock.client import get_client as get_lxd_client
+from lxdock.container import Container
+from lxdock.images import ImageCache, pull_image
+
+
+def get_image(fingerprint, key=None, size=1, last_used_at=None, update_source=None):
+    return {
+        'fingerprint': fingerprint,
+        'aliases': [{'name': 'lxdock-cache-' + key}] if key else [],
+        'size': size,
+        'last_used_at': last_used_at or '0001-01-01T00:00:00Z',
+        'uploaded_at': '2020-01-01T00:00:00Z',
+        'update_source': update_source,
+    }
+
+
+def get_client(images=(), aliases=None):
+    aliases = aliases or {}
+    client = unittest.mock.MagicMock()
+    client.api.images.get.return_value.json.return_value = {'metadata': list(images)}
+
+    def get_alias(name):
+        alias = unittest.mock.Mock()
+        if name in aliases:
+            alias.get.return_value.json.return_value = {'metadata': {'target': aliases[name]}}
+        else:
+            alias.get.side_effect = NotFound(response=unittest.mock.Mock())
+        return alias
+
+    client.api.images.aliases.__getitem__.side_effect = get_alias
+    return client
+
+
+class TestPullImage:
+    source = {'alias': 'debian/buster', 'mode': 'pull', 'protocol': 'simplestreams',
+              'server': 'https://images.linuxcontainers.org', 'type': 'image'}
+
+    def test_does_not_let_lxd_update_pulled_images_by_default(self, fake_lxd_server):
+        fingerprint = pull_image(get_lxd_client(), self.source)
+        assert fake_lxd_server.images[fingerprint]['auto_update'] is False
+
+    def test_can_let_lxd_update_pulled_images(self, fake_lxd_server):
+        fingerprint = pull_image(get_lxd_client(), self.source, auto_update=True)
+        assert fake_lxd_server.images[fingerprint]['auto_update'] is True
+
+
+class TestImageCache:
+    def test_can_find_the_image_associated_with_a_key(self):
+        image_cache = ImageCache(get_client(aliases={'lxdock-cache-abc': 'f1'}))
+        assert image_cache.find('abc') == 'f1'
+        assert image_cache.find('def') is None
+
+    def test_can_determine_the_base_fingerprint_of_pulled_images(self):
+        source = {'alias': 'alpine/3.11', 'mode': 'pull', 'protocol': 'simplestreams',
+                  'server': 'https://images.linuxcontainers.org', 'type': 'image'}
+        image_cache = ImageCache(get_client(images=[
+            get_image('f1', update_source={
+                'alias': 'alpine/3.11', 'protocol': 'simplestreams',
+                'server': 'https://images.linuxcontainers.org'}),
+            get_image('f2', update_source={
+                'alias': 'alpine/3.10', 'protocol': 'simplestreams',
+                'server': 'https://images.linuxcontainers.org'}),
+        ]))
+        assert image_cache.get_base_fingerprint(source) == 'f1'
+        assert image_cache.get_base_fingerprint(dict(source, alias='debian/buster')) is None
+
+    def test_removes_the_least_recently_used_images_when_the_cache_is_too_big(self):
+        client = get_client(images=[
+            get_image('f1', key='k1', size=10, last_used_at='2020-01-03T00:00:00Z'),
+            get_image('f2', key='k2', size=10, last_used_at='2020-01-01T00:00:00Z'),
+            get_image('f3', key='k3', size=10, last_used_at='2020-01-02T00:00:00Z'),
+            get_image('f4', size=100),
+        ])
+        removed = ImageCache(client).prune(max_size=15)
+        assert [image['fingerprint'] for image in removed] == ['f2', 'f3']
+
+    def test_can_remove_all_the_cached_images(self):
+        client = get_client(images=[get_image('f1', key='k1'), get_image('f2', key='k2')])
+        assert len(ImageCache(client).prune(max_size=0)) == 2
+
+
+class TestContainerImageCache:
+    def get_container(self, client, homedir):
+        client.containers.get.side_effect = NotFound(response=unittest.mock.Mock())
+        return Container('project', str(homedir), client, **{
+            'name': 'web', 'image': 'alpine/3.11', 'mode': 'local', 'image_cache': True,
+            'provisioning': [{'type': 'shell', 'inline': 'echo foo'}]})
+
+    def test_is_created_from_the_cached_image_if_available(self, tmpdir):
+        client = get_client(aliases={'alpine/3.11': 'base'})
+        container = self.get_container(client, tmpdir)
+        key = container._get_image_cache_key('base')
+        client = get_client(aliases={'alpine/3.11': 'base', 'lxdock-cache-' + key: 'cached'})
+        container = self.get_container(client, tmpdir)
+        container._get_container()
+        container_config = client.containers.create.call_args[0][0]
+        assert container_config['source'] == {'type': 'image', 'fingerprint': 'cached'}
+        assert container_config['config']['user.lxdock.image_cache'] == key
+        assert container_config['config']['user.lxdock.provisioning.local.0'] == \
+            container._get_local_provisioning_fingerprints()[0]
+        # The container must not use the machine ID of the container the image was published from.
+        lxd_container = client.containers.create.return_value
+        assert lxd_container.files.put.call_args[0] == ('/etc/machine-id', b'')
+
+    def test_uses_the_same_cache_key_in_copies_of_a_project(self, tmpdir):
+        containers = []
+        for name in ('fp1', 'fp2'):
+            homedir = tmpdir.mkdir(name)
+            homedir.join('provision.sh').write('echo foo')
+            container = self.get_container(get_client(), homedir)
+            container.options['provisioning'] = [{'type': 'shell', 'script': 'provision.sh'}]
+            containers.append(container)
+        assert containers[0]._get_image_cache_key('base') == \
+            containers[1]._get_image_cache_key('base')
+
+    def test_uses_different_cache_keys_for_different_definitions(self, tmpdir):
+        container = self.get_container(get_client(), tmpdir)
+        key = container._get_image_cache_key('base')
+        for option, value in (('lxc_config', {'security.nesting': 'true'}),
+                              ('privileged', True), ('profiles', ['default', 'docker'])):
+            other_container = self.get_container(get_client(), tmpdir)
+            other_container.options[option] = value
+            assert other_container._get_image_cache_key('base') != key
+
+    def test_is_created_from_its_image_if_no_cached_image_is_available(self, tmpdir):
+        client = get_client(aliases={'alpine/3.11': 'base'})
+        self.get_container(client, tmpdir)._get_container()
+        container_config = client.containers.create.call_args[0][0]
+        assert container_config['source']['alias'] == 'alpine/3.11'
+        assert 'user.lxdock.image_cache' not in container_config['config']
+        assert client.containers.create.return_value.files.put.call_count == 0
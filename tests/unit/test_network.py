@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from lxdock.client import get_client
+from lxdock.network import IPWaiter
+from lxdock.utils.lxd import count_api_requests
+
+
+@pytest.fixture
+def lxd_containers(fake_lxd_server):
+    client = get_client()
+    containers = []
+    for name in ('web', 'db', 'cache'):
+        container = client.containers.create(
+            {'name': name, 'source': {'type': 'image', 'alias': 'debian/buster',
+                                      'server': 'https://images.linuxcontainers.org',
+                                      'protocol': 'simplestreams'}},
+            wait=True)
+        containers.append(container)
+    return containers
+
+
+class TestIPWaiter:
+    def test_returns_the_ip_of_a_container_as_soon_as_it_is_available(
+            self, fake_lxd_server, lxd_containers):
+        fake_lxd_server.ip_delay = 0.2
+        lxd_containers[0].start(wait=True)
+        start = time.monotonic()
+        assert IPWaiter().wait(lxd_containers[0], 5).startswith('10.')
+        assert time.monotonic() - start < 0.9
+
+    def test_returns_an_empty_string_if_the_container_has_no_ip_after_the_timeout(
+            self, lxd_containers):
+        start = time.monotonic()
+        assert IPWaiter().wait(lxd_containers[0], 0.2) == ''
+        assert 0.2 <= time.monotonic() - start < 0.9
+
+    def test_only_fetches_the_state_of_the_waiting_containers(
+            self, fake_lxd_server, lxd_containers):
+        fake_lxd_server.ip_delay = 0.3
+        client = get_client()
+        for i in range(20):
+            client.containers.create(
+                {'name': 'other{}'.format(i), 'source': {'type': 'none'}}, wait=True)
+        for container in lxd_containers:
+            container.start(wait=True)
+        waiter, ips = IPWaiter(initial_interval=0.1, max_interval=0.1), {}
+        threads = [
+            threading.Thread(target=lambda c=c: ips.update({c.name: waiter.wait(c, 5)}))
+            for c in lxd_containers]
+        with count_api_requests() as stats:
+            [t.start() for t in threads]
+            [t.join() for t in threads]
+        assert sorted(ips) == ['cache', 'db', 'web']
+        assert all(ip.startswith('10.') for ip in ips.values())
+        # The containers of the host are never listed: only the state of the three waiting
+        # containers is fetched, once per poll while they have no IP address.
+        assert all(method == 'GET' and endpoint.endswith('/*/state')
+                   for method, endpoint in stats.counts)
+        assert stats.total <= 3 * 6
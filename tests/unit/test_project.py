@@ -0,0 +1,342 @@
+import threading
+import unittest.mock
+
+import pytest
+
+from lxdock.client import get_client
+from lxdock.constants import ProvisioningMode
+from lxdock.container import Container
+from lxdock.exceptions import ContainerOperationFailed, ProjectError
+from lxdock.network import get_bindings_fingerprint
+from lxdock.project import Project
+from lxdock.provisioners import Provisioner
+from lxdock.test import FakeContainer
+
+
+def get_project(*names, **kwargs):
+    client = unittest.mock.MagicMock()
+    client.api.containers.get.return_value.json.return_value = {'metadata': []}
+    containers = [FakeContainer(name=name, image='alpine/3.11', client=client) for name in names]
+    return Project('project', '/foo', client, containers, [], **kwargs)
+
+
+@unittest.mock.patch.object(Project, '_update_guest_etchosts')
+@unittest.mock.patch.object(Project, 'provision')
+@unittest.mock.patch.object(Container, 'is_running', new_callable=unittest.mock.PropertyMock)
+class TestProjectUp:
+    def test_brings_up_all_the_containers(self, mock_is_running, mock_provision, mock_etchosts):
+        mock_is_running.return_value = False
+        project = get_project('c1', 'c2', 'c3', parallelism=2)
+        with unittest.mock.patch.object(Container, 'up') as mock_up:
+            project.up()
+        assert mock_up.call_count == 3
+        assert mock_provision.call_args[1]['container_names'] == ['c1', 'c2', 'c3']
+
+    def test_reports_failures_after_bringing_up_the_other_containers(
+            self, mock_is_running, mock_provision, mock_etchosts):
+        mock_is_running.return_value = False
+        project = get_project('c1', 'c2', 'c3')
+        brought_up = []
+
+        def up(container):
+            if container.name == 'c2':
+                raise ContainerOperationFailed('cannot start')
+            brought_up.append(container.name)
+
+        with unittest.mock.patch.object(Container, 'up', autospec=True, side_effect=up):
+            with pytest.raises(ProjectError) as excinfo:
+                project.up(parallelism=3)
+        assert sorted(brought_up) == ['c1', 'c3']
+        assert 'c2 (cannot start)' in excinfo.value.msg
+        # Only the containers that were successfully brought up are provisioned.
+        assert mock_provision.call_args[1]['container_names'] == ['c1', 'c3']
+
+
+@unittest.mock.patch.object(Project, '_update_guest_etchosts')
+class TestProjectHaltAndDestroy:
+    def test_stops_all_the_containers_concurrently(self, mock_etchosts):
+        project = get_project('c1', 'c2', 'c3')
+        barrier = threading.Barrier(3, timeout=5)
+        with unittest.mock.patch.object(
+                Container, 'halt', autospec=True,
+                side_effect=lambda c: barrier.wait()) as mock_halt:
+            project.halt()
+        assert mock_halt.call_count == 3
+        assert mock_etchosts.call_count == 1
+
+    def test_destroys_all_the_containers_concurrently(self, mock_etchosts):
+        project = get_project('c1', 'c2', 'c3')
+        barrier = threading.Barrier(3, timeout=5)
+        with unittest.mock.patch.object(
+                Container, 'destroy', autospec=True,
+                side_effect=lambda c: barrier.wait()) as mock_destroy:
+            project.destroy()
+        assert mock_destroy.call_count == 3
+
+    def test_reports_containers_that_could_not_be_stopped(self, mock_etchosts):
+        project = get_project('c1', 'c2')
+
+        def halt(container):
+            if container.name == 'c1':
+                raise ContainerOperationFailed('cannot stop')
+
+        with unittest.mock.patch.object(Container, 'halt', autospec=True, side_effect=halt):
+            with pytest.raises(ProjectError) as excinfo:
+                project.halt()
+        assert 'c1 (cannot stop)' in excinfo.value.msg
+        assert mock_etchosts.call_count == 1
+
+
+class TestProjectDependencies:
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    @unittest.mock.patch.object(Project, 'provision')
+    @unittest.mock.patch.object(Container, 'is_running', new_callable=unittest.mock.PropertyMock)
+    def test_brings_up_containers_after_their_dependencies(
+            self, mock_is_running, mock_provision, mock_etchosts):
+        mock_is_running.return_value = False
+        project = get_project('web', 'db', parallelism=2)
+        project.containers[0].options['depends_on'] = ['db']
+        brought_up = []
+        with unittest.mock.patch.object(
+                Container, 'up', autospec=True, side_effect=lambda c: brought_up.append(c.name)):
+            project.up()
+        assert brought_up == ['db', 'web']
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    @unittest.mock.patch.object(Project, 'provision')
+    @unittest.mock.patch.object(Container, 'is_running', new_callable=unittest.mock.PropertyMock)
+    def test_brings_up_the_dependencies_of_the_specified_containers(
+            self, mock_is_running, mock_provision, mock_etchosts):
+        mock_is_running.return_value = False
+        project = get_project('web', 'app', 'db', 'ci')
+        project.containers[0].options['depends_on'] = ['app']
+        project.containers[1].options['depends_on'] = ['db']
+        brought_up = []
+        with unittest.mock.patch.object(
+                Container, 'up', autospec=True, side_effect=lambda c: brought_up.append(c.name)):
+            project.up(container_names=['web'])
+        assert brought_up == ['db', 'app', 'web']
+        assert mock_provision.call_args[1]['container_names'] == ['web', 'app', 'db']
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    def test_stops_containers_before_their_dependencies(self, mock_etchosts):
+        project = get_project('db', 'web')
+        project.containers[1].options['depends_on'] = ['db']
+        stopped = []
+        with unittest.mock.patch.object(
+                Container, 'halt', autospec=True, side_effect=lambda c: stopped.append(c.name)):
+            project.halt()
+        assert stopped == ['web', 'db']
+
+
+@unittest.mock.patch.object(Project, '_update_guest_etchosts')
+@unittest.mock.patch.object(Project, 'provision')
+@unittest.mock.patch.object(Container, 'is_running', new_callable=unittest.mock.PropertyMock)
+class TestProjectCopies:
+    def get_project(self, *provisioning_commands):
+        project = get_project(*['c{}'.format(i) for i in range(len(provisioning_commands))],
+                              parallelism=4)
+        for container, command in zip(project.containers, provisioning_commands):
+            container.options['provisioning'] = [{'type': 'shell', 'inline': command}]
+        return project
+
+    def test_copies_identical_containers_once_the_first_one_is_provisioned(
+            self, mock_is_running, mock_provision, mock_etchosts):
+        mock_is_running.return_value = False
+        project = self.get_project('echo foo', 'echo foo', 'echo foo', 'echo bar')
+        events = []
+        with unittest.mock.patch.object(
+                Container, 'up', autospec=True,
+                side_effect=lambda c: events.append(('up', c.name))), \
+                unittest.mock.patch.object(
+                    Container, 'provision', autospec=True,
+                    side_effect=lambda c, force: events.append(('provision', c.name))), \
+                unittest.mock.patch.object(
+                    Container, 'create_as_copy', autospec=True,
+                    side_effect=lambda c, s: events.append(('copy', c.name, s.name))):
+            project.up()
+        assert sorted(e for e in events if e[0] == 'copy') == [
+            ('copy', 'c1', 'c0'), ('copy', 'c2', 'c0')]
+        assert events.index(('provision', 'c0')) < events.index(('copy', 'c1', 'c0'))
+        assert ('provision', 'c3') not in events
+
+    def test_does_not_copy_containers_when_provisioning_is_disabled(
+            self, mock_is_running, mock_provision, mock_etchosts):
+        mock_is_running.return_value = False
+        project = self.get_project('echo foo', 'echo foo')
+        with unittest.mock.patch.object(Container, 'up'), \
+                unittest.mock.patch.object(Container, 'create_as_copy') as mock_copy:
+            project.up(provisioning_mode=ProvisioningMode.DISABLED)
+        assert mock_copy.call_count == 0
+
+
+class TestProjectPull:
+    @unittest.mock.patch('lxdock.project.pull_image')
+    def test_pulls_each_distinct_image_once(self, mock_pull_image):
+        mock_pull_image.side_effect = lambda client, source, auto_update: 'fp-' + source['alias']
+        project = get_project('c1', 'c2', 'c3')
+        project.containers[2].options['image'] = 'debian/buster'
+        project.pull()
+        assert sorted(c[0][1]['alias'] for c in mock_pull_image.call_args_list) == [
+            'alpine/3.11', 'debian/buster']
+        assert [c._get_image_source() for c in project.containers] == [
+            {'type': 'image', 'fingerprint': 'fp-alpine/3.11'},
+            {'type': 'image', 'fingerprint': 'fp-alpine/3.11'},
+            {'type': 'image', 'fingerprint': 'fp-debian/buster'}]
+
+    @unittest.mock.patch('lxdock.project.pull_image')
+    def test_reports_the_images_that_could_not_be_pulled(self, mock_pull_image):
+        mock_pull_image.side_effect = ContainerOperationFailed('not found')
+        project = get_project('c1')
+        with pytest.raises(ProjectError) as excinfo:
+            project.pull()
+        assert excinfo.value.msg == (
+            'The following images could not be pulled: '
+            'alpine/3.11 from https://images.linuxcontainers.org (not found)')
+
+    @unittest.mock.patch('lxdock.project.pull_image')
+    def test_reports_images_having_the_same_alias_on_different_remotes_separately(
+            self, mock_pull_image):
+        def pull_image(client, source, auto_update):
+            raise ContainerOperationFailed(source['server'])
+
+        mock_pull_image.side_effect = pull_image
+        project = get_project('c1', 'c2')
+        project.containers[1].options['server'] = 'https://example.com'
+        errors = project._pull_images(project.containers)
+        assert sorted(errors) == [
+            ('https://example.com', 'alpine/3.11'),
+            ('https://images.linuxcontainers.org', 'alpine/3.11')]
+        assert [e.msg for _, e in sorted(errors.items())] == [
+            'https://example.com', 'https://images.linuxcontainers.org']
+
+
+@pytest.fixture
+def counting_provisioner():
+    # Provisioners are registered when their classes are defined: the registry is restored once
+    # the test is done.
+    with unittest.mock.patch.dict(Provisioner.provisioners._plugins):
+        class CountingProvisioner(Provisioner):
+            name = 'counting'
+            schema = {'value': str, }
+            provisioned = []
+
+            def provision_single(self, guest):
+                self.provisioned.append((guest.container.name, self.options['value']))
+
+        yield CountingProvisioner
+
+
+@unittest.mock.patch.object(Container, '_setup_env')
+@unittest.mock.patch.object(Container, 'is_running', new_callable=unittest.mock.PropertyMock)
+@unittest.mock.patch.object(Container, 'exists', new_callable=unittest.mock.PropertyMock)
+class TestProjectProvision:
+    @pytest.fixture(autouse=True)
+    def use_counting_provisioner(self, counting_provisioner):
+        self.counting_provisioner = counting_provisioner
+
+    def get_project(self, global_value):
+        project = get_project('c1', 'c2')
+        project.provisioning_steps = [{'type': 'counting', 'value': global_value}]
+        for container in project.containers:
+            container.options['provisioning'] = [{'type': 'counting', 'value': 'local'}]
+            container.set_lxd_container(container._get_container())
+            container._pylxd_container.config = {}
+        self.counting_provisioner.provisioned = []
+        return project
+
+    def test_only_runs_the_provisioning_steps_that_changed(
+            self, mock_exists, mock_is_running, mock_setup_env):
+        project = self.get_project('v1')
+        project.provision(force=False)
+        assert len(self.counting_provisioner.provisioned) == 4
+        self.counting_provisioner.provisioned = []
+        project.provision(force=False)
+        assert self.counting_provisioner.provisioned == []
+        project.provisioning_steps[0]['value'] = 'v2'
+        project.provision(force=False)
+        assert self.counting_provisioner.provisioned == [('c1', 'v2'), ('c2', 'v2')]
+
+    def test_runs_all_the_provisioning_steps_when_forced(
+            self, mock_exists, mock_is_running, mock_setup_env):
+        project = self.get_project('v1')
+        project.provision(force=False)
+        self.counting_provisioner.provisioned = []
+        project.provision()
+        assert len(self.counting_provisioner.provisioned) == 4
+
+
+class TestProjectState:
+    def test_can_fetch_the_state_of_all_the_containers_using_a_single_request(self):
+        project = get_project('c1', 'c2', 'c3')
+        project.client.host_info = {'api_extensions': ['api_filtering']}
+        project.client.api.containers.get.return_value.json.return_value = {'metadata': [
+            {'name': 'project-c1-123', 'status_code': 103},
+            {'name': 'project-c2-123', 'status_code': 102},
+        ]}
+        project.status()
+        assert project.client.api.containers.get.call_count == 1
+        assert project.client.api.containers.get.call_args[1]['params']['filter'] == \
+            'name eq project-c1-123 or name eq project-c2-123 or name eq project-c3-123'
+        assert project.client.containers.get.call_count == 0
+        statuses = [c.status for c in project.containers]
+        assert statuses == ['running', 'stopped', 'not-created']
+        assert project.client.containers.get.call_count == 0
+
+    def test_only_fetches_the_containers_whose_state_is_unknown_or_outdated(self):
+        # eg. the CLI fetches the state of the containers before asking for a confirmation and
+        # `Project.destroy` must not fetch it again.
+        project = get_project('c1', 'c2')
+        project.client.host_info = {'api_extensions': ['api_filtering']}
+        project.client.api.containers.get.return_value.json.return_value = {'metadata': [
+            {'name': 'project-c1-123', 'status_code': 103},
+        ]}
+        project.refresh_state()
+        project.refresh_state()
+        assert project.client.api.containers.get.call_count == 1
+        project.containers[0]._state_outdated = True
+        project.refresh_state()
+        assert project.client.api.containers.get.call_count == 2
+        assert project.client.api.containers.get.call_args[1]['params']['filter'] == \
+            'name eq project-c1-123'
+
+
+class TestProjectGuestEtcHosts:
+    def create_lxd_container(self, client, name, etchosts, fingerprint=None):
+        config = {'user.lxdock.made': '1'}
+        if fingerprint is not None:
+            config['user.lxdock.etchosts'] = fingerprint
+        client.containers.create(
+            {'name': name, 'config': config,
+             'source': {'type': 'image', 'alias': 'debian/buster',
+                        'server': 'https://images.linuxcontainers.org',
+                        'protocol': 'simplestreams'}},
+            wait=True)
+        lxd_container = client.containers.get(name)
+        lxd_container.start(wait=True)
+        lxd_container.files.put('/etc/hosts', etchosts.encode('utf-8'))
+
+    @unittest.mock.patch('lxdock.project.EtcHosts')
+    def test_only_updates_containers_whose_bindings_changed(self, mock_etchosts, fake_lxd_server):
+        bindings = {'web.local': '10.0.0.2'}
+        mock_etchosts.return_value.lxdock_bindings = bindings
+        fingerprint = get_bindings_fingerprint(bindings)
+        client = get_client()
+        self.create_lxd_container(client, 'uptodate', '', fingerprint=fingerprint)
+        self.create_lxd_container(client, 'outdated', '127.0.0.1 localhost\n')
+        self.create_lxd_container(
+            client, 'unchanged',
+            '# BEGIN LXDock section\n10.0.0.2 web.local\n# END LXDock section\n')
+        fake_lxd_server.requests.clear()
+        Project('project', '/foo', client, [], [])._update_guest_etchosts()
+
+        containers = fake_lxd_server.containers
+        # The file of the up-to-date container is not read and only the file of the outdated
+        # container is written.
+        assert fake_lxd_server.requests['file_get'] == 2
+        assert fake_lxd_server.requests['file_put'] == 1
+        assert containers['outdated']['_files']['/etc/hosts']['content'] == (
+            '127.0.0.1 localhost\n# BEGIN LXDock section\n10.0.0.2 web.local\n'
+            '# END LXDock section\n').encode('utf-8')
+        assert all(c['config']['user.lxdock.etchosts'] == fingerprint
+                   for c in containers.values())
@@ -0,0 +1,59 @@
+import unittest.mock
+
+from lxdock.client import get_client
+from lxdock.container import Container
+from lxdock.network import EtcHosts
+from lxdock.project import Project
+from lxdock.timings import record_timings, timed
+
+
+class TestTimings:
+    def test_records_nothing_if_no_recorder_is_active(self):
+        with timed('start', 'web'):
+            pass
+        with record_timings() as recorder:
+            pass
+        assert recorder.records == []
+
+    def test_records_the_phases_of_containers_and_projects(self):
+        with record_timings() as recorder:
+            with timed('start', 'web'):
+                pass
+            with timed('refresh_state'):
+                pass
+        assert [(r['container'], r['phase']) for r in recorder.records] == [
+            ('web', 'start'), (None, 'refresh_state')]
+        assert all(r['seconds'] >= 0 for r in recorder.records)
+
+    def test_can_format_the_recorded_timings_sorted_by_duration(self):
+        with record_timings() as recorder:
+            recorder.add('web', 'start', 1)
+            recorder.add(None, 'refresh_state', 0.5)
+            recorder.add('web', 'wait_for_ip', 2)
+        lines = recorder.format_table().splitlines()
+        assert lines[0].split() == ['Container', 'Phase', 'Seconds']
+        assert [line.split() for line in lines[1:4]] == [
+            ['web', 'wait_for_ip', '2.000'], ['web', 'start', '1.000'],
+            ['-', 'refresh_state', '0.500']]
+        assert lines[4].startswith('Total')
+        data = recorder.as_dict()
+        assert [r['phase'] for r in data['phases']] == ['wait_for_ip', 'start', 'refresh_state']
+        assert data['total_seconds'] == recorder.total_seconds
+
+    def test_records_the_phases_of_the_up_operation(self, fake_lxd_server, tmpdir):
+        etchosts = tmpdir.join('hosts')
+        etchosts.write('127.0.0.1 localhost\n')
+        client = get_client()
+        container = Container(
+            'project', str(tmpdir), client, name='web', image='debian/buster', mode='pull',
+            provisioning=[{'type': 'shell', 'inline': 'true'}])
+        project = Project('project', str(tmpdir), client, [container], [])
+        with unittest.mock.patch.object(EtcHosts.__init__, '__defaults__', (str(etchosts), )):
+            with record_timings() as recorder:
+                project.up()
+        phases = {(r['container'], r['phase']) for r in recorder.records}
+        assert {
+            ('web', 'create'), ('web', 'start'), ('web', 'wait_for_ip'), ('web', 'setup_users'),
+            ('web', 'setup_env'), ('web', 'provision.local[0]: shell'),
+            (None, 'pull_image: debian/buster'), (None, 'refresh_state'),
+        } <= phases
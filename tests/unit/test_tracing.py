@@ -0,0 +1,61 @@
+import json
+import threading
+
+from lxdock.client import get_client
+from lxdock.timings import timed
+from lxdock.tracing import record_trace, span, traced
+from lxdock.utils import lxd
+
+
+class Item:
+    name = 'web'
+
+    @traced('container', 'name')
+    def up(self):
+        with span('start', 'phase', self.name):
+            pass
+
+
+class TestTracing:
+    def test_records_nothing_if_no_tracer_is_active(self):
+        with span('start', 'phase', 'web'):
+            pass
+        with record_trace() as tracer:
+            pass
+        assert tracer.events == []
+
+    def test_records_nested_spans_as_complete_events(self):
+        with record_trace() as tracer:
+            Item().up()
+        events = tracer.as_dict()['traceEvents']
+        spans = [e for e in events if e['ph'] == 'X']
+        assert [(e['cat'], e['name'], e['args']) for e in spans] == [
+            ('container', 'up', {'container': 'web'}), ('phase', 'start', {'container': 'web'})]
+        outer, inner = spans
+        assert outer['ts'] <= inner['ts']
+        assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+
+    def test_names_the_threads_of_the_spans(self):
+        def run():
+            with timed('start', 'db'):
+                pass
+
+        with record_trace() as tracer:
+            with span('up', 'action'):
+                worker = threading.Thread(target=run, name='worker')
+                worker.start()
+                worker.join()
+        events = tracer.as_dict()['traceEvents']
+        thread_names = {e['tid']: e['args']['name'] for e in events if e['ph'] == 'M'}
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        assert thread_names[spans['start']['tid']] == 'worker'
+        assert thread_names[spans['up']['tid']] == threading.current_thread().name
+
+    def test_records_the_requests_sent_to_lxd(self, fake_lxd_server, tmpdir):
+        client = get_client()
+        with record_trace() as tracer:
+            client.containers.all()
+        tracer.save(str(tmpdir.join('trace.json')))
+        events = json.loads(tmpdir.join('trace.json').read())['traceEvents']
+        assert any(e.get('cat') == 'lxd' and e['args']['method'] == 'GET' for e in events)
+        assert lxd._api_request_hooks == []
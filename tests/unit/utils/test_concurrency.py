@@ -0,0 +1,74 @@
+import threading
+
+from lxdock.exceptions import DependencyFailed
+from lxdock.logging import get_logging_context
+from lxdock.utils.concurrency import format_error, run_concurrently
+
+
+class Item:
+    def __init__(self, name):
+        self.name = name
+
+
+class TestRunConcurrently:
+    def test_processes_all_the_items(self):
+        items = [Item('c{}'.format(i)) for i in range(5)]
+        processed = []
+        results = run_concurrently(lambda item: processed.append(item.name), items, max_workers=3)
+        assert sorted(processed) == ['c0', 'c1', 'c2', 'c3', 'c4']
+        assert list(results.keys()) == items
+        assert all(error is None for error in results.values())
+
+    def test_processes_items_concurrently(self):
+        items = [Item('c1'), Item('c2')]
+        barrier = threading.Barrier(2, timeout=5)
+        results = run_concurrently(lambda item: barrier.wait(), items, max_workers=2)
+        assert all(error is None for error in results.values())
+
+    def test_sets_the_logging_context_of_each_item(self):
+        items = [Item('c1'), Item('c2')]
+        contexts = {}
+
+        def func(item):
+            contexts[item.name] = get_logging_context()
+
+        run_concurrently(func, items, max_workers=2)
+        assert contexts == {'c1': 'c1', 'c2': 'c2'}
+        assert get_logging_context() is None
+
+    def test_a_failure_does_not_interrupt_the_processing_of_other_items(self):
+        items = [Item('c1'), Item('c2'), Item('c3')]
+        processed = []
+
+        def func(item):
+            if item.name == 'c1':
+                raise ValueError('boom')
+            processed.append(item.name)
+
+        results = run_concurrently(func, items)
+        assert processed == ['c2', 'c3']
+        assert isinstance(results[items[0]], ValueError)
+        assert format_error(results[items[0]]) == 'boom'
+        assert results[items[1]] is None
+
+    def test_processes_items_after_their_dependencies(self):
+        db, cache, web = Item('db'), Item('cache'), Item('web')
+        processed = []
+        run_concurrently(
+            lambda item: processed.append(item.name), [web, cache, db], max_workers=3,
+            dependencies={web: [db, cache], cache: [db]})
+        assert processed == ['db', 'cache', 'web']
+
+    def test_does_not_process_items_whose_dependencies_failed(self):
+        db, web, other = Item('db'), Item('web'), Item('other')
+        processed = []
+
+        def func(item):
+            if item is db:
+                raise ValueError('boom')
+            processed.append(item.name)
+
+        results = run_concurrently(func, [web, db, other], dependencies={web: [db]})
+        assert processed == ['other']
+        assert isinstance(results[web], DependencyFailed)
+        assert format_error(results[web]) == 'web depends on db which failed'
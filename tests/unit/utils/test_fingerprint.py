@@ -0,0 +1,35 @@
+from lxdock.utils.fingerprint import fingerprint_data, fingerprint_paths
+
+
+class TestFingerprintData:
+    def test_does_not_depend_on_the_order_of_dictionary_keys(self):
+        assert fingerprint_data({'a': 1, 'b': [1, 2]}) == fingerprint_data({'b': [1, 2], 'a': 1})
+
+    def test_changes_when_the_data_changes(self):
+        assert fingerprint_data({'a': 1}) != fingerprint_data({'a': 2})
+
+
+class TestFingerprintPaths:
+    def test_changes_when_the_contents_of_a_file_change(self, tmpdir):
+        script = tmpdir.join('script.sh')
+        script.write('echo foo')
+        fingerprint = fingerprint_paths([str(script)])
+        assert fingerprint_paths([str(script)]) == fingerprint
+        script.write('echo bar')
+        assert fingerprint_paths([str(script)]) != fingerprint
+
+    def test_changes_when_a_file_is_added_to_a_directory(self, tmpdir):
+        tmpdir.join('site.yml').write('- hosts: all')
+        fingerprint = fingerprint_paths([str(tmpdir)])
+        tmpdir.mkdir('roles').join('main.yml').write('---')
+        assert fingerprint_paths([str(tmpdir)]) != fingerprint
+
+    def test_can_fingerprint_missing_paths(self, tmpdir):
+        missing = str(tmpdir.join('missing.sh'))
+        assert fingerprint_paths([missing]) != fingerprint_paths([])
+
+    def test_does_not_depend_on_the_location_of_the_base_directory(self, tmpdir):
+        for name in ('fp1', 'fp2'):
+            tmpdir.mkdir(name).join('script.sh').write('echo foo')
+        assert fingerprint_paths([str(tmpdir.join('fp1', 'script.sh'))], str(tmpdir.join('fp1'))) \
+            == fingerprint_paths([str(tmpdir.join('fp2', 'script.sh'))], str(tmpdir.join('fp2')))
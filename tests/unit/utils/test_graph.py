@@ -0,0 +1,25 @@
+from lxdock.utils.graph import find_cycle, get_dependencies, reverse_graph
+
+
+def test_find_cycle_returns_none_if_the_graph_is_acyclic():
+    assert find_cycle({'a': ['b', 'c'], 'b': ['c'], 'c': []}) is None
+
+
+def test_find_cycle_returns_the_nodes_of_a_cycle():
+    assert find_cycle({'a': ['b'], 'b': ['c'], 'c': ['a']}) == ['a', 'b', 'c', 'a']
+
+
+def test_find_cycle_detects_self_dependencies():
+    assert find_cycle({'a': ['a']}) == ['a', 'a']
+
+
+def test_get_dependencies_returns_the_direct_and_indirect_dependencies_of_nodes():
+    graph = {'a': ['b'], 'b': ['c'], 'c': [], 'd': ['a'], 'e': []}
+    assert get_dependencies(graph, ['a']) == {'b', 'c'}
+    assert get_dependencies(graph, ['d', 'b']) == {'a', 'b', 'c'}
+    assert get_dependencies(graph, ['e']) == set()
+
+
+def test_reverse_graph_associates_nodes_with_their_dependents():
+    assert reverse_graph({'a': ['b', 'c'], 'b': ['c'], 'c': []}) == {
+        'a': [], 'b': ['a'], 'c': ['a', 'b']}
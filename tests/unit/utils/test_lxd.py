@@ -1,6 +1,10 @@
 from test.support import EnvironmentVarGuard
 
-from lxdock.utils.lxd import get_lxd_dir
+from pylxd.client import _APINode
+
+from lxdock.client import get_client
+from lxdock.utils.lxd import (APIRequestStats, count_api_requests, get_containers,
+                              get_event_container_names, get_lxd_dir, update_container)
 
 
 def test_get_lxd_helper_can_return_the_lxd_base_directory():
@@ -9,3 +13,142 @@ def test_get_lxd_helper_can_return_the_lxd_base_directory():
         assert get_lxd_dir() == '/var/lib/lxd'
         env.set('LXD_DIR', '/my/test/lxd/')
         assert get_lxd_dir() == '/my/test/lxd/'
+
+
+class TestAPIRequestStats:
+    def test_can_normalize_endpoints(self):
+        assert APIRequestStats.get_endpoint('/1.0') == '/1.0'
+        assert APIRequestStats.get_endpoint('/1.0/containers') == '/1.0/containers'
+        assert APIRequestStats.get_endpoint('/1.0/containers/web/state') == \
+            '/1.0/containers/*/state'
+        assert APIRequestStats.get_endpoint('/1.0/operations/1234-abcd/wait') == \
+            '/1.0/operations/*/wait'
+        assert APIRequestStats.get_endpoint('/1.0/images/aliases/debian/buster') == \
+            '/1.0/images/aliases/*/buster'
+
+    def test_can_count_requests_by_endpoint(self):
+        stats = APIRequestStats()
+        stats.add('GET', '/1.0/containers/web', 3)
+        stats.add('GET', '/1.0/containers/db', 30)
+        stats.add('PUT', '/1.0/containers/db/state', 1.5)
+        assert stats.total == 3
+        assert stats.counts[('GET', '/1.0/containers/*')] == 2
+        assert stats.histograms[('GET', '/1.0/containers/*')][2] == 1
+        table = stats.format_table().splitlines()
+        assert table[1].split()[:3] == ['GET', '/1.0/containers/*', '2']
+        assert table[-1].split() == ['Total', '3']
+
+    def test_can_be_used_to_count_the_requests_sent_by_pylxd(self, fake_lxd_server):
+        client = get_client()
+        with count_api_requests() as stats:
+            client.containers.all()
+            client.containers.all()
+        client.containers.all()
+        assert stats.total == 2
+        assert len(stats.counts) == 1
+
+
+def test_get_event_container_names_helper_can_return_the_containers_concerned_by_events():
+    assert get_event_container_names({
+        'type': 'lifecycle',
+        'metadata': {'action': 'container-started', 'source': '/1.0/containers/web'},
+    }) == {'web'}
+    assert get_event_container_names({
+        'type': 'lifecycle',
+        'metadata': {'action': 'instance-snapshot-created',
+                     'source': '/1.0/instances/web/snapshots/snap0'},
+    }) == {'web'}
+    assert get_event_container_names({
+        'type': 'operation',
+        'metadata': {'resources': {'containers': ['/1.0/containers/web', '/1.0/containers/db']}},
+    }) == {'web', 'db'}
+    assert get_event_container_names({
+        'type': 'lifecycle', 'metadata': {'action': 'image-deleted', 'source': '/1.0/images/a'},
+    }) == set()
+    assert get_event_container_names({'type': 'logging', 'metadata': {}}) == set()
+
+
+class TestGetContainers:
+    def create_containers(self, names):
+        client = get_client()
+        for name in names:
+            client.containers.create({'name': name, 'source': {'type': 'none'}}, wait=True)
+
+    def test_filters_the_containers_using_a_single_request(self, fake_lxd_server, monkeypatch):
+        self.create_containers(['web', 'db'] + ['other{}'.format(i) for i in range(20)])
+        client = get_client()
+        responses = []
+        api_get = _APINode.get
+        monkeypatch.setattr(_APINode, 'get', lambda node, *args, **kwargs: responses.append(
+            api_get(node, *args, **kwargs)) or responses[-1])
+        lxd_containers = get_containers(client, names=['web', 'db', 'missing'])
+        assert sorted(lxd_containers) == ['db', 'web']
+        assert lxd_containers['web'].name == 'web'
+        # The containers of the other projects are not transferred.
+        assert len(responses) == 1
+        assert len(responses[0].json()['metadata']) == 2
+
+    def test_fetches_the_containers_one_by_one_if_the_listing_cannot_be_filtered(
+            self, fake_lxd_server):
+        fake_lxd_server.api_extensions.remove('api_filtering')
+        self.create_containers(['web', 'db'] + ['other{}'.format(i) for i in range(20)])
+        client = get_client()
+        with count_api_requests() as stats:
+            lxd_containers = get_containers(client, names=['web', 'db', 'missing'])
+        assert sorted(lxd_containers) == ['db', 'web']
+        # The names of the containers are listed, then the two existing containers are fetched.
+        assert stats.counts == {('GET', '/1.0/containers'): 1, ('GET', '/1.0/containers/*'): 2}
+
+    def test_lists_the_containers_if_they_are_most_of_the_containers_of_the_host(
+            self, fake_lxd_server):
+        fake_lxd_server.api_extensions.remove('api_filtering')
+        self.create_containers(['web', 'db', 'other'])
+        client = get_client()
+        with count_api_requests() as stats:
+            lxd_containers = get_containers(client, names=['web', 'db'])
+        assert sorted(lxd_containers) == ['db', 'web']
+        assert stats.counts == {('GET', '/1.0/containers'): 2}
+
+
+class TestUpdateContainer:
+    def get_lxd_container(self):
+        client = get_client()
+        client.containers.create(
+            {'name': 'web', 'config': {'environment.FOO': 'bar'},
+             'devices': {'share': {'type': 'disk', 'source': '/tmp', 'path': '/tmp'}},
+             'source': {'type': 'image', 'alias': 'debian/buster',
+                        'server': 'https://images.linuxcontainers.org',
+                        'protocol': 'simplestreams'}},
+            wait=True)
+        return client.containers.get('web')
+
+    def test_does_not_send_requests_if_nothing_changed(self, fake_lxd_server):
+        lxd_container = self.get_lxd_container()
+        with count_api_requests() as stats:
+            assert not update_container(
+                lxd_container, config={'environment.FOO': 'bar'},
+                devices={'share': {'type': 'disk', 'source': '/tmp', 'path': '/tmp'}})
+        assert stats.total == 0
+
+    def test_only_sends_the_changes_using_a_single_patch_request(self, fake_lxd_server):
+        lxd_container = self.get_lxd_container()
+        with count_api_requests() as stats:
+            assert update_container(
+                lxd_container, config={'environment.FOO': 'bar', 'environment.BAR': 'baz'},
+                devices={'other': {'type': 'disk', 'source': '/srv', 'path': '/srv'}})
+        # A single PATCH request is sent, along with the requests waiting for its operation.
+        assert [method for method, _ in stats.counts if method != 'GET'] == ['PATCH']
+        assert sum(count for (method, endpoint), count in stats.counts.items()
+                   if not endpoint.startswith('/1.0/operations')) == 1
+        container = fake_lxd_server.containers['web']
+        assert container['config']['environment.BAR'] == 'baz'
+        assert sorted(container['devices']) == ['other', 'share']
+        assert lxd_container.config['environment.BAR'] == 'baz'
+
+    def test_can_remove_config_keys_and_devices(self, fake_lxd_server):
+        lxd_container = self.get_lxd_container()
+        assert update_container(
+            lxd_container, config={'environment.FOO': None}, devices={'share': None})
+        container = fake_lxd_server.containers['web']
+        assert 'environment.FOO' not in container['config']
+        assert 'share' not in container['devices']
@@ -0,0 +1,47 @@
+import unittest.mock
+
+import pytest
+
+from lxdock.utils import plugins
+from lxdock.utils.plugins import PluginRegistry
+
+
+class DummyPlugin:
+    pass
+
+
+class TestPluginRegistry:
+    def test_imports_the_modules_of_builtin_plugins_on_demand(self):
+        registry = PluginRegistry([('dummy', 'lxdock.dummy')], 'lxdock.tests')
+
+        def import_module(name):
+            registry.register('dummy', DummyPlugin)
+
+        with unittest.mock.patch.object(plugins, '_iter_entry_points', return_value=[]):
+            with unittest.mock.patch('importlib.import_module') as mock_import_module:
+                mock_import_module.side_effect = import_module
+                assert list(registry) == ['dummy']
+                assert not mock_import_module.called
+                assert registry['dummy'] is DummyPlugin
+                assert registry['dummy'] is DummyPlugin
+        mock_import_module.assert_called_once_with('lxdock.dummy')
+
+    def test_loads_the_plugins_of_entry_points_on_demand(self):
+        entry_point = unittest.mock.Mock()
+        entry_point.name = 'dummy'
+        entry_point.load.return_value = DummyPlugin
+        registry = PluginRegistry([], 'lxdock.tests')
+        with unittest.mock.patch.object(
+                plugins, '_iter_entry_points', return_value=[entry_point]):
+            assert list(registry) == ['dummy']
+            assert not entry_point.load.called
+            assert registry.get('dummy') is DummyPlugin
+            assert registry.get('unknown') is None
+
+    def test_lists_builtin_plugins_first(self):
+        registry = PluginRegistry([('builtin', 'unused')], 'lxdock.tests')
+        registry.register('other', DummyPlugin)
+        with unittest.mock.patch.object(plugins, '_iter_entry_points', return_value=[]):
+            assert list(registry) == ['builtin', 'other']
+            with pytest.raises(KeyError):
+                registry['missing']